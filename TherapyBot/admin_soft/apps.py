@@ -5,3 +5,15 @@ class AdminSoftDashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'admin_soft'
     icon = 'fa fa-user'
+
+    def ready(self):
+        from django.contrib.auth.models import Group, Permission, User
+        from django.db.models.signals import m2m_changed, post_delete, post_save
+        from .utils import bump_menu_permissions_version
+
+        # Anything that can change what the admin sidebar shows a user invalidates the cached menus
+        for model in (User, Group, Permission):
+            post_save.connect(bump_menu_permissions_version, sender=model, dispatch_uid=f'admin_menu_{model.__name__}_save')
+            post_delete.connect(bump_menu_permissions_version, sender=model, dispatch_uid=f'admin_menu_{model.__name__}_delete')
+        for through in (User.groups.through, User.user_permissions.through, Group.permissions.through):
+            m2m_changed.connect(bump_menu_permissions_version, sender=through, dispatch_uid=f'admin_menu_{through.__name__}')
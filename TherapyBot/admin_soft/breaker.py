@@ -0,0 +1,118 @@
+from collections import deque
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(Exception):
+    """ Raised without calling the model while the breaker is open """
+
+    def __init__(self, retry_after):
+        super().__init__(f"LLM circuit open, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Stops calling a model that is failing or too slow.
+
+    The outcomes of the last ``window`` calls are kept. Once at least
+    ``min_calls`` are recorded and the share of failures reaches
+    ``failure_rate``, or the share of calls slower than ``slow_seconds``
+    reaches ``slow_rate``, the breaker opens and every call fails fast with
+    CircuitOpen for ``open_seconds``. It then lets ``probes`` calls through
+    (half-open): a fast success closes it again, anything else re-opens it.
+    """
+
+    def __init__(self, window=20, min_calls=10, failure_rate=0.5, slow_seconds=15.0, slow_rate=0.5,
+                 open_seconds=30.0, probes=1):
+        self.outcomes = deque(maxlen=window)  # (failed, slow)
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probes_started = deque()  # Start times of probes still out
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        """ Raises CircuitOpen unless a call may go to the model now; returns True for a half-open probe """
+        with self.lock:
+            if self.state == CLOSED:
+                return False
+            now = time.monotonic()
+            if self.state == OPEN:
+                remaining = self.opened_at + self.open_seconds - now
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpen(max(1, int(remaining + 0.5)))
+                self.state = HALF_OPEN
+            # A probe that never reported back (e.g. the caller was rejected by the scheduler) expires
+            while self.probes_started and now - self.probes_started[0] > self.open_seconds:
+                self.probes_started.popleft()
+            if len(self.probes_started) >= self.probes:
+                self.rejected += 1
+                raise CircuitOpen(max(1, int(self.open_seconds / 2)))
+            self.probes_started.append(now)
+            return True
+
+    def cancel(self, probe):
+        """ Hands back a probe that allow() granted but that never reached the model """
+        if probe:
+            with self.lock:
+                if self.probes_started:
+                    self.probes_started.pop()
+
+    def record(self, failed, seconds, probe=False):
+        """ Reports the outcome of a call that allow() let through """
+        slow = seconds >= self.slow_seconds
+        with self.lock:
+            if probe:
+                if self.probes_started:
+                    self.probes_started.popleft()
+                if self.state == HALF_OPEN:
+                    if failed or slow:
+                        self.trip()
+                    else:
+                        self.state = CLOSED
+                        self.outcomes.clear()
+                return
+            if self.state != CLOSED:
+                return  # Started before the breaker opened; only probes decide when it closes
+            self.outcomes.append((failed, slow))
+            if len(self.outcomes) >= self.min_calls:
+                failures = sum(1 for f, _ in self.outcomes if f)
+                slow_calls = sum(1 for _, s in self.outcomes if s)
+                if (failures >= self.failure_rate * len(self.outcomes)
+                        or slow_calls >= self.slow_rate * len(self.outcomes)):
+                    self.trip()
+
+    def trip(self):
+        """ Opens the breaker; called with the lock held """
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.probes_started.clear()
+        self.outcomes.clear()
+        self.times_opened += 1
+
+    def stats(self):
+        with self.lock:
+            calls = len(self.outcomes)
+            return {
+                "state": self.state,
+                "calls": calls,
+                "failure_rate": sum(1 for f, _ in self.outcomes if f) / calls if calls else 0.0,
+                "slow_rate": sum(1 for _, s in self.outcomes if s) / calls if calls else 0.0,
+                "retry_after": max(0, int(self.opened_at + self.open_seconds - time.monotonic() + 0.5))
+                if self.state == OPEN else 0,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
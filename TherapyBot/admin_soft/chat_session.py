@@ -1,17 +1,316 @@
 from datetime import datetime, timedelta
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from asgiref.sync import sync_to_async
+from collections import OrderedDict, deque
+from .session_store import BatchWriter, create_store
+import heapq
+import sys
 import threading
 import logging
+import time
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-class ChatSessionManager:
+
+def build_model_history(chat_history):
+    """ Converts stored chat messages into a history the model can be seeded with """
+    history = []
+    for msg in chat_history:
+        if msg["role"] not in ("user", "model") or not msg["content"]:
+            continue
+        history.append({"role": msg["role"], "parts": [msg["content"]]})
+    return history
+
+
+def estimate_tokens(text):
+    """ Cheap token estimate (~4 characters per token) used for history budgets """
+    return max(1, len(text) // 4)
+
+
+def parse_cursor(cursor):
+    """ Splits a MessageRecord.cursor back into ``(created, id)``; raises ValueError if malformed """
+    created, _, message_id = cursor.partition('_')
+    return float(created), int(message_id)
+
+
+class MessageRecord:
+    """ One stored chat message; supports msg["role"] lookups like the dicts it replaced """
+
+    __slots__ = ('id', 'role', 'content', 'wall_time', 'timestamp', 'created', 'tokens')
+
+    def __init__(self, id, role, content, wall_time=None, created=None):
+        self.id = id
+        self.role = role
+        self.content = content
+        self.wall_time = wall_time or time.time()  # Unix timestamp kept exactly as the stores hold it
+        self.timestamp = datetime.fromtimestamp(self.wall_time)
+        self.created = created or time.monotonic()
+        self.tokens = estimate_tokens(content)
+
+    @classmethod
+    def restore(cls, message):
+        """ Rebuilds a record from a session store dict (wall-clock ``created``) """
+        age = max(0.0, time.time() - message['created'])
+        return cls(
+            message['id'], message['role'], message['content'],
+            wall_time=message['created'],
+            created=time.monotonic() - age,
+        )
+
+    def to_dict(self):
+        return {'id': self.id, 'role': self.role, 'content': self.content, 'created': self.wall_time}
+
+    @property
+    def sort_key(self):
+        """ ``(created, id)``: unique, and the order keyset pagination walks """
+        return (self.wall_time, self.id)
+
+    @property
+    def cursor(self):
+        """ Keyset pagination cursor; repr() keeps the float exact through the round-trip """
+        return f"{self.wall_time!r}_{self.id}"
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __repr__(self):
+        return f"MessageRecord(id={self.id}, role={self.role!r})"
+
+
+class ConversationSummary:
+    """ Rolling summary of a session's older messages, up to and including last_message_id """
+
+    __slots__ = ('last_message_id', 'text', 'tokens', 'messages')
+
+    def __init__(self, last_message_id, text, messages):
+        self.last_message_id = last_message_id
+        self.text = text
+        self.tokens = estimate_tokens(text)
+        self.messages = messages  # Messages folded into the summary so far
+
+
+class SessionWindow:
+    """
+    Sliding window of a session's messages.
+
+    Messages are evicted from the head when they age out or exceed the
+    message/token caps, and readers share one immutable tuple snapshot
+    until the window changes.
+    """
+
+    __slots__ = ('messages', 'tokens', 'snapshot', 'loaded_at')
+
+    def __init__(self):
+        self.messages = deque()
+        self.tokens = 0
+        self.snapshot = ()
+        self.loaded_at = time.monotonic()
+
+    def append(self, record, max_messages=None, max_tokens=None):
+        self.messages.append(record)
+        self.tokens += record.tokens
+        while len(self.messages) > 1 and (
+            (max_messages and len(self.messages) > max_messages)
+            or (max_tokens and self.tokens > max_tokens)
+        ):
+            self.tokens -= self.messages.popleft().tokens
+        self.snapshot = None
+
+    def evict_older_than(self, cutoff):
+        while self.messages and self.messages[0].created < cutoff:
+            self.tokens -= self.messages.popleft().tokens
+            self.snapshot = None
+
+    def get_snapshot(self):
+        if self.snapshot is None:
+            self.snapshot = tuple(self.messages)
+        return self.snapshot
+
+
+class InstrumentedLock:
+    """ threading.Lock that records acquisitions, contention and hold times """
+
     def __init__(self):
-        self.sessions = {}
+        self.lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.total_hold = 0.0
+        self.max_hold = 0.0
+        self.acquired_at = 0.0
+
+    def __enter__(self):
+        if not self.lock.acquire(blocking=False):
+            self.lock.acquire()
+            self.contended += 1  # Updated while holding the lock
+        self.acquisitions += 1
+        self.acquired_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        held = time.perf_counter() - self.acquired_at
+        self.total_hold += held
+        if held > self.max_hold:
+            self.max_hold = held
+        self.lock.release()
+
+    def stats(self):
+        return {
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "total_hold_ms": self.total_hold * 1000,
+            "max_hold_ms": self.max_hold * 1000,
+        }
+
+
+class SessionShard:
+    """ One lock stripe of the session store """
+
+    __slots__ = ('lock', 'sessions', 'last_sentiment_analysis', 'sentiment_data', 'sentiment_state', 'summaries')
+
+    def __init__(self):
+        self.lock = InstrumentedLock()
+        self.sessions = OrderedDict()  # Least recently used first when backed by a store
         self.last_sentiment_analysis = {}
         self.sentiment_data = {}
-        self.lock = threading.Lock()  # Add thread lock for synchronization
+        self.sentiment_state = {}  # Rolling incremental sentiment (see sentiment.SentimentState)
+        self.summaries = {}  # ConversationSummary of messages compacted out of the prompt
+
+
+class SessionReaper:
+    """
+    Single background thread that expires idle sessions.
+
+    Each session has one deadline in ``deadlines``; the heap may hold an older
+    entry for it, which is re-queued with the current deadline when it surfaces.
+    Touching a scheduled session is therefore just a dict write, and the
+    expiry window slides with every message.
+    """
+
+    def __init__(self, on_expire, ttl):
+        self.on_expire = on_expire
+        self.ttl = ttl
+        self.deadlines = {}
+        self.heap = []
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def touch(self, session_id, delay=None):
+        deadline = time.monotonic() + (self.ttl if delay is None else delay)
+        with self.condition:
+            scheduled = session_id in self.deadlines
+            self.deadlines[session_id] = deadline
+            if not scheduled:
+                heapq.heappush(self.heap, (deadline, session_id))
+                if self.heap[0][1] == session_id:
+                    self.condition.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='chat-session-reaper', daemon=True)
+                self.thread.start()
+
+    def cancel(self, session_id):
+        with self.condition:
+            self.deadlines.pop(session_id, None)  # The heap entry is skipped when it surfaces
+
+    def is_scheduled(self, session_id):
+        with self.condition:
+            return session_id in self.deadlines
+
+    def pending(self):
+        with self.condition:
+            return len(self.deadlines)
+
+    def pop_expired(self, now):
+        """ Removes and returns every session whose deadline has passed """
+        expired = []
+        with self.condition:
+            while self.heap and self.heap[0][0] <= now:
+                _, session_id = heapq.heappop(self.heap)
+                deadline = self.deadlines.get(session_id)
+                if deadline is None:
+                    continue  # Cancelled
+                if deadline > now:
+                    heapq.heappush(self.heap, (deadline, session_id))  # Touched since it was queued
+                else:
+                    del self.deadlines[session_id]
+                    expired.append(session_id)
+        return expired
+
+    def run(self):
+        while True:
+            with self.condition:
+                timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+                if timeout is None or timeout > 0:
+                    self.condition.wait(timeout)
+            for session_id in self.pop_expired(time.monotonic()):
+                try:
+                    self.on_expire(session_id)
+                except Exception as e:
+                    logger.error(f"Error expiring session {session_id}: {str(e)}")
+
+
+class ChatSessionManager:
+    # Anonymous user data is deleted after 15 minutes without a new message
+    anonymous_session_ttl = 15 * 60
+    # Messages older than 30 minutes drop out of the history window
+    message_window = 30 * 60
+
+    def __init__(self, max_messages=None, max_tokens=None, shards=None, store=None):
+        # Optional caps bound memory per session however chatty a user is
+        self.max_messages = max_messages or getattr(settings, 'CHAT_HISTORY_MAX_MESSAGES', None)
+        self.max_tokens = max_tokens or getattr(settings, 'CHAT_HISTORY_MAX_TOKENS', None)
+        self.id_lock = threading.Lock()
+        self.last_message_id = 0
+        # Sessions are striped over shards so requests for different users don't share a lock
+        shard_count = shards or getattr(settings, 'CHAT_SESSION_SHARDS', 16)
+        self.shards = [SessionShard() for _ in range(shard_count)]
+        self.reaper = SessionReaper(self.expire_session, self.anonymous_session_ttl)
+
+        # With a shared store the shard windows become a per-worker read-through LRU cache
+        self.store = store if store is not None else create_store()
+        self.writer = None
+        if self.store is not None:
+            self.writer = BatchWriter(
+                self.store,
+                max_batch=getattr(settings, 'CHAT_SESSION_WRITE_BATCH', 100),
+                interval=getattr(settings, 'CHAT_SESSION_WRITE_INTERVAL', 0.05),
+            )
+        self.cache_ttl = getattr(settings, 'CHAT_SESSION_CACHE_TTL', 1.0)
+        self.cache_per_shard = max(1, getattr(settings, 'CHAT_SESSION_CACHE_SIZE', 10000) // shard_count)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Callables notified with (session_id, role) after every add_message
+        self.listeners = []
+        # Callables notified with session_id after a session is deleted
+        self.delete_listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def add_delete_listener(self, listener):
+        self.delete_listeners.append(listener)
+
+    def shard_for(self, session_id):
+        return self.shards[hash(session_id) % len(self.shards)]
+
+    def next_message_id(self):
+        # Microsecond-based ids stay ordered and practically unique across worker processes
+        with self.id_lock:
+            self.last_message_id = max(self.last_message_id + 1, time.time_ns() // 1000)
+            return self.last_message_id
+
+    def load_window(self, session_id):
+        """ Reads a session's current window from the store """
+        self.writer.flush()  # Make this worker's buffered appends visible first
+        window = SessionWindow()
+        messages = self.store.load(session_id, since=time.time() - self.message_window, limit=self.max_messages)
+        for message in messages:
+            window.append(MessageRecord.restore(message), self.max_messages, self.max_tokens)
+        return window
 
     def get_or_create_session_id(self, request):
         try:
@@ -21,80 +320,253 @@ class ChatSessionManager:
                 session_id = request.session.get('anonymous_session_id')
                 if not session_id:
                     session_id = f"anon_{datetime.now().timestamp()}"
+                    # SessionMiddleware saves the modified session when the response goes out
                     request.session['anonymous_session_id'] = session_id
-                    # Save session to ensure it's properly stored
-                    request.session.save()
                 return session_id
         except Exception as e:
             logger.error(f"Error in get_or_create_session_id: {str(e)}")
             # Fallback to a temporary session ID if there's an error
             return f"temp_{datetime.now().timestamp()}"
 
+    async def aget_or_create_session_id(self, request):
+        # request.user and request.session hit the database, so they must run off the event loop
+        return await sync_to_async(self.get_or_create_session_id)(request)
+
     def get_chat_history(self, session_id):
-        with self.lock:  # Use lock for thread safety
-            if session_id not in self.sessions:
-                self.sessions[session_id] = []
-            return self.sessions[session_id].copy()  # Return a copy to prevent concurrent modification
+        """ Returns an immutable snapshot (tuple of MessageRecord) of the session's window """
+        shard = self.shard_for(session_id)
+        with shard.lock:  # Use lock for thread safety
+            window = shard.sessions.get(session_id)
+            if window is not None and (self.store is None or time.monotonic() - window.loaded_at < self.cache_ttl):
+                self.cache_hits += 1
+                shard.sessions.move_to_end(session_id)
+                window.evict_older_than(time.monotonic() - self.message_window)
+                return window.get_snapshot()
+            is_new = window is None
+            if self.store is None:
+                window = shard.sessions[session_id] = SessionWindow()
+
+        if is_new and session_id.startswith("anon_"):
+            self.schedule_anonymous_data_deletion(session_id)
+        if self.store is None:
+            return window.get_snapshot()
+
+        # Cache miss or stale entry: read through to the shared store outside the lock
+        window = self.load_window(session_id)
+        with shard.lock:  # Use lock for thread safety
+            self.cache_misses += 1
+            shard.sessions[session_id] = window
+            shard.sessions.move_to_end(session_id)
+            while len(shard.sessions) > self.cache_per_shard:
+                shard.sessions.popitem(last=False)
+            return window.get_snapshot()
 
     def add_message(self, session_id, role, content):
-        with self.lock:  # Use lock for thread safety
+        record = MessageRecord(self.next_message_id(), role, content)
+        shard = self.shard_for(session_id)
+        with shard.lock:  # Use lock for thread safety
             try:
-                if session_id not in self.sessions:
-                    self.sessions[session_id] = []
-                
-                self.sessions[session_id].append({
-                    "role": role,
-                    "content": content,
-                    "timestamp": datetime.now()
-                })
-                
-                # Remove messages older than 30 minutes (increased from 10)
-                self.sessions[session_id] = [
-                    msg for msg in self.sessions[session_id]
-                    if datetime.now() - msg["timestamp"] < timedelta(minutes=30)
-                ]
-
-                # Delete anonymous user data after 15 minutes (increased from 5 seconds)
-                if session_id.startswith("anon_"):
-                    self.schedule_anonymous_data_deletion(session_id)
+                window = shard.sessions.get(session_id)
+                if window is None and self.store is None:
+                    window = shard.sessions[session_id] = SessionWindow()
+
+                # With a store, only an already cached window is updated (write-through)
+                if window is not None:
+                    window.append(record, self.max_messages, self.max_tokens)
+                    window.evict_older_than(record.created - self.message_window)
             except Exception as e:
                 logger.error(f"Error in add_message: {str(e)}")
 
+        if self.writer is not None:
+            self.writer.add(session_id, record.to_dict())
+
+        # Delete anonymous user data after 15 minutes (increased from 5 seconds)
+        if session_id.startswith("anon_"):
+            self.schedule_anonymous_data_deletion(session_id)
+
+        for listener in self.listeners:
+            try:
+                listener(session_id, role)
+            except Exception as e:
+                logger.error(f"Error in add_message listener: {str(e)}")
+
+    def get_history_page(self, session_id, before=None, limit=20):
+        """
+        Returns ``(messages, next_cursor)``: the ``limit`` newest messages that sort
+        before the ``before`` cursor (a parse_cursor tuple), oldest first.
+        ``next_cursor`` is None once there is nothing older to load.
+        """
+        if self.store is not None:
+            self.writer.flush()
+            messages = [MessageRecord.restore(msg) for msg in self.store.page(session_id, before, limit + 1)]
+        else:
+            messages = list(self.get_chat_history(session_id))
+            if before is not None:
+                messages = [msg for msg in messages if msg.sort_key < before]
+            messages = messages[-(limit + 1):]
+
+        has_more = len(messages) > limit
+        messages = messages[-limit:] if limit else []
+        next_cursor = messages[0].cursor if has_more and messages else None
+        return messages, next_cursor
+
+    # Without a store, shard locks only guard in-memory bookkeeping and are never held across I/O,
+    # so async callers take them directly. A store reads through (and flushes) over the network or
+    # the ORM, which must run off the event loop.
+    async def aget_chat_history(self, session_id):
+        if self.store is not None:
+            return await sync_to_async(self.get_chat_history)(session_id)
+        return self.get_chat_history(session_id)
+
+    async def aadd_message(self, session_id, role, content):
+        if self.store is not None:
+            await sync_to_async(self.add_message)(session_id, role, content)
+        else:
+            self.add_message(session_id, role, content)
+
     def schedule_anonymous_data_deletion(self, session_id):
         try:
-            # Timeout set to 15 minutes
-            timer = threading.Timer(15 * 60, self.delete_session, args=[session_id])
-            timer.daemon = True  # Make thread daemon so it doesn't block app shutdown
-            timer.start()
+            # Slides the session's expiry forward; one reaper thread serves every session
+            self.reaper.touch(session_id)
         except Exception as e:
             logger.error(f"Error scheduling deletion for session {session_id}: {str(e)}")
 
+    def expire_session(self, session_id):
+        # A message may have arrived between the reaper popping the session and this call
+        if self.reaper.is_scheduled(session_id):
+            return
+        if self.store is not None:
+            # Another worker may have served the session more recently than this one
+            try:
+                last_activity = self.store.last_activity(session_id)
+            except Exception as e:
+                logger.error(f"Error reading last activity for session {session_id}: {str(e)}")
+                last_activity = None
+            if last_activity is not None:
+                remaining = last_activity + self.anonymous_session_ttl - time.time()
+                if remaining > 0:
+                    self.reaper.touch(session_id, delay=remaining)
+                    return
+        self.delete_session(session_id)
+
     def delete_session(self, session_id):
-        with self.lock:  # Use lock for thread safety
+        self.reaper.cancel(session_id)
+        if self.store is not None:
+            self.writer.discard(session_id)
             try:
-                self.sessions.pop(session_id, None)
-                self.last_sentiment_analysis.pop(session_id, None)
-                self.sentiment_data.pop(session_id, None)
+                self.store.delete(session_id)
+            except Exception as e:
+                logger.error(f"Error deleting session {session_id} from {self.store.name} store: {str(e)}")
+        shard = self.shard_for(session_id)
+        with shard.lock:  # Use lock for thread safety
+            try:
+                shard.sessions.pop(session_id, None)
+                shard.last_sentiment_analysis.pop(session_id, None)
+                shard.sentiment_data.pop(session_id, None)
+                shard.sentiment_state.pop(session_id, None)
+                shard.summaries.pop(session_id, None)
                 logger.info(f"Session {session_id} deleted successfully")
             except Exception as e:
                 logger.error(f"Error deleting session {session_id}: {str(e)}")
 
+        for listener in self.delete_listeners:
+            try:
+                listener(session_id)
+            except Exception as e:
+                logger.error(f"Error in delete_session listener: {str(e)}")
+
+    def get_session_ids(self):
+        """ Ids of the sessions this worker currently holds a window for """
+        session_ids = []
+        for shard in self.shards:
+            with shard.lock:  # Use lock for thread safety
+                session_ids.extend(shard.sessions)
+        return session_ids
+
+    def get_metrics(self):
+        """ Live session and pending expiry counts for monitoring """
+        metrics = {
+            "live_sessions": sum(len(shard.sessions) for shard in self.shards),
+            "pending_expiries": self.reaper.pending(),
+            "summaries": sum(len(shard.summaries) for shard in self.shards),
+        }
+        if self.store is not None:
+            metrics.update({
+                "store": self.store.name,
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "pending_writes": self.writer.pending_count,
+                "flushed_writes": self.writer.flushed,
+                "dropped_writes": self.writer.dropped,
+            })
+        return metrics
+
+    def get_memory_footprint(self):
+        """ Approximate bytes held by the in-memory windows (records and their text) """
+        messages = 0
+        size = 0
+        for shard in self.shards:
+            with shard.lock:  # Use lock for thread safety
+                for window in shard.sessions.values():
+                    messages += len(window.messages)
+                    size += sys.getsizeof(window) + sys.getsizeof(window.messages)
+                    size += sum(sys.getsizeof(record) + sys.getsizeof(record.content) for record in window.messages)
+        return {"messages": messages, "bytes": size}
+
+    def get_lock_stats(self):
+        """ Lock hold-time instrumentation summed over all shards """
+        stats = [shard.lock.stats() for shard in self.shards]
+        return {
+            "shards": len(stats),
+            "acquisitions": sum(s["acquisitions"] for s in stats),
+            "contended": sum(s["contended"] for s in stats),
+            "total_hold_ms": sum(s["total_hold_ms"] for s in stats),
+            "max_hold_ms": max(s["max_hold_ms"] for s in stats),
+        }
+
     def should_perform_sentiment_analysis(self, session_id):
-        with self.lock:  # Use lock for thread safety
-            if session_id not in self.last_sentiment_analysis:
+        shard = self.shard_for(session_id)
+        with shard.lock:  # Use lock for thread safety
+            if session_id not in shard.last_sentiment_analysis:
                 return True
-            
-            time_since_last_analysis = datetime.now() - self.last_sentiment_analysis[session_id]
+
+            time_since_last_analysis = datetime.now() - shard.last_sentiment_analysis[session_id]
             return time_since_last_analysis >= timedelta(minutes=2)
 
     def update_last_sentiment_analysis(self, session_id):
-        with self.lock:  # Use lock for thread safety
-            self.last_sentiment_analysis[session_id] = datetime.now()
+        shard = self.shard_for(session_id)
+        with shard.lock:  # Use lock for thread safety
+            shard.last_sentiment_analysis[session_id] = datetime.now()
 
     def update_sentiment_data(self, session_id, sentiment_data):
-        with self.lock:  # Use lock for thread safety
-            self.sentiment_data[session_id] = sentiment_data
+        shard = self.shard_for(session_id)
+        with shard.lock:  # Use lock for thread safety
+            shard.sentiment_data[session_id] = sentiment_data
 
     def get_sentiment_data(self, session_id):
-        with self.lock:  # Use lock for thread safety
-            return self.sentiment_data.get(session_id)
\ No newline at end of file
+        shard = self.shard_for(session_id)
+        with shard.lock:  # Use lock for thread safety
+            return shard.sentiment_data.get(session_id)
+
+    def update_sentiment_state(self, session_id, sentiment_state):
+        shard = self.shard_for(session_id)
+        with shard.lock:  # Use lock for thread safety
+            shard.sentiment_state[session_id] = sentiment_state
+
+    def get_sentiment_state(self, session_id):
+        shard = self.shard_for(session_id)
+        with shard.lock:  # Use lock for thread safety
+            return shard.sentiment_state.get(session_id)
+
+    def update_summary(self, session_id, summary):
+        """ Stores summary unless a summary covering newer messages is already there """
+        shard = self.shard_for(session_id)
+        with shard.lock:  # Use lock for thread safety
+            current = shard.summaries.get(session_id)
+            if current is None or current.last_message_id < summary.last_message_id:
+                shard.summaries[session_id] = summary
+
+    def get_summary(self, session_id):
+        shard = self.shard_for(session_id)
+        with shard.lock:  # Use lock for thread safety
+            return shard.summaries.get(session_id)
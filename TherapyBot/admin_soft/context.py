@@ -0,0 +1,141 @@
+from django.conf import settings
+from .chat_session import ConversationSummary, build_model_history, estimate_tokens
+from .llm import get_backend, get_executor
+import logging
+import threading
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain the running summary of a therapy conversation so it can stand in for the older messages."
+    " Given the previous summary and the messages that followed it, write an updated summary in at most 150 words."
+    " Keep what the user shared about their situation, feelings, goals and any risk, and the approaches already tried."
+    " Write plain prose, without headings or quotes."
+)
+
+SUMMARY_GENERATION_CONFIG = {
+    "temperature": 0.2,
+    "max_output_tokens": 300,
+}
+
+
+class ContextCompactor:
+    """
+    Builds the model history for a chat turn within a token budget.
+
+    The last ``keep_turns`` turns are sent verbatim. Older messages are folded
+    into a rolling ConversationSummary stored in the ChatSessionManager, which
+    is recomputed in the background once ``summary_batch`` older messages are
+    not yet covered by it; until then those messages are sent verbatim as far
+    as the budget allows.
+    """
+
+    def __init__(self, manager, keep_turns=6, token_budget=4000, summary_batch=6):
+        self.manager = manager
+        self.keep_messages = keep_turns * 2  # A turn is a user message and the model's reply
+        self.token_budget = token_budget
+        self.summary_batch = summary_batch
+        self.summarizing = set()
+        self.lock = threading.Lock()
+        self.builds = 0
+        self.compacted = 0
+        self.full_tokens = 0
+        self.prompt_tokens = 0
+        self.summaries = 0
+        self.summary_errors = 0
+
+    def build(self, session_id, chat_history):
+        """ Model history for chat_history: summary first, then as many recent messages as fit the budget """
+        messages = [msg for msg in chat_history if msg["role"] in ("user", "model") and msg["content"]]
+        full_tokens = sum(estimate_tokens(msg["content"]) for msg in messages)
+        older = messages[:-self.keep_messages] if len(messages) > self.keep_messages else []
+        summary = self.manager.get_summary(session_id) if older else None
+
+        covered = summary.last_message_id if summary is not None else 0
+        unsummarized = [msg for msg in older if msg["id"] > covered]
+        if len(unsummarized) >= self.summary_batch:
+            self.schedule_summary(session_id, summary, unsummarized)
+
+        # Verbatim candidates: older messages the summary does not cover yet, then the recent turns
+        candidates = unsummarized + messages[len(older):]
+        remaining = self.token_budget - (summary.tokens if summary is not None else 0)
+        kept = []
+        for msg in reversed(candidates):
+            tokens = estimate_tokens(msg["content"])
+            if kept and tokens > remaining:
+                break
+            kept.append(msg)
+            remaining -= tokens
+        kept.reverse()
+
+        history = []
+        if summary is not None:
+            history.append({"role": "user", "parts": [f"Summary of our conversation so far: {summary.text}"]})
+            history.append({"role": "model", "parts": ["Thank you, I have that context."]})
+        history.extend(build_model_history(kept))
+
+        prompt_tokens = sum(estimate_tokens(msg["content"]) for msg in kept)
+        prompt_tokens += summary.tokens if summary is not None else 0
+        with self.lock:
+            self.builds += 1
+            self.full_tokens += full_tokens
+            self.prompt_tokens += prompt_tokens
+            if len(kept) < len(messages):
+                self.compacted += 1
+        return history
+
+    def schedule_summary(self, session_id, summary, messages):
+        """ Folds messages into summary on the LLM pool; at most one summary per session is in flight """
+        with self.lock:
+            if session_id in self.summarizing:
+                return
+            self.summarizing.add(session_id)
+        get_executor().submit(self.summarize, session_id, summary, list(messages))
+
+    def summarize(self, session_id, summary, messages):
+        try:
+            llm_backend = get_backend()
+            if llm_backend is None:
+                return
+            transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+            prompt = (
+                f"Previous summary: {summary.text if summary is not None else 'none'}\n\n"
+                f"Messages that followed:\n{transcript}"
+            )
+            text = llm_backend.generate(
+                prompt, system_instruction=SUMMARY_SYSTEM_PROMPT, generation_config=SUMMARY_GENERATION_CONFIG
+            ).strip()
+            if text:
+                folded = (summary.messages if summary is not None else 0) + len(messages)
+                self.manager.update_summary(session_id, ConversationSummary(messages[-1]["id"], text, folded))
+                with self.lock:
+                    self.summaries += 1
+        except Exception as e:
+            logger.error(f"Error summarizing session {session_id}: {str(e)}")
+            with self.lock:
+                self.summary_errors += 1
+        finally:
+            with self.lock:
+                self.summarizing.discard(session_id)
+
+    def stats(self):
+        """ Prompt-size reduction and summary counters for monitoring """
+        with self.lock:
+            return {
+                "builds": self.builds,
+                "compacted": self.compacted,
+                "full_tokens": self.full_tokens,
+                "prompt_tokens": self.prompt_tokens,
+                "reduction": 1 - self.prompt_tokens / self.full_tokens if self.full_tokens else 0.0,
+                "summaries": self.summaries,
+                "summary_errors": self.summary_errors,
+                "summaries_in_flight": len(self.summarizing),
+            }
+
+
+def build_context(compactor, session_id, chat_history):
+    """ Compacted model history when settings.CHAT_CONTEXT_COMPACTION is on, the full window otherwise """
+    if not getattr(settings, 'CHAT_CONTEXT_COMPACTION', True):
+        return build_model_history(chat_history)
+    return compactor.build(session_id, chat_history)
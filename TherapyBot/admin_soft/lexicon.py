@@ -0,0 +1,177 @@
+from collections import namedtuple
+import numpy as np
+import re
+import threading
+
+# Keyword weights per sentiment category (the categories of SENTIMENT_SYSTEM_PROMPT).
+# Phrases of up to three words are matched as well as single words.
+LEXICON = {
+    "happiness": {
+        "happy": 2, "glad": 2, "great": 1, "good": 1, "wonderful": 2, "excited": 2, "joy": 2, "joyful": 2,
+        "cheerful": 2, "better": 1, "amazing": 2, "fantastic": 2, "love": 1, "loving": 1, "enjoy": 1,
+        "enjoyed": 1, "fun": 1, "relieved": 1, "proud": 1, "content": 1, "smile": 1, "laughing": 1,
+        "feel good": 2, "feeling great": 2, "so happy": 2,
+    },
+    "admiration": {
+        "admire": 2, "admiration": 2, "inspiring": 2, "inspired": 2, "respect": 1, "grateful": 2,
+        "thankful": 2, "appreciate": 2, "amazed": 1, "role model": 2, "look up to": 2, "impressive": 1,
+    },
+    "sadness": {
+        "sad": 2, "unhappy": 2, "cry": 2, "crying": 2, "cried": 2, "tears": 2, "lonely": 2, "alone": 1,
+        "miss": 1, "grief": 2, "grieving": 2, "heartbroken": 2, "loss": 1, "lost": 1, "down": 1, "upset": 1,
+        "disappointed": 1, "hurt": 1, "broke up": 2, "passed away": 2,
+    },
+    "anger": {
+        "angry": 2, "mad": 2, "furious": 2, "rage": 2, "hate": 2, "annoyed": 1, "irritated": 1,
+        "frustrated": 1, "frustrating": 1, "pissed": 2, "resent": 2, "yelled": 1, "yelling": 1, "unfair": 1,
+        "fed up": 2, "sick of": 1,
+    },
+    "fear": {
+        "afraid": 2, "scared": 2, "fear": 2, "frightened": 2, "terrified": 2, "terrifying": 2, "nightmare": 1,
+        "nightmares": 1, "danger": 1, "unsafe": 2, "threatened": 2, "phobia": 2, "dread": 1,
+    },
+    "disgust": {
+        "disgusted": 2, "disgusting": 2, "gross": 2, "revolting": 2, "repulsed": 2, "sickening": 2,
+        "nauseous": 1, "vile": 2, "ashamed": 1,
+    },
+    "anxiety": {
+        "anxious": 2, "anxiety": 2, "worried": 2, "worry": 2, "worrying": 2, "nervous": 2, "panic": 2,
+        "panicking": 2, "uneasy": 1, "restless": 1, "overthinking": 2, "racing thoughts": 2,
+        "panic attack": 2, "on edge": 2, "what if": 1, "cant relax": 1,
+    },
+    "depression": {
+        "depressed": 2, "depression": 2, "hopeless": 2, "empty": 2, "numb": 2, "worthless": 2, "pointless": 1,
+        "exhausted": 1, "tired": 1, "unmotivated": 2, "no energy": 2, "cant get out of": 1, "no point": 1,
+        "nothing matters": 2, "dont care": 1, "stay in bed": 2, "given up": 2,
+    },
+    "stress": {
+        "stress": 2, "stressed": 2, "stressful": 2, "overwhelmed": 2, "pressure": 2, "deadline": 1,
+        "deadlines": 1, "workload": 1, "burnout": 2, "burned out": 2, "too much": 1, "exams": 1, "exam": 1,
+        "busy": 1, "cant cope": 2, "behind on": 1,
+    },
+    "suicidal": {
+        "suicide": 3, "suicidal": 3, "kill myself": 3, "end my life": 3, "want to die": 3,
+        "better off dead": 3, "no reason to live": 3, "end it all": 3, "self harm": 3, "hurt myself": 3,
+    },
+    "bipolar": {
+        "bipolar": 3, "manic": 2, "mania": 2, "mood swings": 2, "highs and lows": 2,
+    },
+    "personality disorder": {
+        "personality disorder": 3, "borderline": 2, "bpd": 2, "fear of abandonment": 2,
+    },
+}
+
+# Always sent to the LLM, however confident the lexicon is
+HIGH_RISK_TERMS = (
+    "suicide", "suicidal", "kill myself", "end my life", "want to die", "better off dead", "no reason to live",
+    "end it all", "self harm", "hurt myself", "cut myself", "overdose", "not wake up",
+)
+
+# Categories the lexicon is never trusted to assign on its own
+ESCALATE_CATEGORIES = ("suicidal", "bipolar", "personality disorder")
+
+NEGATIONS = {"not", "no", "never", "dont", "isnt", "wasnt", "arent", "cant", "wont", "without", "hardly"}
+
+WORD_RE = re.compile(r"[a-z]+")
+
+PreScore = namedtuple('PreScore', ['sentiment', 'intensity', 'confidence', 'escalate'])
+
+
+class LexiconScorer:
+    """
+    Fast in-process sentiment pre-scorer.
+
+    Words and phrases of a text are counted against a (terms x categories)
+    weight matrix; the winning category's share of the evidence and the amount
+    of evidence give a confidence. Results below ``min_confidence``, in the
+    clinical categories, or containing a high-risk term are marked for
+    escalation to the LLM. Texts of at least ``neutral_words`` words with no
+    emotional terms at all are scored Neutral.
+    """
+
+    def __init__(self, lexicon=LEXICON, high_risk_terms=HIGH_RISK_TERMS, min_confidence=0.7, neutral_words=12):
+        self.categories = list(lexicon)
+        self.min_confidence = min_confidence
+        self.neutral_words = neutral_words
+        self.vocabulary = {}
+        for category in lexicon.values():
+            for term in category:
+                self.vocabulary.setdefault(term, len(self.vocabulary))
+        for term in high_risk_terms:
+            self.vocabulary.setdefault(term, len(self.vocabulary))
+
+        self.weights = np.zeros((len(self.vocabulary), len(self.categories)))
+        for column, category in enumerate(self.categories):
+            for term, weight in lexicon[category].items():
+                self.weights[self.vocabulary[term], column] = weight
+        self.high_risk = np.zeros(len(self.vocabulary), dtype=bool)
+        self.high_risk[[self.vocabulary[term] for term in high_risk_terms]] = True
+        self.escalate_columns = np.array([category in ESCALATE_CATEGORIES for category in self.categories])
+
+        self.lock = threading.Lock()
+        self.scored = 0
+        self.escalated = 0
+
+    def term_indices(self, text):
+        """ (vocabulary indices of matched terms, word count); negated words are skipped """
+        words = WORD_RE.findall(text.lower().replace("'", ""))
+        indices = []
+        for i in range(len(words)):
+            for size in (3, 2, 1):
+                index = self.vocabulary.get(" ".join(words[i:i + size])) if i + size <= len(words) else None
+                if index is None:
+                    continue
+                negated = size == 1 and any(word in NEGATIONS for word in words[max(0, i - 2):i])
+                if not negated or self.high_risk[index]:
+                    indices.append(index)
+                break
+        return indices, len(words)
+
+    def score_many(self, texts):
+        """ PreScore for every text; the counting and scoring run as one matrix product """
+        counts = np.zeros((len(texts), len(self.vocabulary)))
+        word_counts = np.zeros(len(texts))
+        for row, text in enumerate(texts):
+            indices, word_counts[row] = self.term_indices(text)
+            np.add.at(counts[row], indices, 1)
+
+        scores = counts @ self.weights  # texts x categories
+        totals = scores.sum(axis=1)
+        top = scores.argmax(axis=1)
+        top_scores = scores[np.arange(len(texts)), top]
+        share = np.divide(top_scores, totals, out=np.zeros(len(texts)), where=totals > 0)
+        confidence = share * (1 - np.exp(-top_scores / 3))
+        intensity = np.clip(np.round(35 + 65 * (1 - np.exp(-top_scores / 4))), 0, 100).astype(int)
+        high_risk = (counts[:, self.high_risk] > 0).any(axis=1)
+
+        # No emotional terms in a long enough text is itself a confident (neutral) answer
+        neutral = (totals == 0) & (word_counts >= self.neutral_words)
+        confidence = np.where(neutral, 1 - np.exp(-word_counts / self.neutral_words), confidence)
+
+        escalate = high_risk | (confidence < self.min_confidence) | (self.escalate_columns[top] & (totals > 0))
+        results = []
+        for row in range(len(texts)):
+            if neutral[row]:
+                sentiment = "Neutral"
+            elif totals[row] == 0:
+                sentiment = "Unknown"  # Too short to tell; always escalated
+            else:
+                sentiment = self.categories[top[row]].capitalize()
+            level = 50 if neutral[row] else int(intensity[row])
+            results.append(PreScore(sentiment, level, float(confidence[row]), bool(escalate[row])))
+
+        with self.lock:
+            self.scored += len(texts)
+            self.escalated += int(escalate.sum())
+        return results
+
+    def score(self, text):
+        return self.score_many([text])[0]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "scored": self.scored,
+                "escalated": self.escalated,
+                "answered_locally": self.scored - self.escalated,
+            }
@@ -0,0 +1,398 @@
+from django.conf import settings
+from concurrent.futures import ThreadPoolExecutor
+from .breaker import CircuitBreaker
+from .scheduler import LLMScheduler, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, ScheduledStream
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+THERAPIST_SYSTEM_PROMPT = (
+    "You are a professional AI therapist providing compassionate, evidence-based, and non-judgmental support. "
+    "Use reflective listening, validation, and open-ended questions. Encourage self-reflection instead of direct advice. "
+    "If a user expresses distress, offer grounding techniques and recommend professional help."
+)
+
+GENERATION_CONFIG = {
+    "temperature": 0.9,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 1000,
+}
+
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    }
+]
+
+
+class ModelRegistry:
+    """
+    Builds each (model name, system prompt, generation config) combination once.
+
+    GenerativeModel objects are cheap to share: they hold no per-request state
+    and all of them go through the google.generativeai client, which keeps its
+    HTTP connection pool, so reusing them skips construction on every call.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.models = {}
+        self.lock = threading.Lock()
+        self.builds = 0
+        self.hits = 0
+
+    @staticmethod
+    def key(model_name, system_instruction=None, generation_config=None):
+        config = json.dumps(generation_config, sort_keys=True, default=str) if generation_config else None
+        return model_name, system_instruction, config
+
+    def get(self, model_name, system_instruction=None, generation_config=None):
+        key = self.key(model_name, system_instruction, generation_config)
+        model = self.models.get(key)
+        if model is not None:
+            self.hits += 1
+            return model
+        with self.lock:  # Use lock for thread safety
+            model = self.models.get(key)
+            if model is None:
+                model = self.factory(model_name, system_instruction, generation_config)
+                self.models[key] = model
+                self.builds += 1
+            return model
+
+    def stats(self):
+        return {"models": len(self.models), "builds": self.builds, "hits": self.hits}
+
+
+class LLMBackend:
+    """ Interface every model provider implements """
+
+    name = 'base'
+
+    def generate(self, prompt, system_instruction=None, generation_config=None):
+        """ Returns the text of a single completion for prompt """
+        raise NotImplementedError
+
+    def chat(self, history, message):
+        """ Returns the reply to message given a pre-seeded history (see build_model_history) """
+        raise NotImplementedError
+
+    def stream(self, history, message):
+        """ Yields the reply to message chunk by chunk """
+        raise NotImplementedError
+
+    async def agenerate(self, prompt, system_instruction=None, generation_config=None):
+        """ Async generate; runs the blocking call on the bounded LLM executor by default """
+        call = functools.partial(self.generate, prompt, system_instruction, generation_config)
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), call)
+
+    async def achat(self, history, message):
+        """ Async chat; runs the blocking call on the bounded LLM executor by default """
+        call = functools.partial(self.chat, history, message)
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), call)
+
+
+class GeminiBackend(LLMBackend):
+    name = 'gemini'
+
+    def __init__(self, api_key, model_name="gemini-1.5-flash", timeout=30.0):
+        import google.generativeai as genai
+
+        self.genai = genai
+        self.model_name = model_name
+        # Bounds how long a hung request holds a worker; the circuit breaker counts it as a failure
+        self.request_options = {"timeout": timeout}
+        genai.configure(api_key=api_key)
+        self.models = ModelRegistry(self.build_model)
+
+        # Create the chat model
+        self.model = genai.GenerativeModel(
+            model_name=model_name,
+            generation_config=GENERATION_CONFIG,
+            safety_settings=SAFETY_SETTINGS,  # Pass safety settings separately
+            system_instruction=THERAPIST_SYSTEM_PROMPT
+        )
+        logger.info(f"Using model: {model_name}")
+
+    def build_model(self, model_name, system_instruction=None, generation_config=None):
+        return self.genai.GenerativeModel(
+            model_name=model_name,
+            generation_config=generation_config,
+            system_instruction=system_instruction
+        )
+
+    def get_model(self, system_instruction=None, generation_config=None):
+        """ Shared model for one system prompt and config, e.g. the sentiment analyzer """
+        return self.models.get(self.model_name, system_instruction, generation_config)
+
+    def generate(self, prompt, system_instruction=None, generation_config=None):
+        model = self.get_model(system_instruction, generation_config)
+        return model.generate_content(prompt, request_options=self.request_options).text
+
+    def chat(self, history, message):
+        chat = self.model.start_chat(history=history)
+        return chat.send_message(message, request_options=self.request_options).text
+
+    def stream(self, history, message):
+        chat = self.model.start_chat(history=history)
+        for chunk in chat.send_message(message, stream=True, request_options=self.request_options):
+            if chunk.text:
+                yield chunk.text
+
+    async def agenerate(self, prompt, system_instruction=None, generation_config=None):
+        model = self.get_model(system_instruction, generation_config)
+        response = await model.generate_content_async(prompt, request_options=self.request_options)
+        return response.text
+
+    async def achat(self, history, message):
+        chat = self.model.start_chat(history=history)
+        response = await chat.send_message_async(message, request_options=self.request_options)
+        return response.text
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic in-process stand-in for load testing without network access.
+    :param latency: Seconds before the first token is produced.
+    :param token_rate: Tokens emitted per second after the first one.
+    :param reply_tokens: Number of tokens in every reply.
+    :param responder: Optional callable ``(prompt, system_instruction) -> str``
+      used instead of the generated filler text.
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency=0.2, token_rate=50.0, reply_tokens=60, responder=None):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.reply_tokens = reply_tokens
+        self.responder = responder
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _reply(self, prompt, system_instruction=None):
+        with self.lock:
+            self.calls += 1
+        if self.responder is not None:
+            return self.responder(prompt, system_instruction)
+        seed = hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+        words = [seed[i % len(seed):][:5] for i in range(self.reply_tokens)]
+        return " ".join(words)
+
+    def _tokens(self, text):
+        tokens = text.split(" ")
+        return [token if i == 0 else " " + token for i, token in enumerate(tokens)]
+
+    def _token_delay(self):
+        return 1.0 / self.token_rate if self.token_rate > 0 else 0
+
+    def generate(self, prompt, system_instruction=None, generation_config=None):
+        text = self._reply(prompt, system_instruction)
+        time.sleep(self.latency + self._token_delay() * (len(self._tokens(text)) - 1))
+        return text
+
+    def chat(self, history, message):
+        return self.generate(message)
+
+    def stream(self, history, message):
+        tokens = self._tokens(self._reply(message))
+        time.sleep(self.latency)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self._token_delay())
+            yield token
+
+    async def agenerate(self, prompt, system_instruction=None, generation_config=None):
+        text = self._reply(prompt, system_instruction)
+        await asyncio.sleep(self.latency + self._token_delay() * (len(self._tokens(text)) - 1))
+        return text
+
+    async def achat(self, history, message):
+        return await self.agenerate(message)
+
+
+class ScheduledBackend(LLMBackend):
+    """
+    Sends every call of another backend through an LLMScheduler.
+
+    Chat calls are interactive; generate calls (sentiment, summaries) are
+    background work and yield to them. Each call is charged its prompt plus
+    ``reply_tokens`` against the per-minute token budget.
+    """
+
+    def __init__(self, backend, scheduler, reply_tokens=250, queue_timeout=10.0, background_queue_timeout=60.0):
+        self.backend = backend
+        self.scheduler = scheduler
+        self.reply_tokens = reply_tokens
+        self.timeouts = {PRIORITY_INTERACTIVE: queue_timeout, PRIORITY_BACKGROUND: background_queue_timeout}
+        self.name = backend.name
+
+    def tokens(self, *texts, history=None):
+        parts = list(texts)
+        for entry in history or ():
+            parts.extend(part for part in entry.get("parts", ()) if isinstance(part, str))
+        return sum(len(text) for text in parts if text) // 4 + self.reply_tokens
+
+    def generate(self, prompt, system_instruction=None, generation_config=None):
+        call = functools.partial(self.backend.generate, prompt, system_instruction, generation_config)
+        tokens = self.tokens(prompt, system_instruction)
+        return self.scheduler.call(call, PRIORITY_BACKGROUND, tokens, self.timeouts[PRIORITY_BACKGROUND])
+
+    def chat(self, history, message):
+        call = functools.partial(self.backend.chat, history, message)
+        tokens = self.tokens(message, history=history)
+        return self.scheduler.call(call, PRIORITY_INTERACTIVE, tokens, self.timeouts[PRIORITY_INTERACTIVE])
+
+    def stream(self, history, message):
+        """ Waits for a slot before returning, so saturation surfaces before any chunk is sent """
+        tokens = self.tokens(message, history=history)
+        probe = self.scheduler.admit(PRIORITY_INTERACTIVE, tokens, self.timeouts[PRIORITY_INTERACTIVE])
+        try:
+            chunks = iter(self.backend.stream(history, message))
+        except Exception as e:
+            self.scheduler.report(probe, PRIORITY_INTERACTIVE, 0.0, e)
+            self.scheduler.release(PRIORITY_INTERACTIVE, 0.0)
+            raise
+        except BaseException:
+            if self.scheduler.breaker is not None:
+                self.scheduler.breaker.cancel(probe)
+            self.scheduler.release(PRIORITY_INTERACTIVE, 0.0)
+            raise
+        return ScheduledStream(self.scheduler, chunks, PRIORITY_INTERACTIVE, probe)
+
+    async def agenerate(self, prompt, system_instruction=None, generation_config=None):
+        call = functools.partial(self.backend.agenerate, prompt, system_instruction, generation_config)
+        tokens = self.tokens(prompt, system_instruction)
+        return await self.scheduler.acall(call, PRIORITY_BACKGROUND, tokens, self.timeouts[PRIORITY_BACKGROUND])
+
+    async def achat(self, history, message):
+        call = functools.partial(self.backend.achat, history, message)
+        tokens = self.tokens(message, history=history)
+        return await self.scheduler.acall(call, PRIORITY_INTERACTIVE, tokens, self.timeouts[PRIORITY_INTERACTIVE])
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_executor = None
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_executor():
+    """ Bounded thread pool used to await blocking backend calls from async views """
+    global _executor
+    if _executor is None:
+        with _backend_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'LLM_EXECUTOR_WORKERS', 32),
+                    thread_name_prefix='llm',
+                )
+    return _executor
+
+
+def create_breaker():
+    """ CircuitBreaker from settings, or None when settings.LLM_BREAKER is off """
+    if not getattr(settings, 'LLM_BREAKER', True):
+        return None
+    return CircuitBreaker(
+        window=getattr(settings, 'LLM_BREAKER_WINDOW', 20),
+        min_calls=getattr(settings, 'LLM_BREAKER_MIN_CALLS', 10),
+        failure_rate=getattr(settings, 'LLM_BREAKER_FAILURE_RATE', 0.5),
+        slow_seconds=getattr(settings, 'LLM_BREAKER_SLOW_SECONDS', 15.0),
+        slow_rate=getattr(settings, 'LLM_BREAKER_SLOW_RATE', 0.5),
+        open_seconds=getattr(settings, 'LLM_BREAKER_OPEN_SECONDS', 30.0),
+    )
+
+
+def get_scheduler():
+    """ Process-wide LLMScheduler, or None when settings.LLM_SCHEDULER is off """
+    global _scheduler
+    if _scheduler is None and getattr(settings, 'LLM_SCHEDULER', True):
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler(
+                    max_in_flight=getattr(settings, 'LLM_MAX_IN_FLIGHT', 16),
+                    tokens_per_minute=getattr(settings, 'LLM_TOKENS_PER_MINUTE', 0),
+                    max_queue=getattr(settings, 'LLM_MAX_QUEUE', 100),
+                    background_share=getattr(settings, 'LLM_BACKGROUND_SHARE', 0.75),
+                    max_retries=getattr(settings, 'LLM_MAX_RETRIES', 3),
+                    backoff_base=getattr(settings, 'LLM_BACKOFF_BASE', 0.5),
+                    backoff_max=getattr(settings, 'LLM_BACKOFF_MAX', 8.0),
+                    breaker=create_breaker(),
+                )
+    return _scheduler
+
+
+def schedule_backend(backend):
+    """ Wraps backend in the process scheduler (if enabled) """
+    scheduler = get_scheduler()
+    if backend is None or scheduler is None:
+        return backend
+    return ScheduledBackend(
+        backend,
+        scheduler,
+        queue_timeout=getattr(settings, 'LLM_QUEUE_TIMEOUT', 10.0),
+        background_queue_timeout=getattr(settings, 'LLM_BACKGROUND_QUEUE_TIMEOUT', 60.0),
+    )
+
+
+def create_backend():
+    """ Builds the backend named by settings.LLM_BACKEND, or None if it cannot be configured """
+    backend_name = getattr(settings, 'LLM_BACKEND', 'gemini')
+    if backend_name == 'fake':
+        return FakeBackend(
+            latency=getattr(settings, 'LLM_FAKE_LATENCY', 0.2),
+            token_rate=getattr(settings, 'LLM_FAKE_TOKEN_RATE', 50.0),
+        )
+    if backend_name == 'gemini':
+        api_key = getattr(settings, 'GEMINI_API_KEY', None)
+        if not api_key:
+            logger.error("GEMINI_API_KEY environment variable is not set")
+            return None
+        try:
+            return GeminiBackend(api_key, timeout=getattr(settings, 'LLM_REQUEST_TIMEOUT', 30.0))
+        except Exception as e:
+            logger.error(f"Error initializing Gemini API: {str(e)}")
+            return None
+    logger.error(f"Unknown LLM_BACKEND: {backend_name}")
+    return None
+
+
+def get_backend():
+    """ Returns the process-wide backend, creating it on first use """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = schedule_backend(create_backend())
+    return _backend
+
+
+def set_backend(backend):
+    """ Replaces the process-wide backend (used by benchmarks); None re-reads settings on next use """
+    global _backend
+    backend = schedule_backend(backend)
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,1080 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import AsyncClient, Client, override_settings
+from django.urls import include, path
+from django.test.utils import setup_test_environment, teardown_test_environment
+from admin_soft.breaker import CircuitBreaker, CircuitOpen
+from admin_soft.chat_session import ChatSessionManager, build_model_history, estimate_tokens
+from admin_soft.context import ContextCompactor
+from admin_soft.lexicon import LexiconScorer
+from admin_soft.llm import FakeBackend, ModelRegistry, ScheduledBackend, set_backend
+from admin_soft.response_cache import FirstTurnCache
+from admin_soft.scheduler import LLMScheduler, SchedulerSaturated
+from admin_soft.sentiment import (
+    BATCH_SENTIMENT_SYSTEM_PROMPT, INCREMENTAL_SENTIMENT_SYSTEM_PROMPT, SENTIMENT_SYSTEM_PROMPT,
+    SentimentUpdates, SentimentWorker, analyze_history, analyze_sessions, get_sentiment, history_to_text, sentiment_cache,
+)
+from admin_soft.session_store import RedisConnection, RedisSessionStore, SQLiteSessionStore
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import asyncio
+import json
+import socketserver
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+from urllib.parse import urlencode
+
+FORM_CONTENT_TYPE = 'application/x-www-form-urlencoded'
+
+
+class FakeChatSession:
+    """ Mimics a Gemini chat session: every send_message is one blocking round-trip """
+
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history)
+
+    def send_message(self, content):
+        self.model.calls += 1
+        time.sleep(self.model.latency)
+        self.history.append({"role": "user", "parts": [content]})
+        reply = f"echo: {content}"
+        self.history.append({"role": "model", "parts": [reply]})
+        return type("FakeResponse", (), {"text": reply})()
+
+
+class FakeModel:
+    """ Local stand-in for GenerativeModel with a fixed per-call latency """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self, history or [])
+
+
+def replay_turn(model, chat_history, message):
+    """ The pre-seeded strategy used by views.chat """
+    chat = model.start_chat(history=build_model_history(chat_history))
+    return chat.send_message(message).text
+
+
+def sequential_turn(model, chat_history, message):
+    """ The old strategy: re-send every previous user message before the new one """
+    chat = model.start_chat(history=[])
+    for msg in chat_history:
+        if msg["role"] == "user":
+            chat.send_message(msg["content"])
+    return chat.send_message(message).text
+
+
+def bench_chat_replay(command, options):
+    turns = options['turns']
+    latency = options['latency'] / 1000.0
+    strategies = [('preseeded', replay_turn)]
+    if options['compare']:
+        strategies.append(('sequential', sequential_turn))
+
+    for name, turn in strategies:
+        manager = ChatSessionManager()
+        model = FakeModel(latency)
+        session_id = f"bench_{name}"
+        timings = []
+        for i in range(1, turns + 1):
+            message = f"message {i}"
+            history = manager.get_chat_history(session_id)
+            start = time.perf_counter()
+            reply = turn(model, history, message)
+            timings.append((time.perf_counter() - start) * 1000)
+            manager.add_message(session_id, "user", message)
+            manager.add_message(session_id, "model", reply)
+
+        command.stdout.write(f"{name}: {model.calls} model calls over {turns} turns")
+        for i in sorted({1, min(10, turns), min(25, turns), turns}):
+            command.stdout.write(f"  turn {i:>3}: {timings[i - 1]:8.2f} ms")
+        command.stdout.write(
+            f"  mean {statistics.mean(timings):.2f} ms, "
+            f"first/last ratio {timings[-1] / timings[0]:.2f}"
+        )
+
+
+@contextmanager
+def test_database():
+    """ Runs the block against a throwaway test database instead of db.sqlite3 """
+    if connection.vendor == 'sqlite':
+        # A file keeps concurrent clients from tripping over shared-cache table locks
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+@contextmanager
+def fake_backend(options, **kwargs):
+    backend = FakeBackend(latency=options['latency'] / 1000.0, token_rate=options['token_rate'], **kwargs)
+    set_backend(backend)
+    try:
+        yield backend
+    finally:
+        set_backend(None)
+
+
+def report_latencies(command, label, timings, elapsed):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+    command.stdout.write(
+        f"{label}: {len(timings)} requests in {elapsed:.2f} s "
+        f"({len(timings) / elapsed:.1f} req/s), "
+        f"p50 {statistics.median(timings):.1f} ms, p95 {p95:.1f} ms"
+    )
+
+
+def bench_throughput(command, options):
+    """ Drives /chat/ and /api/get_screening_data/ through the Django stack with the fake backend """
+    concurrency = options['concurrency']
+    per_client = max(1, options['requests'] // concurrency)
+
+    def run_client(index):
+        client = Client()
+        chat_timings, screening_timings = [], []
+        for i in range(per_client):
+            start = time.perf_counter()
+            response = client.post('/chat/', {'message': f"client {index} message {i}"})
+            chat_timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f"/chat/ returned {response.status_code}: {response.content[:200]}")
+
+            start = time.perf_counter()
+            client.get('/api/get_screening_data/')
+            screening_timings.append((time.perf_counter() - start) * 1000)
+        return chat_timings, screening_timings
+
+    with test_database(), fake_backend(options) as backend:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(run_client, range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    command.stdout.write(f"{concurrency} concurrent clients, {backend.calls} fake model calls")
+    report_latencies(command, '/chat/', [t for chat, _ in results for t in chat], elapsed)
+    report_latencies(command, '/api/get_screening_data/', [t for _, screening in results for t in screening], elapsed)
+
+
+def bench_sentiment_cache(command, options):
+    """ Sentiment LLM calls made while the screening page polls between chat turns """
+    polls_per_turn = 5  # A 5-second poll against a user replying every ~25 seconds
+    sentiment_calls = []
+
+    def responder(prompt, system_instruction):
+        if system_instruction in (SENTIMENT_SYSTEM_PROMPT, INCREMENTAL_SENTIMENT_SYSTEM_PROMPT):
+            sentiment_calls.append(prompt)
+            return "Sentiment: anxiety\nIntensity: 40%"
+        return f"echo: {prompt}"
+
+    with test_database(), fake_backend(options, responder=responder):
+        client = Client()
+        polls = []
+        for i in range(options['turns']):
+            client.post('/chat/', {'message': f"message {i}"})
+            for _ in range(polls_per_turn):
+                start = time.perf_counter()
+                client.get('/api/get_screening_data/')
+                polls.append((time.perf_counter() - start) * 1000)
+
+    stats = sentiment_cache.stats()
+    command.stdout.write(
+        f"{len(polls)} screening polls over {options['turns']} turns: "
+        f"{len(sentiment_calls)} sentiment LLM calls, {stats['llm_calls_saved']} served from cache"
+    )
+    command.stdout.write(
+        f"  hits {stats['hits']}, misses {stats['misses']}, "
+        f"hit rate {stats['hit_rate']:.1%}, poll p50 {statistics.median(polls):.1f} ms"
+    )
+
+
+def bench_batch_sentiment(command, options):
+    """ Screening many sessions: one sentiment call per session versus batched requests """
+    sessions = options['requests']
+    manager = ChatSessionManager()
+    session_ids = [f"bench_batch_{i}" for i in range(sessions)]
+    for session_id in session_ids:
+        manager.add_message(session_id, "user", f"{session_id}: I have been anxious about exams")
+        manager.add_message(session_id, "model", "That sounds hard. What worries you most?")
+
+    def responder(prompt, system_instruction):
+        if system_instruction != BATCH_SENTIMENT_SYSTEM_PROMPT:
+            return "Sentiment: anxiety\nIntensity: 40%"
+        # Drop every tenth result to exercise the per-session fallback
+        items = json.loads(prompt)
+        return json.dumps([
+            {"id": item["id"], "sentiment": "anxiety", "intensity": 40}
+            for i, item in enumerate(items) if i % 10 != 9
+        ])
+
+    with override_settings(SENTIMENT_PRESCORE=False), fake_backend(options, responder=responder) as backend:
+        start = time.perf_counter()
+        for session_id in session_ids:
+            get_sentiment(history_to_text(manager.get_chat_history(session_id)))
+        per_session = time.perf_counter() - start
+        per_session_calls, backend.calls = backend.calls, 0
+
+        start = time.perf_counter()
+        rows = analyze_sessions(manager, session_ids)
+        batched = time.perf_counter() - start
+
+    command.stdout.write(f"{sessions} sessions")
+    command.stdout.write(f"  one call per session: {per_session_calls:>4} LLM calls, {per_session:.2f} s")
+    command.stdout.write(f"  batched:              {backend.calls:>4} LLM calls, {batched:.2f} s ({len(rows)} rows)")
+
+
+class QuotaExceeded(Exception):
+    """ Stands in for google.api_core.exceptions.ResourceExhausted """
+
+    code = 429
+
+
+class QuotaBackend(FakeBackend):
+    """ FakeBackend that answers 429 while ``limit`` calls are already running, like a provider quota """
+
+    def __init__(self, limit, **kwargs):
+        super().__init__(**kwargs)
+        self.limit = limit
+        self.running = 0
+        self.quota_errors = 0
+
+    def generate(self, prompt, system_instruction=None, generation_config=None):
+        with self.lock:
+            if self.running >= self.limit:
+                self.quota_errors += 1
+                raise QuotaExceeded("429 Resource has been exhausted")
+            self.running += 1
+        try:
+            return super().generate(prompt, system_instruction, generation_config)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def bench_scheduler(command, options):
+    """ A burst of chat and background calls against a provider quota, with and without the LLM scheduler """
+    clients = options['concurrency'] * 4
+    limit = options['concurrency']
+    per_client = max(1, options['requests'] // clients)
+
+    def run(backend):
+        def client(index):
+            timings = {'chat': [], 'background': [], 'failed': 0}
+            for i in range(per_client):
+                kind = 'chat' if (index + i) % 2 else 'background'
+                start = time.perf_counter()
+                try:
+                    if kind == 'chat':
+                        backend.chat([], f"client {index} message {i}")
+                    else:
+                        backend.generate(f"client {index} transcript {i}", SENTIMENT_SYSTEM_PROMPT)
+                    timings[kind].append((time.perf_counter() - start) * 1000)
+                except (QuotaExceeded, SchedulerSaturated):
+                    timings['failed'] += 1
+            return timings
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            results = list(executor.map(client, range(clients)))
+        return results, time.perf_counter() - start
+
+    def report(label, backend, results, elapsed, scheduler=None):
+        failed = sum(result['failed'] for result in results)
+        command.stdout.write(
+            f"{label}: {clients * per_client - failed}/{clients * per_client} calls succeeded in {elapsed:.2f} s, "
+            f"{backend.quota_errors} provider 429s"
+        )
+        for kind in ('chat', 'background'):
+            timings = sorted(t for result in results for t in result[kind])
+            if timings:
+                p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+                command.stdout.write(f"  {kind:<10} p50 {statistics.median(timings):7.1f} ms, p95 {p95:7.1f} ms")
+        if scheduler is not None:
+            command.stdout.write(f"  scheduler: {scheduler.stats()}")
+
+    def quota_backend():
+        return QuotaBackend(limit, latency=options['latency'] / 1000.0, token_rate=options['token_rate'])
+
+    command.stdout.write(f"{clients} clients x {per_client} calls, provider allows {limit} concurrent calls")
+    if options['compare']:
+        backend = quota_backend()
+        report("unscheduled", backend, *run(backend))
+
+    backend = quota_backend()
+    scheduler = LLMScheduler(max_in_flight=limit, max_queue=clients, backoff_base=0.05)
+    report("scheduled", backend, *run(ScheduledBackend(backend, scheduler)), scheduler)
+
+    # A queue much shorter than the burst: excess chat turns fail fast with Retry-After instead of hanging
+    backend = quota_backend()
+    scheduler = LLMScheduler(max_in_flight=limit, max_queue=limit, backoff_base=0.05)
+    report("short queue", backend, *run(ScheduledBackend(backend, scheduler, queue_timeout=0.5)), scheduler)
+
+
+class OutageBackend(FakeBackend):
+    """ FakeBackend that, while ``down``, hangs for ``timeout`` seconds and then fails like a timed-out request """
+
+    def __init__(self, timeout, **kwargs):
+        super().__init__(**kwargs)
+        self.timeout = timeout
+        self.down = False
+
+    def generate(self, prompt, system_instruction=None, generation_config=None):
+        if self.down:
+            with self.lock:
+                self.calls += 1
+            time.sleep(self.timeout)
+            raise TimeoutError("Deadline exceeded")
+        return super().generate(prompt, system_instruction, generation_config)
+
+
+def bench_circuit_breaker(command, options):
+    """ Chat calls through a model outage and its recovery, with and without the circuit breaker """
+    clients = options['concurrency']
+    timeout = options['latency'] * 50 / 1000.0  # A hung request waits for the client timeout
+    open_seconds = 0.5
+
+    def run_phase(backend, seconds):
+        def client(index):
+            timings, degraded = [], 0
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    backend.chat([], f"client {index} message {len(timings)}")
+                except CircuitOpen:
+                    degraded += 1
+                except Exception:
+                    pass
+                timings.append((time.perf_counter() - start) * 1000)
+                time.sleep(options['latency'] / 1000.0)  # Think time between messages
+            return timings, degraded
+
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            results = list(executor.map(client, range(clients)))
+        return [t for timings, _ in results for t in timings], sum(degraded for _, degraded in results)
+
+    modes = [('breaker', True)] + ([('no breaker', False)] if options['compare'] else [])
+    for label, with_breaker in modes:
+        model = OutageBackend(timeout, latency=options['latency'] / 1000.0, token_rate=options['token_rate'])
+        breaker = CircuitBreaker(window=20, min_calls=clients, open_seconds=open_seconds) if with_breaker else None
+        scheduler = LLMScheduler(max_in_flight=clients, max_retries=0, breaker=breaker)
+        backend = ScheduledBackend(model, scheduler)
+        command.stdout.write(f"{label}:")
+        for phase, down, seconds in (('healthy', False, 1.0), ('outage', True, 3.0), ('recovered', False, 2.0)):
+            model.down = down
+            model.calls = 0
+            timings, degraded = run_phase(backend, seconds)
+            command.stdout.write(
+                f"  {phase:<9} {len(timings):>3} calls, {model.calls:>3} reached the model, {degraded:>3} degraded, "
+                f"p50 {statistics.median(timings):7.1f} ms, max {max(timings):7.1f} ms"
+            )
+        if breaker is not None:
+            command.stdout.write(f"  breaker: {breaker.stats()}")
+
+
+def bench_response_cache(command, options):
+    """ First-turn response cache: new sessions opening with common messages through /chat/ """
+    from admin_soft import views
+
+    openers = ["hi", "Hello!", "hello", "I feel anxious", "i feel anxious.", "Hey there", "I can't sleep"]
+    cache = FirstTurnCache(variants=3)
+    timings = {'hit': [], 'miss': []}
+    previous, views.response_cache = views.response_cache, cache
+    try:
+        with test_database(), fake_backend(options) as backend:
+            for i in range(options['requests']):
+                response = Client().post('/chat/', {'message': openers[i % len(openers)]})
+                header = response['Server-Timing']
+                kind = 'hit' if 'desc="hit"' in header else 'miss'
+                metric = header.split(', ')[-1]
+                timings[kind].append(float(metric.split('dur=')[1].split(';')[0]))
+    finally:
+        views.response_cache = previous
+
+    stats = cache.stats()
+    command.stdout.write(
+        f"{options['requests']} first turns, {len(openers)} openers: {backend.calls} LLM calls, "
+        f"{stats['hits']} cache hits, {stats['entries']} keys"
+    )
+    for kind, values in timings.items():
+        if values:
+            command.stdout.write(f"  {kind:<4} p50 {statistics.median(values):9.3f} ms (Server-Timing)")
+
+
+def bench_screening_push(command, options):
+    """ Screening updates pushed to many listeners: delivery delay and suppressed no-op updates """
+    listeners = options['concurrency'] * 10
+    changes = options['turns']
+    updates = SentimentUpdates()
+    delays = []
+
+    async def listener():
+        version = 0
+        while version < changes:
+            found, version = await updates.await_since(version, timeout=5)
+            delays.extend(time.perf_counter() - row['published'] for _, _, row in found)
+
+    def publisher():
+        for i in range(changes):
+            time.sleep(0.01)
+            for level in (i, i):  # The repeat is a no-op update and must not wake anyone
+                updates.publish("bench_push", {"sentiment": "Stress", "level": level, "published": time.perf_counter()})
+
+    async def main():
+        tasks = [asyncio.ensure_future(listener()) for _ in range(listeners)]
+        await asyncio.sleep(0.05)
+        await asyncio.get_running_loop().run_in_executor(None, publisher)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    delays = sorted(delay * 1000 for delay in delays)
+    stats = updates.stats()
+    command.stdout.write(
+        f"{listeners} async listeners, {changes} changes: {len(delays)} deliveries, "
+        f"{stats['unchanged']} no-op updates suppressed"
+    )
+    command.stdout.write(
+        f"  delivery delay p50 {statistics.median(delays):.2f} ms, max {delays[-1]:.2f} ms "
+        f"(polling every 120 s averages 60000 ms)"
+    )
+
+
+def bench_sentiment_worker(command, options):
+    """ Background sentiment worker: debounced scoring of chatty sessions and queue metrics """
+    sessions = options['concurrency'] * 10
+    messages = options['turns']
+    manager = ChatSessionManager()
+
+    def responder(prompt, system_instruction):
+        return json.dumps([{"id": item["id"], "sentiment": "stress", "intensity": 55} for item in json.loads(prompt)])
+
+    with override_settings(SENTIMENT_PRESCORE=False), fake_backend(options, responder=responder) as backend:
+        worker = SentimentWorker(manager, debounce=0.05, max_delay=0.5, max_pending=sessions // 2, batch_size=20)
+        start = time.perf_counter()
+        for i in range(messages):
+            for s in range(sessions):
+                manager.add_message(f"bench_worker_{s}", "user", f"message {i}")
+            time.sleep(0.01)  # Users type faster than the debounce window
+        produced = time.perf_counter() - start
+
+        reads = []
+        deadline = time.monotonic() + 10
+        while worker.get_metrics()["processed"] < worker.get_metrics()["enqueued"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        for s in range(sessions):
+            read_start = time.perf_counter()
+            manager.get_sentiment_data(f"bench_worker_{s}")
+            reads.append((time.perf_counter() - read_start) * 1e6)
+
+    metrics = worker.get_metrics()
+    command.stdout.write(
+        f"{sessions} sessions x {messages} messages in {produced:.2f} s, {backend.calls} LLM calls "
+        f"(inline scoring would make up to {sessions * messages})"
+    )
+    command.stdout.write(
+        f"  enqueued {metrics['enqueued']}, coalesced {metrics['coalesced']}, dropped {metrics['dropped']}, "
+        f"processed {metrics['processed']} in {metrics['batches']} batches, max depth {metrics['max_depth']}/{metrics['capacity']}"
+    )
+    command.stdout.write(f"  view read of precomputed sentiment: p50 {statistics.median(reads):.1f} us")
+
+
+def bench_lexicon(command, options):
+    """ Accuracy and latency of the lexicon pre-scorer on the labeled fixture set """
+    path = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'sentiment_fixtures.json')
+    with open(path) as fixture_file:
+        fixtures = json.load(fixture_file)
+    texts = [fixture['text'] for fixture in fixtures]
+    scorer = LexiconScorer()
+
+    start = time.perf_counter()
+    for text in texts:
+        scorer.score(text)
+    single = (time.perf_counter() - start) / len(texts)
+    start = time.perf_counter()
+    results = scorer.score_many(texts)
+    batched = (time.perf_counter() - start) / len(texts)
+
+    local = [(fixture, result) for fixture, result in zip(fixtures, results) if not result.escalate]
+    correct = sum(result.sentiment.lower() == fixture['sentiment'].lower() for fixture, result in local)
+    high_risk = [result for fixture, result in zip(fixtures, results) if fixture['sentiment'] == "Suicidal"]
+    command.stdout.write(f"{len(fixtures)} labeled fixtures")
+    command.stdout.write(
+        f"  answered locally: {len(local)} ({len(local) / len(fixtures):.0%}), "
+        f"accuracy {correct / len(local) if local else 0:.1%}"
+    )
+    command.stdout.write(
+        f"  escalated to the LLM: {len(fixtures) - len(local)}, "
+        f"high-risk escalated {sum(result.escalate for result in high_risk)}/{len(high_risk)}"
+    )
+    command.stdout.write(
+        f"  latency: {single * 1e6:.0f} us per text, {batched * 1e6:.0f} us per text batched "
+        f"(LLM round-trip here: {options['latency']} ms)"
+    )
+
+
+def bench_incremental_sentiment(command, options):
+    """ Sentiment prompt size as a conversation grows, full transcript versus incremental """
+    turns = options['turns']
+    prompts = []
+
+    def responder(prompt, system_instruction):
+        prompts.append(estimate_tokens(prompt))
+        return "Sentiment: stress\nIntensity: 55%\nSummary: The user is under pressure at work."
+
+    for incremental in (False, True):
+        manager = ChatSessionManager(max_messages=0, max_tokens=0)
+        session_id = "bench_sentiment"
+        with override_settings(SENTIMENT_INCREMENTAL=incremental, SENTIMENT_PRESCORE=False), \
+                fake_backend(options, responder=responder):
+            for i in range(turns):
+                manager.add_message(session_id, "user", f"turn {i}: work has been stressful and I sleep badly " * 3)
+                manager.add_message(session_id, "model", f"reply {i}: that sounds exhausting, tell me more " * 3)
+                analyze_history(manager, session_id, manager.get_chat_history(session_id))
+        sizes, prompts[:] = prompts[:], []
+
+        command.stdout.write("incremental:" if incremental else "full transcript:")
+        for turn in sorted({1, turns // 4, turns // 2, turns}):
+            if turn < 1:
+                continue
+            command.stdout.write(f"  turn {turn:>4}: prompt ~{sizes[turn - 1]:>6} tokens")
+
+
+def bench_streaming(command, options):
+    """ Compares time-to-first-token of /chat/stream/ with the blocking /chat/ endpoint """
+    requests = options['requests']
+    with test_database(), fake_backend(options):
+        client = Client()
+        blocking, first_token, full_stream = [], [], []
+        for i in range(requests):
+            start = time.perf_counter()
+            client.post('/chat/', {'message': f"blocking message {i}"})
+            blocking.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            response = client.post('/chat/stream/', {'message': f"streamed message {i}"})
+            chunks = iter(response.streaming_content)
+            next(chunks)
+            first_token.append((time.perf_counter() - start) * 1000)
+            for _ in chunks:
+                pass
+            full_stream.append((time.perf_counter() - start) * 1000)
+
+    command.stdout.write(f"/chat/ full response:        p50 {statistics.median(blocking):.1f} ms")
+    command.stdout.write(f"/chat/stream/ first token:   p50 {statistics.median(first_token):.1f} ms")
+    command.stdout.write(f"/chat/stream/ full response: p50 {statistics.median(full_stream):.1f} ms")
+
+
+def bench_session_expiry(command, options):
+    """ Simulates an anonymous traffic spike and reports the expiry bookkeeping it leaves behind """
+    users = options['users']
+    messages = options['turns']
+    manager = ChatSessionManager()
+    threads_before = threading.active_count()
+
+    start = time.perf_counter()
+    for i in range(messages):
+        for user in range(users):
+            manager.add_message(f"anon_bench_{user}", "user", f"message {i}")
+    elapsed = time.perf_counter() - start
+
+    metrics = manager.get_metrics()
+    command.stdout.write(
+        f"{users * messages} messages from {users} anonymous users in {elapsed:.2f} s "
+        f"({elapsed / (users * messages) * 1e6:.1f} us/message)"
+    )
+    command.stdout.write(f"  threads started:  {threading.active_count() - threads_before}")
+    command.stdout.write(f"  live sessions:    {metrics['live_sessions']}")
+    command.stdout.write(f"  pending expiries: {metrics['pending_expiries']}")
+
+
+def bench_session_overhead(command, options):
+    """ Session queries and writes per request for each session configuration, on the configured database """
+    requests = options['requests']
+    configs = [
+        ('cached_db', 'django.contrib.sessions.backends.cached_db', False),
+        ('db', 'django.contrib.sessions.backends.db', False),
+        ('signed_cookies', 'django.contrib.sessions.backends.signed_cookies', False),
+    ]
+    if options['compare']:
+        configs.append(('db, save every request', 'django.contrib.sessions.backends.db', True))
+
+    with test_database():
+        command.stdout.write(f"{connection.vendor}: {requests} GET /api/chat_history/ per configuration")
+        for label, engine, save_every_request in configs:
+            with override_settings(SESSION_ENGINE=engine, SESSION_SAVE_EVERY_REQUEST=save_every_request):
+                client = Client()
+                client.get('/api/chat_history/')  # Creates the session
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    for _ in range(requests):
+                        response = client.get('/api/chat_history/')
+                        if response.status_code != 200:
+                            raise CommandError(f"/api/chat_history/ returned {response.status_code}")
+                    elapsed = time.perf_counter() - start
+            session_queries = [q['sql'] for q in queries.captured_queries if 'django_session' in q['sql']]
+            writes = sum(1 for sql in session_queries if not sql.lstrip().upper().startswith('SELECT'))
+            command.stdout.write(
+                f"  {label:<24} {len(session_queries) / requests:5.2f} session queries/request, "
+                f"{writes / requests:5.2f} writes/request, {elapsed / requests * 1000:6.2f} ms/request"
+            )
+
+
+def bench_context_compaction(command, options):
+    """ Prompt tokens per chat turn as a conversation grows, full window versus compacted context """
+    turns = options['turns']
+    manager = ChatSessionManager(max_messages=0, max_tokens=0)
+    compactor = ContextCompactor(manager, keep_turns=6, token_budget=2000, summary_batch=6)
+    session_id = "bench_context"
+    rows = []
+
+    def responder(prompt, system_instruction):
+        return "The user has been describing stress at work, poor sleep and worry about their family. " * 2
+
+    with fake_backend(options, responder=responder):
+        for i in range(turns):
+            manager.add_message(session_id, "user", f"turn {i}: work has been stressful and I sleep badly " * 4)
+            manager.add_message(session_id, "model", f"reply {i}: that sounds exhausting, tell me more " * 4)
+            history = compactor.build(session_id, manager.get_chat_history(session_id))
+            full = sum(estimate_tokens(msg["content"]) for msg in manager.get_chat_history(session_id))
+            rows.append((full, sum(estimate_tokens(part) for entry in history for part in entry["parts"])))
+            time.sleep(options['latency'] / 1000.0 * 2)  # User think time; lets summaries land
+
+    command.stdout.write("turn   full window   compacted")
+    for turn in sorted({1, turns // 4, turns // 2, turns}):
+        if turn >= 1:
+            full, compacted = rows[turn - 1]
+            command.stdout.write(f"{turn:>4}   {full:>8} tok   {compacted:>6} tok")
+    stats = compactor.stats()
+    command.stdout.write(
+        f"overall reduction {stats['reduction']:.1%}, {stats['summaries']} summaries, "
+        f"{stats['compacted']}/{stats['builds']} prompts compacted"
+    )
+
+
+def bench_history_window(command, options):
+    """ Cost of add_message and get_chat_history as a single session's history grows """
+    messages = options['turns']
+    manager = ChatSessionManager(max_messages=options['max_messages'])
+    session_id = "bench_window"
+    appends, reads = [], []
+    for i in range(messages):
+        start = time.perf_counter()
+        manager.add_message(session_id, "user", f"message {i} " * 10)
+        appends.append((time.perf_counter() - start) * 1e6)
+
+        start = time.perf_counter()
+        manager.get_chat_history(session_id)
+        reads.append((time.perf_counter() - start) * 1e6)
+
+    command.stdout.write(f"{messages} messages, window holds {len(manager.get_chat_history(session_id))}")
+    for label, timings in (('add_message', appends), ('get_chat_history', reads)):
+        first = statistics.mean(timings[:max(1, messages // 10)])
+        last = statistics.mean(timings[-max(1, messages // 10):])
+        command.stdout.write(f"  {label:<17} first 10%: {first:6.1f} us, last 10%: {last:6.1f} us")
+
+
+def bench_model_registry(command, options):
+    """ Per-call cost of getting the sentiment GenerativeModel: built every call versus from the registry """
+    try:
+        import google.generativeai as genai
+    except ImportError:
+        raise CommandError('google-generativeai is required for this scenario')
+    genai.configure(api_key='benchmark')  # Models are only constructed here, never called
+
+    def build(model_name, system_instruction=None, generation_config=None):
+        return genai.GenerativeModel(
+            model_name=model_name, generation_config=generation_config, system_instruction=system_instruction
+        )
+
+    calls = options['requests'] * 10
+    registry = ModelRegistry(build)
+    for label, get_model in (('new model per call', build), ('registry', registry.get)):
+        start = time.perf_counter()
+        for _ in range(calls):
+            get_model("gemini-1.5-flash", SENTIMENT_SYSTEM_PROMPT)
+        elapsed = time.perf_counter() - start
+        command.stdout.write(f"{label:<20} {elapsed / calls * 1e6:8.1f} us per call")
+    command.stdout.write(f"registry: {registry.stats()}")
+
+
+def bench_lock_scaling(command, options):
+    """ ChatSessionManager throughput by thread count, single lock versus lock-striped shards """
+    ops_per_thread = options['requests']
+
+    def worker(manager, thread_index):
+        session_id = f"bench_{thread_index}"
+        for i in range(ops_per_thread):
+            manager.add_message(session_id, "user", "message")
+            manager.get_chat_history(session_id)
+            manager.get_sentiment_data(session_id)
+
+    for shards in (1, options['shards']):
+        command.stdout.write(f"{shards} shard(s):")
+        for threads in (1, 2, 4, 8, 16):
+            manager = ChatSessionManager(shards=shards)
+            workers = [threading.Thread(target=worker, args=(manager, i)) for i in range(threads)]
+            start = time.perf_counter()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            stats = manager.get_lock_stats()
+            command.stdout.write(
+                f"  {threads:>2} threads: {threads * ops_per_thread * 3 / elapsed:>10.0f} ops/s, "
+                f"contended {stats['contended'] / stats['acquisitions']:6.1%}, "
+                f"max hold {stats['max_hold_ms']:.3f} ms"
+            )
+
+
+class LocalRedisHandler(socketserver.StreamRequestHandler):
+    """ Serves the handful of list commands RedisSessionStore uses """
+
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        data = self.server.data
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+            command, args = args[0].upper(), args[1:]
+            with self.server.lock:
+                reply = self.execute(data, command, args)
+            self.wfile.write(reply)
+
+    @staticmethod
+    def execute(data, command, args):
+        if command == b'RPUSH':
+            items = data.setdefault(args[0], [])
+            items.extend(args[1:])
+            return b':%d\r\n' % len(items)
+        if command == b'LRANGE':
+            items = data.get(args[0], [])
+            start, stop = int(args[1]), int(args[2])
+            stop = len(items) if stop == -1 else stop + 1
+            return RedisConnection.encode(items[start:stop])
+        if command == b'LTRIM':
+            items = data.get(args[0], [])
+            data[args[0]] = items[int(args[1]):] if int(args[2]) == -1 else items[int(args[1]):int(args[2]) + 1]
+            return b'+OK\r\n'
+        if command == b'LINDEX':
+            items = data.get(args[0], [])
+            try:
+                item = items[int(args[1])]
+            except IndexError:
+                return b'$-1\r\n'
+            return b'$%d\r\n%s\r\n' % (len(item), item)
+        if command == b'DEL':
+            return b':%d\r\n' % (1 if data.pop(args[0], None) is not None else 0)
+        if command in (b'EXPIRE', b'SELECT', b'AUTH', b'PING'):
+            return b'+OK\r\n' if command != b'EXPIRE' else b':1\r\n'
+        return b'-ERR unknown command\r\n'
+
+
+@contextmanager
+def local_redis():
+    """ In-process Redis-protocol stand-in on a random local port """
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), LocalRedisHandler)
+    server.daemon_threads = True
+    server.data = {}
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def bench_session_store(command, options):
+    """ Hot-path latency of ChatSessionManager for each store backend """
+    users = min(options['users'], 200)
+    messages = options['turns']
+
+    def run(label, store):
+        manager = ChatSessionManager(store=store)
+        appends, reads = [], []
+        for i in range(messages):
+            for user in range(users):
+                session_id = f"bench_{user}"
+                start = time.perf_counter()
+                manager.add_message(session_id, "user", f"message {i}")
+                appends.append((time.perf_counter() - start) * 1e6)
+
+                start = time.perf_counter()
+                manager.get_chat_history(session_id)
+                reads.append((time.perf_counter() - start) * 1e6)
+        if manager.writer is not None:
+            manager.writer.flush()
+
+        command.stdout.write(
+            f"{label:<7} add_message p50 {statistics.median(appends):7.1f} us, "
+            f"get_chat_history p50 {statistics.median(reads):7.1f} us, "
+            f"p99 {sorted(reads)[int(len(reads) * 0.99)]:8.1f} us"
+        )
+        metrics = manager.get_metrics()
+        if store is not None:
+            command.stdout.write(
+                f"        cache hits {metrics['cache_hits']}, misses {metrics['cache_misses']}, "
+                f"flushed {metrics['flushed_writes']}"
+            )
+            # A second worker sees the first one's history through the store
+            other_worker = ChatSessionManager(store=store)
+            command.stdout.write(f"        second worker sees {len(other_worker.get_chat_history('bench_0'))} messages")
+
+    run('memory', None)
+    run('sqlite', SQLiteSessionStore(os.path.join(tempfile.mkdtemp(), 'chat_sessions.sqlite3')))
+    if options['redis_url']:
+        run('redis', RedisSessionStore(options['redis_url'], ttl=ChatSessionManager.message_window))
+    else:
+        with local_redis() as url:
+            run('redis', RedisSessionStore(url, ttl=ChatSessionManager.message_window))
+
+
+def async_urlconf():
+    """ Registers a urlconf that routes /chat/ and /api/get_screening_data/ to the async views """
+    from admin_soft import views
+
+    module = types.ModuleType('admin_soft_benchmark_async_urls')
+    module.urlpatterns = [
+        path('chat/', views.async_chat),
+        path('api/get_screening_data/', views.async_get_screening_data),
+        path('', include('core.urls')),
+    ]
+    sys.modules[module.__name__] = module
+    return module.__name__
+
+
+def admin_urlconf(model_count):
+    """ Registers a urlconf whose admin site has ``model_count`` extra (unmanaged) models """
+    from django.contrib.admin import AdminSite, ModelAdmin
+    from django.contrib.auth.admin import GroupAdmin, UserAdmin
+    from django.contrib.auth.models import Group, User
+    from django.db import models
+
+    site = AdminSite(name='admin')
+    site.register(User, UserAdmin)
+    site.register(Group, GroupAdmin)
+    for i in range(model_count):
+        meta = type('Meta', (), {'app_label': 'admin_soft', 'managed': False})
+        name = f'BenchmarkModel{i}'
+        model = apps_registry_model(name) or type(name, (models.Model,), {'__module__': __name__, 'Meta': meta})
+        site.register(model, ModelAdmin)
+
+    module = types.ModuleType(f'admin_soft_benchmark_admin_urls_{model_count}')
+    module.urlpatterns = [path('admin/', site.urls), path('', include('admin_soft.urls'))]
+    sys.modules[module.__name__] = module
+    return module.__name__
+
+
+def apps_registry_model(name):
+    from django.apps import apps
+
+    try:
+        return apps.get_model('admin_soft', name)
+    except LookupError:
+        return None
+
+
+def bench_admin_site_lookup(command, options):
+    """ resolve() calls made by get_admin_site while rendering admin pages, memoized per request versus not """
+    from django.contrib.auth.models import User
+    from django.urls import resolve
+    from admin_soft import utils
+
+    renders = options['requests']
+    pages = ['/admin/', '/admin/auth/user/', '/admin/auth/group/']
+    memoized_lookup = utils.get_admin_site
+    counts = {'lookups': 0, 'resolves': 0}
+
+    def counting_resolve(path, urlconf=None):
+        counts['resolves'] += 1
+        return resolve(path, urlconf)
+
+    def unmemoized_lookup(context):
+        # What every lookup did before: resolve the request path, then the namespace's index
+        utils.admin_sites_by_namespace.clear()
+        return utils.find_admin_site(types.SimpleNamespace(path_info=context.get('request').path_info))
+
+    def lookup(context):
+        counts['lookups'] += 1
+        return site_lookup(context)
+
+    modes = [('memoized', memoized_lookup)]
+    if options['compare']:
+        modes.insert(0, ('unmemoized', unmemoized_lookup))
+
+    with test_database(), override_settings(ROOT_URLCONF=admin_urlconf(options['models'])):
+        user = User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+        command.stdout.write(f"{renders} renders of each of {', '.join(pages)} per mode")
+        results = {}
+        try:
+            utils.resolve = counting_resolve
+            utils.get_admin_site = lookup
+            for label, site_lookup in modes:
+                client = Client()
+                client.force_login(user)
+                for page in pages:
+                    client.get(page)  # Warm templates, the menu cache and the namespace map
+                counts.update(lookups=0, resolves=0)
+                timings = []
+                for _ in range(renders):
+                    for page in pages:
+                        start = time.perf_counter()
+                        response = client.get(page)
+                        timings.append((time.perf_counter() - start) * 1000)
+                        if response.status_code != 200:
+                            raise CommandError(f"{page} returned {response.status_code}")
+                total = renders * len(pages)
+                results[label] = counts['resolves']
+                command.stdout.write(
+                    f"  {label:<10} {counts['lookups'] / total:.1f} lookups and {counts['resolves'] / total:.1f} "
+                    f"resolve() calls per render, p50 {statistics.median(timings):6.2f} ms"
+                )
+        finally:
+            utils.resolve = resolve
+            utils.get_admin_site = memoized_lookup
+        if 'unmemoized' in results:
+            command.stdout.write(
+                f"  {results['unmemoized'] - results['memoized']} resolve() calls eliminated over {total} renders"
+            )
+
+
+def bench_admin_menu(command, options):
+    """ Admin index render time with the sidebar menu rebuilt on every request versus cached """
+    from django.contrib.auth.models import User
+    from admin_soft import utils
+
+    model_count = options['models']
+    renders = options['requests']
+    modes = [('cached', True)]
+    if options['compare']:
+        modes.insert(0, ('uncached', False))
+
+    with test_database(), override_settings(ROOT_URLCONF=admin_urlconf(model_count)):
+        user = User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+        command.stdout.write(f"{model_count + 2} registered models, {renders} GET /admin/ per mode")
+        for label, cached in modes:
+            client = Client()
+            client.force_login(user)
+            utils.menu_skeletons.clear()
+            with override_settings(ADMIN_MENU_CACHE=cached):
+                client.get('/admin/')  # Warm templates and, when cached, the menu
+                timings = []
+                for _ in range(renders):
+                    if not cached:
+                        utils.menu_skeletons.clear()  # The per-render walk of the registry this replaced
+                    start = time.perf_counter()
+                    response = client.get('/admin/')
+                    timings.append((time.perf_counter() - start) * 1000)
+                    if response.status_code != 200:
+                        raise CommandError(f"/admin/ returned {response.status_code}")
+            command.stdout.write(
+                f"  {label:<9} p50 {statistics.median(timings):6.2f} ms, mean {statistics.mean(timings):6.2f} ms"
+            )
+
+
+def bench_concurrency(command, options):
+    """ Load test: sync views on a fixed worker pool versus async views on one event loop """
+    concurrency = options['concurrency']
+    workers = options['workers']
+
+    def sync_conversation(index):
+        client = Client()
+        start = time.perf_counter()
+        client.post('/chat/', urlencode({'message': f"client {index}"}), content_type=FORM_CONTENT_TYPE)
+        client.get('/api/get_screening_data/')
+        return (time.perf_counter() - start) * 1000
+
+    async def async_conversation(index):
+        client = AsyncClient()
+        start = time.perf_counter()
+        # Form-encode by hand: Django 3.2's AsyncClient mis-sizes multipart bodies
+        await client.post('/chat/', urlencode({'message': f"client {index}"}), content_type=FORM_CONTENT_TYPE)
+        await client.get('/api/get_screening_data/')
+        return (time.perf_counter() - start) * 1000
+
+    async def run_async():
+        return await asyncio.gather(*(async_conversation(i) for i in range(concurrency)))
+
+    with test_database(), fake_backend(options):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            sync_timings = list(executor.map(sync_conversation, range(concurrency)))
+        report_latencies(command, f"sync  ({workers} worker threads)", sync_timings, time.perf_counter() - start)
+
+        with override_settings(ROOT_URLCONF=async_urlconf()):
+            start = time.perf_counter()
+            async_timings = asyncio.run(run_async())
+            report_latencies(command, "async (1 event loop)", async_timings, time.perf_counter() - start)
+
+
+SCENARIOS = {
+    'admin_menu': bench_admin_menu,
+    'admin_site_lookup': bench_admin_site_lookup,
+    'batch_sentiment': bench_batch_sentiment,
+    'chat_replay': bench_chat_replay,
+    'circuit_breaker': bench_circuit_breaker,
+    'concurrency': bench_concurrency,
+    'context_compaction': bench_context_compaction,
+    'history_window': bench_history_window,
+    'incremental_sentiment': bench_incremental_sentiment,
+    'lexicon': bench_lexicon,
+    'lock_scaling': bench_lock_scaling,
+    'model_registry': bench_model_registry,
+    'response_cache': bench_response_cache,
+    'scheduler': bench_scheduler,
+    'screening_push': bench_screening_push,
+    'sentiment_cache': bench_sentiment_cache,
+    'sentiment_worker': bench_sentiment_worker,
+    'session_store': bench_session_store,
+    'session_expiry': bench_session_expiry,
+    'session_overhead': bench_session_overhead,
+    'streaming': bench_streaming,
+    'throughput': bench_throughput,
+}
+
+
+class Command(BaseCommand):
+    help = 'Runs offline performance benchmarks against local fake backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--turns', type=int, default=50, help='Conversation length to simulate')
+        parser.add_argument('--latency', type=float, default=20.0, help='Fake model latency per call in ms')
+        parser.add_argument('--token-rate', type=float, default=200.0, help='Fake model tokens per second')
+        parser.add_argument('--concurrency', type=int, default=8, help='Number of concurrent clients')
+        parser.add_argument('--workers', type=int, default=8, help='Sync worker threads for the concurrency scenario')
+        parser.add_argument('--requests', type=int, default=80, help='Total requests per endpoint')
+        parser.add_argument('--users', type=int, default=1000, help='Simulated users for session scenarios')
+        parser.add_argument('--max-messages', type=int, default=None, help='Per-session message cap')
+        parser.add_argument('--models', type=int, default=50, help='Extra admin models for the admin menu scenario')
+        parser.add_argument('--shards', type=int, default=16, help='Shard count for the lock scaling scenario')
+        parser.add_argument('--redis-url', default=None, help='Real Redis server; defaults to a local stand-in')
+        parser.add_argument('--compare', action='store_true', help='Also run the legacy strategy for comparison')
+
+    def handle(self, *args, **options):
+        if options['turns'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--turns and --concurrency must be at least 1')
+        SCENARIOS[options['scenario']](self, options)
@@ -1,28 +1,114 @@
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.sessions.models import Session
-from datetime import datetime
+from django.utils import timezone
+from admin_soft.session_store import create_store
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
-    help = 'Cleans up expired sessions and performs maintenance on the ChatSessionManager'
+    help = 'Cleans up expired sessions and purges chat messages past CHAT_MESSAGE_RETENTION_DAYS from a shared store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Expired sessions or chat messages deleted per statement')
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause between batches')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after deleting this many sessions')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the expired sessions')
+        parser.add_argument('--skip-chat', action='store_true', help='Leave the shared chat session store alone')
 
     def handle(self, *args, **options):
-        # Clean up expired sessions from the database
-        expired_sessions = Session.objects.filter(expire_date__lt=datetime.now())
-        count = expired_sessions.count()
-        expired_sessions.delete()
-        
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        # Everything that expired before the purge started; sessions expiring meanwhile wait for the next run
+        now = timezone.now()
+        expired_sessions = Session.objects.filter(expire_date__lt=now)
+
+        if options['dry_run']:
+            # Served from the expire_date index
+            self.stdout.write(f'{expired_sessions.count()} expired sessions would be deleted')
+            return
+
+        # Walk the expired rows in primary key order, deleting one short batch at a time so the
+        # table is never locked for long and other requests can write between batches
+        deleted = 0
+        batches = 0
+        last_key = ''
+        start = time.perf_counter()
+        while options['limit'] is None or deleted < options['limit']:
+            size = batch_size if options['limit'] is None else min(batch_size, options['limit'] - deleted)
+            keys = list(
+                expired_sessions.filter(session_key__gt=last_key)
+                .order_by('session_key')
+                .values_list('session_key', flat=True)[:size]
+            )
+            if not keys:
+                break
+            count, _ = Session.objects.filter(session_key__in=keys, expire_date__lt=now).delete()
+            deleted += count
+            batches += 1
+            last_key = keys[-1]
+
+            elapsed = time.perf_counter() - start
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  batch {batches}: {deleted} deleted, {deleted / elapsed:.0f} rows/s')
+            if len(keys) < size:
+                break
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        elapsed = time.perf_counter() - start
         self.stdout.write(
-            self.style.SUCCESS(f'Successfully deleted {count} expired sessions')
+            self.style.SUCCESS(
+                f'Successfully deleted {deleted} expired sessions in {batches} batches '
+                f'({elapsed:.2f} s, {deleted / elapsed if elapsed else 0:.0f} rows/s)'
+            )
         )
-        
-        # You can add additional cleanup logic here if needed
-        # For example, if you want to access the ChatSessionManager:
-        # from your_app.chat_session import chat_session_manager
-        # chat_session_manager.cleanup_old_sessions()
-        
+
+        if not options['skip_chat']:
+            self.purge_chat_messages(batch_size, options['sleep'])
+
         self.stdout.write(
             self.style.SUCCESS('Session cleanup completed')
-        )
\ No newline at end of file
+        )
+
+    def purge_chat_messages(self, batch_size, sleep):
+        """
+        Purges messages older than CHAT_MESSAGE_RETENTION_DAYS from a shared chat
+        store, in batches like the sessions; 0 (the default) keeps the history.
+        In-memory sessions are out of this process's reach.
+        """
+        retention_days = getattr(settings, 'CHAT_MESSAGE_RETENTION_DAYS', 0)
+        if not retention_days:
+            self.stdout.write('Chat sessions: CHAT_MESSAGE_RETENTION_DAYS is 0, so stored chat history is kept')
+            return
+        store = create_store()
+        if store is None:
+            self.stdout.write(
+                'Chat sessions: CHAT_SESSION_STORE is memory, so they live in each server process and '
+                'expire there; nothing to purge from here'
+            )
+            return
+        cutoff = time.time() - retention_days * 24 * 60 * 60
+        purged = 0
+        try:
+            while True:
+                count = store.purge_older_than(cutoff, limit=batch_size)
+                purged += count
+                if count < batch_size:
+                    break
+                if sleep:
+                    time.sleep(sleep)
+            self.stdout.write(
+                f'Chat sessions: {purged} messages older than {retention_days} days purged from the {store.name} store'
+            )
+        except Exception as e:
+            logger.error(f"Error purging {store.name} chat store: {str(e)}")
+            self.stdout.write(
+                self.style.ERROR(f'Chat sessions: purging the {store.name} store failed after {purged} messages: {str(e)}')
+            )
+        finally:
+            store.close()
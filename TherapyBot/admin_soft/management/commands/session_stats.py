@@ -0,0 +1,146 @@
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from admin_soft.models import ChatMessage
+from admin_soft.session_store import create_store
+from datetime import timedelta
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def table_size(table):
+    """ Bytes used by a table and its indexes, or None if the database can't say """
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT pg_total_relation_size(%s)", [table])
+            elif connection.vendor == 'mysql':
+                cursor.execute(
+                    "SELECT data_length + index_length FROM information_schema.tables "
+                    "WHERE table_schema = DATABASE() AND table_name = %s",
+                    [table],
+                )
+            elif connection.vendor == 'sqlite':
+                # dbstat is only there when SQLite was compiled with SQLITE_ENABLE_DBSTAT_VTAB
+                cursor.execute(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = %s)",
+                    [table],
+                )
+            else:
+                return None
+            row = cursor.fetchone()
+            return int(row[0]) if row and row[0] is not None else None
+    except Exception as e:
+        logger.error(f"Error reading size of {table}: {str(e)}")
+        return None
+
+
+def chat_store_stats():
+    """ Sessions and messages in the shared chat store; in-memory sessions are only visible to their own process """
+    store = create_store()
+    if store is None:
+        return {'store': 'memory', 'shared': False}
+    try:
+        stats = dict(store.stats(), store=store.name, shared=True)
+        if store.name == 'database':
+            stats['bytes'] = table_size(ChatMessage._meta.db_table)
+        return stats
+    except Exception as e:
+        logger.error(f"Error reading {store.name} chat store stats: {str(e)}")
+        return {'store': store.name, 'shared': True, 'error': str(e)}
+    finally:
+        store.close()
+
+
+class Command(BaseCommand):
+    help = 'Reports django_session table statistics and shared chat store usage, as text or JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=14, help='Days shown in the expiry and growth histograms')
+        parser.add_argument('--json', action='store_true', help='Print one JSON document for trending')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        today = timezone.localdate(now)
+        days = options['days']
+
+        # One GROUP BY over expire_date, which is indexed, so the scan never touches session_data
+        per_day = {
+            row['day']: row['sessions']
+            for row in Session.objects.annotate(day=TruncDate('expire_date'))
+            .values('day').annotate(sessions=Count('pk')).order_by('day')
+        }
+        expired = Session.objects.filter(expire_date__lt=now).count()  # Index range scan
+
+        expired_before_today = sum(count for day, count in per_day.items() if day < today)
+        expiry_histogram = {'expired': expired}
+        for offset in range(days):
+            day = today + timedelta(days=offset)
+            count = per_day.get(day, 0)
+            if offset == 0:
+                count -= expired - expired_before_today  # Already expired earlier today
+            expiry_histogram[day.isoformat()] = count
+        expiry_histogram['later'] = sum(count for day, count in per_day.items() if day >= today + timedelta(days=days))
+
+        # A session expires SESSION_COOKIE_AGE after its last save, so shifting the expiry day back
+        # by that age gives the day each session was created or last renewed
+        shift = timedelta(days=round(settings.SESSION_COOKIE_AGE / 86400))
+        created_per_day = {}
+        for offset in range(days - 1, -1, -1):
+            day = today - timedelta(days=offset)
+            created_per_day[day.isoformat()] = per_day.get(day + shift, 0)
+
+        stats = {
+            'generated_at': now.isoformat(),
+            'database': connection.vendor,
+            'config': {
+                'engine': settings.SESSION_ENGINE,
+                'cookie_age': settings.SESSION_COOKIE_AGE,
+                'save_every_request': settings.SESSION_SAVE_EVERY_REQUEST,
+                'refresh_window': getattr(settings, 'SESSION_REFRESH_WINDOW', None),
+            },
+            'table': {
+                'rows': sum(per_day.values()),
+                'expired': expired,
+                'bytes': table_size(Session._meta.db_table),
+            },
+            'expiry_histogram': expiry_histogram,
+            'created_per_day': created_per_day,
+            'chat': chat_store_stats(),
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2, default=str))
+            return
+
+        config = stats['config']
+        self.stdout.write(f"Session engine: {config['engine']} (cookie age {config['cookie_age'] // 86400} days, "
+                          f"save every request: {config['save_every_request']})")
+        table = stats['table']
+        size = f"{table['bytes'] / 1024:.0f} KiB" if table['bytes'] is not None else "size unknown"
+        self.stdout.write(f"django_session: {table['rows']} rows, {table['expired']} expired, {size}")
+        self.stdout.write("Expiring per day:")
+        for day, count in expiry_histogram.items():
+            self.stdout.write(f"  {day:<10} {count:>8}")
+        self.stdout.write("Created or renewed per day (estimated from expire_date):")
+        for day, count in created_per_day.items():
+            self.stdout.write(f"  {day:<10} {count:>8}")
+        chat = stats['chat']
+        if not chat['shared']:
+            self.stdout.write(
+                "Chat sessions: held in each server process (CHAT_SESSION_STORE=memory); "
+                "GET /health/?detail=1 on a worker reports its own"
+            )
+        elif 'error' in chat:
+            self.stdout.write(f"Chat sessions: could not read the {chat['store']} store: {chat['error']}")
+        else:
+            size = f", {chat['bytes'] / 1024:.0f} KiB" if chat.get('bytes') is not None else ""
+            self.stdout.write(
+                f"Chat sessions in the {chat['store']} store: {chat['sessions']} sessions, {chat['messages']} messages{size}"
+            )
@@ -0,0 +1,71 @@
+from django.conf import settings
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.utils.deprecation import MiddlewareMixin
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+import asyncio
+import time
+
+# Session key holding the epoch second the session was last saved by SessionRefreshMiddleware
+SESSION_SAVED_AT_KEY = '_saved_at'
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    """
+    WhiteNoise that can run in an async middleware chain.
+
+    The stock middleware is sync-only, which makes Django adapt the whole
+    stack (async views included) back onto a single sync thread under ASGI.
+    With the prebuilt file index, lookups are in-memory and stay on the event
+    loop; WHITENOISE_AUTOREFRESH lookups hit the disk, so they run in a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Lets Django's iscoroutinefunction check see the instance as async
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class SessionRefreshMiddleware(MiddlewareMixin):
+    """
+    Keeps active sessions alive without saving them on every request.
+
+    With SESSION_SAVE_EVERY_REQUEST off, SessionMiddleware only writes a
+    session whose data changed, so an active user's expiry would never move.
+    Once less than SESSION_REFRESH_WINDOW seconds of a session's lifetime are
+    left, this marks it modified so SessionMiddleware saves it (and reissues
+    the cookie) with a fresh expiry. Must be listed after SessionMiddleware.
+    """
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        self.window = getattr(settings, 'SESSION_REFRESH_WINDOW', settings.SESSION_COOKIE_AGE // 2)
+
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        # Sessions the view never touched are left alone so static and health requests never load one
+        if session is None or not session.accessed or session.is_empty() or session.get_expire_at_browser_close():
+            return response
+        now = int(time.time())
+        saved_at = session.get(SESSION_SAVED_AT_KEY)
+        if session.modified or saved_at is None or saved_at + session.get_expiry_age() - now < self.window:
+            session[SESSION_SAVED_AT_KEY] = now
+        return response
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=64)),
+                ('message_id', models.BigIntegerField(default=0)),
+                ('role', models.CharField(max_length=16)),
+                ('content', models.TextField()),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session_id', 'created_at', 'message_id'], name='chat_message_session_cursor'),
+        ),
+    ]
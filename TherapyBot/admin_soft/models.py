@@ -1,3 +1,24 @@
 from django.db import models
 
 # Create your models here.
+
+
+class ChatMessage(models.Model):
+    """ One chat message, written in batches by the 'database' chat session store """
+
+    session_id = models.CharField(max_length=64)
+    # ChatSessionManager's microsecond-based id, which sentiment and summary bookkeeping compare against
+    message_id = models.BigIntegerField(default=0)
+    role = models.CharField(max_length=16)
+    content = models.TextField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # Serves both window loads and keyset pagination of older turns on (created_at, message_id)
+            models.Index(fields=['session_id', 'created_at', 'message_id'], name='chat_message_session_cursor'),
+        ]
+
+    def __str__(self):
+        return f"{self.session_id} {self.role}: {self.content[:50]}"
@@ -0,0 +1,102 @@
+from django.conf import settings
+from collections import OrderedDict
+from .lexicon import HIGH_RISK_TERMS
+import random
+import re
+import threading
+import time
+
+NON_WORD_RE = re.compile(r"[^a-z0-9' ]+")
+
+
+def normalize_message(message):
+    """ Cache key form of a message: lower case, no punctuation, single spaces """
+    return " ".join(NON_WORD_RE.sub(" ", message.lower()).split())
+
+
+class FirstTurnCache:
+    """
+    Replies to common opening messages ("hi", "I feel anxious").
+
+    Only the first turn of a conversation is cacheable, since later replies
+    depend on the history. Each key holds up to ``variants`` replies; the first
+    requests for a key still go to the model and fill the pool, after which a
+    random variant is served so replies don't look canned. Keys expire ``ttl``
+    seconds after their first reply and the least recently used key is evicted
+    beyond ``max_entries``. Messages with high-risk terms are never cached.
+    """
+
+    def __init__(self, max_entries=500, ttl=3600, variants=3, max_message_chars=80):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = variants
+        self.max_message_chars = max_message_chars
+        self.entries = OrderedDict()  # key -> (replies, created)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.evictions = 0
+        self.hit_seconds = 0.0
+
+    def key(self, message, chat_history):
+        """ Cache key for message, or None when it is not a cacheable first turn """
+        if any(msg["role"] in ("user", "model") for msg in chat_history):
+            return None
+        key = normalize_message(message)
+        if not key or len(key) > self.max_message_chars or any(term in key for term in HIGH_RISK_TERMS):
+            return None
+        return key
+
+    def get(self, key):
+        """ A cached reply once the key's variant pool is full, otherwise None """
+        start = time.perf_counter()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None or len(entry[0]) < self.variants:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            reply = random.choice(entry[0])
+            self.hits += 1
+            self.hit_seconds += time.perf_counter() - start
+            return reply
+
+    def add(self, key, reply):
+        """ Adds a model reply to the key's variant pool """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = ([], time.monotonic())
+            if len(entry[0]) < self.variants:
+                entry[0].append(reply)
+                self.fills += 1
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "fills": self.fills,
+                "evictions": self.evictions,
+                "avg_hit_ms": self.hit_seconds / self.hits * 1000 if self.hits else 0.0,
+            }
+
+
+def create_response_cache():
+    """ The first-turn cache when settings.CHAT_RESPONSE_CACHE is on, else None """
+    if not getattr(settings, 'CHAT_RESPONSE_CACHE', False):
+        return None
+    return FirstTurnCache(
+        max_entries=getattr(settings, 'CHAT_RESPONSE_CACHE_SIZE', 500),
+        ttl=getattr(settings, 'CHAT_RESPONSE_CACHE_TTL', 3600),
+        variants=getattr(settings, 'CHAT_RESPONSE_CACHE_VARIANTS', 3),
+    )
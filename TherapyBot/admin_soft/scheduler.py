@@ -0,0 +1,397 @@
+from collections import deque
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Lower runs first: a waiting chat turn always goes ahead of background sentiment and summaries
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# Status codes and exception names (google.api_core, requests, httpx) worth retrying
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'InternalServerError',
+    'DeadlineExceeded', 'GatewayTimeout', 'BadGateway', 'Timeout', 'ReadTimeout', 'ConnectTimeout',
+}
+
+
+class SchedulerSaturated(Exception):
+    """ Raised instead of queueing when the scheduler cannot start a call in time """
+
+    def __init__(self, retry_after, reason="LLM capacity exhausted"):
+        super().__init__(f"{reason}, retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def is_retryable(error):
+    """ Quota and transient errors; anything else fails straight away """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, 'code', None)
+    if callable(code):
+        code = None  # grpc errors expose code() rather than an HTTP status
+    return code in RETRYABLE_CODES or type(error).__name__ in RETRYABLE_ERRORS
+
+
+class Waiter:
+    """ A queued call: woken through a threading.Event, or a future for async callers """
+
+    __slots__ = ('priority', 'tokens', 'event', 'loop', 'future', 'granted')
+
+    def __init__(self, priority, tokens, loop=None):
+        self.priority = priority
+        self.tokens = tokens
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self.resolve)
+
+    def resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class LLMScheduler:
+    """
+    Admission control for every model call.
+
+    At most ``max_in_flight`` calls run at once, background calls may only use
+    ``background_share`` of those slots, and the estimated tokens started in
+    the last minute stay under ``tokens_per_minute`` (0 disables the budget).
+    Callers that cannot start wait in priority order; when ``max_queue``
+    callers are already waiting, or a caller waits longer than its timeout,
+    SchedulerSaturated is raised with a Retry-After estimate. Failed calls are
+    retried with jittered exponential backoff when the error is retryable.
+    An optional CircuitBreaker sees every attempt and short-circuits calls
+    (CircuitOpen) while the model is down.
+    """
+
+    def __init__(self, max_in_flight=8, tokens_per_minute=0, max_queue=100, background_share=0.75,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0, breaker=None):
+        self.max_in_flight = max_in_flight
+        self.background_slots = max(1, int(max_in_flight * background_share))
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker
+
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.background_in_flight = 0
+        self.window = deque()  # (started, tokens) of the last minute
+        self.window_tokens = 0
+        self.waiting = []  # Heap of (priority, sequence, Waiter)
+        self.sequence = itertools.count()
+        self.timer = None
+        self.avg_call_seconds = 1.0
+
+        self.started = 0
+        self.rejected = 0
+        self.retries = 0
+        self.failures = 0
+        self.max_waiting = 0
+
+    # Admission
+
+    def expire_window(self, now):
+        while self.window and now - self.window[0][0] >= 60:
+            self.window_tokens -= self.window.popleft()[1]
+
+    def budget_wait(self, tokens, now):
+        """ Seconds until tokens fit the per-minute budget (0 if they fit now) """
+        if not self.tokens_per_minute or not self.window:
+            return 0.0
+        excess = self.window_tokens + tokens - self.tokens_per_minute
+        if excess <= 0:
+            return 0.0
+        for started, used in self.window:
+            excess -= used
+            if excess <= 0:
+                break
+        # A call larger than the whole budget runs alone once the window is empty
+        return max(0.0, started + 60 - now)
+
+    def can_start(self, priority, tokens, now):
+        if self.in_flight >= self.max_in_flight:
+            return False
+        if priority != PRIORITY_INTERACTIVE and self.background_in_flight >= self.background_slots:
+            return False
+        return self.budget_wait(tokens, now) == 0
+
+    def start(self, priority, tokens, now):
+        self.in_flight += 1
+        if priority != PRIORITY_INTERACTIVE:
+            self.background_in_flight += 1
+        self.window.append((now, tokens))
+        self.window_tokens += tokens
+        self.started += 1
+
+    def retry_after(self, tokens, now):
+        """ Rough seconds until a new call could start: budget refill or queue drain """
+        queued = len(self.waiting) + 1
+        drain = self.avg_call_seconds * queued / self.max_in_flight
+        return max(1, int(round(max(drain, self.budget_wait(tokens, now)))))
+
+    def dispatch(self):
+        """ Starts waiting calls in priority order while there is capacity; called with the lock held """
+        now = time.monotonic()
+        self.expire_window(now)
+        skipped = []
+        while self.waiting:
+            priority, sequence, waiter = self.waiting[0]
+            if not self.can_start(priority, waiter.tokens, now):
+                if priority != PRIORITY_INTERACTIVE and self.in_flight < self.max_in_flight:
+                    # Background is out of slots; an interactive call further back may still start
+                    skipped.append(heapq.heappop(self.waiting))
+                    continue
+                break
+            heapq.heappop(self.waiting)
+            self.start(priority, waiter.tokens, now)
+            waiter.granted = True
+            waiter.wake()
+        for entry in skipped:
+            heapq.heappush(self.waiting, entry)
+
+        # Budget-blocked callers are re-checked once enough of the window has expired
+        if self.waiting and self.in_flight < self.max_in_flight and self.timer is None:
+            delay = self.budget_wait(self.waiting[0][2].tokens, now)
+            if delay > 0:
+                self.timer = threading.Timer(delay, self.on_timer)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def on_timer(self):
+        with self.lock:
+            self.timer = None
+            self.dispatch()
+
+    def enqueue(self, priority, tokens, loop=None):
+        """ Returns None when the call may start now, else the Waiter to wait on """
+        with self.lock:
+            now = time.monotonic()
+            self.expire_window(now)
+            if not self.waiting and self.can_start(priority, tokens, now):
+                self.start(priority, tokens, now)
+                return None
+            if len(self.waiting) >= self.max_queue:
+                self.rejected += 1
+                raise SchedulerSaturated(self.retry_after(tokens, now))
+            waiter = Waiter(priority, tokens, loop)
+            heapq.heappush(self.waiting, (priority, next(self.sequence), waiter))
+            self.max_waiting = max(self.max_waiting, len(self.waiting))
+            self.dispatch()
+            return waiter
+
+    def withdraw(self, waiter):
+        """ Takes a waiter out of the queue; returns True if it was granted a slot in the meantime """
+        with self.lock:
+            if waiter.granted:
+                return True
+            self.waiting = [entry for entry in self.waiting if entry[2] is not waiter]
+            heapq.heapify(self.waiting)
+            return False
+
+    def saturated(self, waiter):
+        with self.lock:
+            self.rejected += 1
+            return SchedulerSaturated(self.retry_after(waiter.tokens, time.monotonic()))
+
+    def acquire(self, priority, tokens, timeout):
+        waiter = self.enqueue(priority, tokens)
+        if waiter is not None and not waiter.event.wait(timeout) and not self.withdraw(waiter):
+            raise self.saturated(waiter)
+
+    async def aacquire(self, priority, tokens, timeout):
+        waiter = self.enqueue(priority, tokens, asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            if not self.withdraw(waiter):
+                raise self.saturated(waiter)
+        except asyncio.CancelledError:
+            # The request went away; hand back a slot granted while it was being cancelled
+            if self.withdraw(waiter):
+                self.release(priority, 0.0)
+            raise
+
+    def release(self, priority, seconds):
+        with self.lock:
+            self.in_flight -= 1
+            if priority != PRIORITY_INTERACTIVE:
+                self.background_in_flight -= 1
+            self.avg_call_seconds = 0.9 * self.avg_call_seconds + 0.1 * seconds
+            self.dispatch()
+
+    # Calls
+
+    def admit(self, priority, tokens, timeout):
+        """
+        Asks the breaker first, so calls fail fast while it is open, then waits
+        for a slot. Returns whether the call is a half-open probe; a probe that
+        never gets a slot is handed back rather than left to expire.
+        """
+        probe = self.breaker.allow() if self.breaker is not None else False
+        try:
+            self.acquire(priority, tokens, timeout)
+        except BaseException:
+            if self.breaker is not None:
+                self.breaker.cancel(probe)
+            raise
+        return probe
+
+    def report(self, probe, priority, seconds, error=None):
+        """
+        Tells the breaker how a call went. Only errors that mean the model is
+        unhealthy (is_retryable: transport, timeouts, 5xx, quota) count as
+        failures; a content-filter ValueError or a bad request does not. Only
+        interactive calls are judged on latency, since a large background
+        batch is slow by design.
+        """
+        if self.breaker is None:
+            return
+        failed = error is not None and is_retryable(error)
+        self.breaker.record(failed, seconds if priority == PRIORITY_INTERACTIVE else 0.0, probe)
+
+    async def aadmit(self, priority, tokens, timeout):
+        probe = self.breaker.allow() if self.breaker is not None else False
+        try:
+            await self.aacquire(priority, tokens, timeout)
+        except BaseException:
+            if self.breaker is not None:
+                self.breaker.cancel(probe)
+            raise
+        return probe
+
+    def backoff(self, attempt):
+        """ Exponential backoff with full jitter around the nominal delay """
+        return min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def call(self, function, priority, tokens, timeout):
+        """ Runs function() under admission control, retrying quota and transient errors """
+        for attempt in range(self.max_retries + 1):
+            probe = self.admit(priority, tokens, timeout)
+            start = time.monotonic()
+            try:
+                result = function()
+                self.report(probe, priority, time.monotonic() - start)
+                return result
+            except Exception as e:
+                self.report(probe, priority, time.monotonic() - start, e)
+                if attempt == self.max_retries or not is_retryable(e):
+                    with self.lock:
+                        self.failures += 1
+                    raise
+                delay = self.backoff(attempt)
+                logger.error(f"Retrying LLM call in {delay:.1f}s after: {str(e)}")
+                with self.lock:
+                    self.retries += 1
+            finally:
+                self.release(priority, time.monotonic() - start)
+            time.sleep(delay)  # The slot is free while backing off
+
+    async def acall(self, coroutine_function, priority, tokens, timeout):
+        """ Async counterpart of call; coroutine_function() makes a fresh coroutine per attempt """
+        for attempt in range(self.max_retries + 1):
+            probe = await self.aadmit(priority, tokens, timeout)
+            start = time.monotonic()
+            try:
+                result = await coroutine_function()
+                self.report(probe, priority, time.monotonic() - start)
+                return result
+            except Exception as e:
+                self.report(probe, priority, time.monotonic() - start, e)
+                if attempt == self.max_retries or not is_retryable(e):
+                    with self.lock:
+                        self.failures += 1
+                    raise
+                delay = self.backoff(attempt)
+                logger.error(f"Retrying LLM call in {delay:.1f}s after: {str(e)}")
+                with self.lock:
+                    self.retries += 1
+            finally:
+                self.release(priority, time.monotonic() - start)
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "in_flight": self.in_flight,
+                "waiting": len(self.waiting),
+                "max_waiting": self.max_waiting,
+                "tokens_last_minute": self.window_tokens,
+                "started": self.started,
+                "rejected": self.rejected,
+                "retries": self.retries,
+                "failures": self.failures,
+            }
+
+
+class ScheduledStream:
+    """
+    Holds a scheduler slot for the life of a streamed reply. The slot is
+    released when the stream is exhausted, fails, or is closed, so an
+    abandoned response does not leak it.
+    """
+
+    def __init__(self, scheduler, chunks, priority, probe=False):
+        self.scheduler = scheduler
+        self.chunks = chunks
+        self.priority = priority
+        self.probe = probe
+        self.started = time.monotonic()
+        self.first_chunk = None
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.close()
+            raise
+        except Exception as e:
+            self.close(error=e)
+            raise
+        except BaseException:
+            self.close()
+            raise
+        if self.first_chunk is None:
+            self.first_chunk = time.monotonic()
+        return chunk
+
+    def close(self, error=None):
+        if not self.closed:
+            self.closed = True
+            if hasattr(self.chunks, 'close'):
+                self.chunks.close()
+            now = time.monotonic()
+            if error is not None or self.first_chunk is not None:
+                # Time to first token is what the user waits on
+                self.scheduler.report(self.probe, self.priority, (self.first_chunk or now) - self.started, error)
+            elif self.scheduler.breaker is not None:
+                # Closed before any chunk: not judged, but a probe must not stay out
+                self.scheduler.breaker.cancel(self.probe)
+            self.scheduler.release(self.priority, now - self.started)
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,832 @@
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from collections import OrderedDict
+from datetime import datetime
+from .lexicon import LEXICON, LexiconScorer
+from .llm import get_backend, get_executor
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# System prompt enforcing sentiment format with percentage
+SENTIMENT_SYSTEM_PROMPT = (
+    "You are a sentiment analyzer. Analyze the following chat history and determine the emotional sentiment."
+    " Provide a sentiment category and an intensity percentage between 0-100."
+    " The sentiment should be one of the following: fear, disgust, admiration, sadness, anger, happiness, anxiety,"
+    " depression, stress, suicidal, bipolar, or personality disorder."
+    " Format your response as follows:\n"
+    "Sentiment: [sentiment]\n"
+    "Intensity: [percentage]%"
+)
+
+
+# Incremental mode: the model updates a previous assessment from the new turns only
+INCREMENTAL_SENTIMENT_SYSTEM_PROMPT = (
+    "You are a sentiment analyzer tracking the emotional sentiment of an ongoing conversation."
+    " You are given the previous assessment, a short summary of the conversation so far, and only the new messages."
+    " Update the assessment using the new messages, with the summary as context."
+    " Provide a sentiment category and an intensity percentage between 0-100."
+    " The sentiment should be one of the following: fear, disgust, admiration, sadness, anger, happiness, anxiety,"
+    " depression, stress, suicidal, bipolar, or personality disorder."
+    " Format your response as follows:\n"
+    "Sentiment: [sentiment]\n"
+    "Intensity: [percentage]%\n"
+    "Summary: [one or two sentences on the user's emotional state so far]"
+)
+
+
+# Batch mode: many transcripts in, one JSON array of results out
+BATCH_SENTIMENT_SYSTEM_PROMPT = (
+    "You are a sentiment analyzer. You are given a JSON array of chat transcripts, each with an id."
+    " For every transcript, determine the emotional sentiment and an intensity percentage between 0-100."
+    " The sentiment should be one of the following: fear, disgust, admiration, sadness, anger, happiness, anxiety,"
+    " depression, stress, suicidal, bipolar, or personality disorder."
+    " A transcript may start with a previous assessment and a summary of the conversation so far;"
+    " then update that assessment using the new messages that follow it."
+    " Return one result per transcript, using the transcript's id."
+)
+
+BATCH_SENTIMENT_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "id": {"type": "string"},
+            "sentiment": {"type": "string"},
+            "intensity": {"type": "integer"},
+        },
+        "required": ["id", "sentiment", "intensity"],
+    },
+}
+
+BATCH_GENERATION_CONFIG = {
+    "temperature": 0,
+    "response_mime_type": "application/json",
+    "response_schema": BATCH_SENTIMENT_SCHEMA,
+}
+
+
+# Labels the prompts allow, keyed by their lowercase form; rows are shown to other
+# accounts, so anything else the model writes is never passed on
+SENTIMENT_LABELS = {category: category.capitalize() for category in LEXICON}
+
+
+def normalize_sentiment(label):
+    """ The display form of a label the prompts allow, or None """
+    return SENTIMENT_LABELS.get(label.strip().strip('[]*."\'').strip().lower())
+
+
+def parse_sentiment(response_text):
+    """ Extracts (sentiment, intensity) from a response in the SENTIMENT_SYSTEM_PROMPT format """
+    lines = response_text.split('\n')
+    sentiment = "Unknown"
+    intensity = 50  # Default percentage
+
+    for line in lines:
+        if line.startswith("Sentiment:"):
+            sentiment = normalize_sentiment(line.split(":")[1]) or "Unknown"
+        elif line.startswith("Intensity:"):
+            try:
+                intensity = int(line.split(":")[1].replace('%', '').strip())
+            except ValueError:
+                intensity = 50  # Default in case of parsing failure
+
+    return sentiment, intensity
+
+
+def get_sentiment(history):
+    """ (sentiment, intensity), or None if the model could not be asked """
+    try:
+        llm_backend = get_backend()
+        if llm_backend is None:
+            return None
+
+        # Generate sentiment analysis
+        response_text = llm_backend.generate(history, system_instruction=SENTIMENT_SYSTEM_PROMPT)
+        return parse_sentiment(response_text)
+
+    except Exception as e:
+        logger.error(f"Error in get_sentiment: {str(e)}")
+        return None
+
+
+def parse_summary(response_text):
+    """ Extracts the Summary line of an INCREMENTAL_SENTIMENT_SYSTEM_PROMPT response, or None """
+    for line in response_text.split('\n'):
+        if line.startswith("Summary:"):
+            summary = line.split(":", 1)[1].strip()
+            return summary[:getattr(settings, 'SENTIMENT_SUMMARY_MAX_CHARS', 500)] or None
+    return None
+
+
+def history_to_text(history):
+    return "\n".join([f"{msg['role']}: {msg['content']}" for msg in history])
+
+
+def build_sentiment_data(session_id, username, sentiment, level):
+    """ Shapes a sentiment result into the row format used by the screening table """
+    status = "Good" if level >= 70 else "Moderate" if level >= 40 else "Low"
+    status_color = "success" if status == "Good" else "warning" if status == "Moderate" else "danger"
+
+    return {
+        "id": session_id,
+        "sentiment": sentiment,
+        "username": username,  # Add username to sentiment data
+        "level": level,
+        "level_description": "excellent" if level >= 80 else "good" if level >= 60 else "okay" if level >= 40 else "concerning",
+        "status": status,
+        "status_color": status_color,
+        "time": datetime.now().strftime("%H:%M"),
+    }
+
+
+async def aget_sentiment(history):
+    try:
+        llm_backend = get_backend()
+        if llm_backend is None:
+            return None
+
+        response_text = await llm_backend.agenerate(history, system_instruction=SENTIMENT_SYSTEM_PROMPT)
+        return parse_sentiment(response_text)
+
+    except Exception as e:
+        logger.error(f"Error in aget_sentiment: {str(e)}")
+        return None
+
+
+def history_fingerprint(history):
+    """ (message count, hash of message ids and roles): changes whenever the window changes """
+    digest = hashlib.blake2b(digest_size=16)
+    for msg in history:
+        digest.update(f"{msg['id']}:{msg['role']}\0".encode('utf-8'))
+    return len(history), digest.hexdigest()
+
+
+class SentimentCache:
+    """
+    Sentiment results keyed by session and history fingerprint, with TTL and
+    LRU eviction. A lookup only hits when the conversation is unchanged.
+    """
+
+    def __init__(self, max_entries=1000, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # session_id -> (fingerprint, result, stored_at)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_id, fingerprint):
+        with self.lock:
+            entry = self.entries.get(session_id)
+            if entry is not None and time.monotonic() - entry[2] > self.ttl:
+                del self.entries[session_id]
+                entry = None
+            if entry is None or entry[0] != fingerprint:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(session_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, session_id, fingerprint, result):
+        with self.lock:
+            self.entries[session_id] = (fingerprint, result, time.monotonic())
+            self.entries.move_to_end(session_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, session_id):
+        with self.lock:
+            self.entries.pop(session_id, None)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "llm_calls_saved": self.hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+sentiment_cache = SentimentCache(
+    max_entries=getattr(settings, 'SENTIMENT_CACHE_SIZE', 1000),
+    ttl=getattr(settings, 'SENTIMENT_CACHE_TTL', 600),
+)
+
+
+def cached_sentiment(session_id, history):
+    """
+    (fingerprint, previous result or None): a result is only reused while the
+    conversation is unchanged, so every new message gets analyzed and published.
+    """
+    fingerprint = history_fingerprint(history)
+    return fingerprint, sentiment_cache.get(session_id, fingerprint)
+
+
+def store_sentiment(manager, session_id, fingerprint, result):
+    """ Records a successful analysis; failures must not reach here, or they would be cached and published """
+    manager.update_last_sentiment_analysis(session_id)
+    manager.update_sentiment_data(session_id, result)
+    sentiment_cache.put(session_id, fingerprint, result)
+    sentiment_updates.publish(session_id, result)
+
+
+class SentimentUpdates:
+    """
+    Latest screening row per session, versioned so listeners can ask for
+    everything that changed since the version they last saw.
+
+    A row is only published (and listeners woken) when its sentiment or level
+    differs from the previous one. Sync listeners block on ``wait``; async
+    listeners ``await_since`` without holding a thread.
+    """
+
+    def __init__(self, max_sessions=1000):
+        self.max_sessions = max_sessions
+        self.rows = OrderedDict()  # session_id -> (version, row), oldest change first
+        self.version = 0
+        self.condition = threading.Condition()
+        self.waiters = set()  # (event loop, future) of async listeners
+        self.published = 0
+        self.unchanged = 0
+
+    def publish(self, session_id, row):
+        """ Records row for session_id; returns False when nothing a listener shows has changed """
+        with self.condition:
+            previous = self.rows.get(session_id)
+            if previous is not None and (previous[1]['sentiment'], previous[1]['level']) == (row['sentiment'], row['level']):
+                self.unchanged += 1
+                return False
+            self.version += 1
+            self.rows[session_id] = (self.version, row)
+            self.rows.move_to_end(session_id)
+            while len(self.rows) > self.max_sessions:
+                self.rows.popitem(last=False)
+            self.published += 1
+            self.condition.notify_all()
+            waiters, self.waiters = self.waiters, set()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(self.wake, future)
+        return True
+
+    @staticmethod
+    def wake(future):
+        if not future.done():
+            future.set_result(None)
+
+    def since(self, version):
+        """ ([(version, session_id, row)] changed after version, current version) """
+        with self.condition:
+            changes = [(v, session_id, row) for session_id, (v, row) in self.rows.items() if v > version]
+            return changes, self.version
+
+    def wait(self, version, timeout):
+        """ Blocks until something changes after version or timeout passes, then returns since(version) """
+        with self.condition:
+            self.condition.wait_for(lambda: self.version > version, timeout)
+        return self.since(version)
+
+    async def await_since(self, version, timeout):
+        """ Async wait: the listener only holds a future while it waits """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.condition:
+            if self.version > version:
+                future.set_result(None)
+            else:
+                self.waiters.add((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.condition:
+                self.waiters.discard((loop, future))
+        return self.since(version)
+
+    def stats(self):
+        with self.condition:
+            return {
+                "version": self.version,
+                "sessions": len(self.rows),
+                "published": self.published,
+                "unchanged": self.unchanged,
+                "async_listeners": len(self.waiters),
+            }
+
+
+sentiment_updates = SentimentUpdates()
+
+
+lexicon_scorer = LexiconScorer(min_confidence=getattr(settings, 'SENTIMENT_PRESCORE_CONFIDENCE', 0.7))
+
+
+def user_text(messages):
+    return "\n".join(msg['content'] for msg in messages if msg['role'] == "user")
+
+
+def prescore(messages):
+    """
+    (sentiment, intensity) from the local lexicon scorer when it is confident
+    and no high-risk terms appear; None means the LLM has to decide.
+    """
+    if not getattr(settings, 'SENTIMENT_PRESCORE', True):
+        return None
+    result = lexicon_scorer.score(user_text(messages))
+    return None if result.escalate else (result.sentiment, result.intensity)
+
+
+def prescore_sessions(pending):
+    """ prescore for every pending_sessions entry with new messages, in one vectorized pass """
+    if not getattr(settings, 'SENTIMENT_PRESCORE', True):
+        return {}
+    pending = [entry for entry in pending if entry[2]]
+    scores = lexicon_scorer.score_many([user_text(messages) for _, _, messages, _ in pending])
+    return {
+        session_id: (result.sentiment, result.intensity)
+        for (session_id, _, _, _), result in zip(pending, scores) if not result.escalate
+    }
+
+
+class SentimentState:
+    """
+    Rolling sentiment of one session: the running score, a compact summary,
+    and the id of the last message already analyzed. States are never mutated,
+    so a reader can keep one while a newer analysis replaces it.
+    """
+
+    __slots__ = ('last_message_id', 'messages', 'sentiment', 'intensity', 'summary')
+
+    def __init__(self, last_message_id, messages, sentiment, intensity, summary=None):
+        self.last_message_id = last_message_id
+        self.messages = messages  # Messages folded into the score so far
+        self.sentiment = sentiment
+        self.intensity = intensity
+        self.summary = summary
+
+
+def new_messages(state, history):
+    """ Messages added since state was computed, capped so the prompt size stays bounded """
+    if state is None:
+        delta = list(history)
+    else:
+        delta = [msg for msg in history if msg['id'] > state.last_message_id]
+    limit = getattr(settings, 'SENTIMENT_DELTA_MAX_MESSAGES', 20)
+    return delta[-limit:] if limit else delta
+
+
+def incremental_prompt(state, delta):
+    if state is None:
+        return "Previous assessment: none\n\nNew messages:\n" + history_to_text(delta)
+    return (
+        f"Previous assessment ({state.messages} messages): "
+        f"Sentiment: {state.sentiment}, Intensity: {state.intensity}%\n"
+        f"Summary so far: {state.summary or 'none'}\n\n"
+        "New messages:\n" + history_to_text(delta)
+    )
+
+
+def merge_sentiment(state, delta, sentiment, intensity, summary=None):
+    """ Folds the update for delta into the running state """
+    last_message_id = delta[-1]['id']
+    if state is None:
+        return SentimentState(last_message_id, len(delta), sentiment, intensity, summary)
+
+    # Weight the update by how much of the (recent) conversation it covers
+    memory = min(state.messages, getattr(settings, 'SENTIMENT_STATE_MEMORY', 10))
+    weight = len(delta) / (len(delta) + memory)
+    return SentimentState(
+        last_message_id,
+        state.messages + len(delta),
+        state.sentiment if sentiment == "Unknown" else sentiment,
+        round(state.intensity * (1 - weight) + intensity * weight),
+        summary or state.summary,
+    )
+
+
+def get_incremental_sentiment(state, history):
+    """ Returns the state updated with the messages history has gained since state, or None if the model failed """
+    delta = new_messages(state, history)
+    if not delta:
+        return state
+    local = prescore(delta)
+    if local is not None:
+        return merge_sentiment(state, delta, *local)
+    try:
+        llm_backend = get_backend()
+        if llm_backend is None:
+            return None
+
+        response_text = llm_backend.generate(
+            incremental_prompt(state, delta), system_instruction=INCREMENTAL_SENTIMENT_SYSTEM_PROMPT
+        )
+        return merge_sentiment(state, delta, *parse_sentiment(response_text), parse_summary(response_text))
+
+    except Exception as e:
+        logger.error(f"Error in get_incremental_sentiment: {str(e)}")
+        return None
+
+
+async def aget_incremental_sentiment(state, history):
+    delta = new_messages(state, history)
+    if not delta:
+        return state
+    local = prescore(delta)
+    if local is not None:
+        return merge_sentiment(state, delta, *local)
+    try:
+        llm_backend = get_backend()
+        if llm_backend is None:
+            return None
+
+        response_text = await llm_backend.agenerate(
+            incremental_prompt(state, delta), system_instruction=INCREMENTAL_SENTIMENT_SYSTEM_PROMPT
+        )
+        return merge_sentiment(state, delta, *parse_sentiment(response_text), parse_summary(response_text))
+
+    except Exception as e:
+        logger.error(f"Error in aget_incremental_sentiment: {str(e)}")
+        return None
+
+
+def analyze_history(manager, session_id, history):
+    """
+    (sentiment, level) for history, incrementally when settings.SENTIMENT_INCREMENTAL is on.
+    None when the model failed, so the caller can retry instead of caching a placeholder.
+    """
+    if not getattr(settings, 'SENTIMENT_INCREMENTAL', True):
+        return prescore(history) or get_sentiment(history_to_text(history))
+
+    state = get_incremental_sentiment(manager.get_sentiment_state(session_id), history)
+    if state is None:
+        return None
+    manager.update_sentiment_state(session_id, state)
+    return state.sentiment, state.intensity
+
+
+async def aanalyze_history(manager, session_id, history):
+    """ Async counterpart of analyze_history """
+    if not getattr(settings, 'SENTIMENT_INCREMENTAL', True):
+        return prescore(history) or await aget_sentiment(history_to_text(history))
+
+    state = await aget_incremental_sentiment(manager.get_sentiment_state(session_id), history)
+    if state is None:
+        return None
+    manager.update_sentiment_state(session_id, state)
+    return state.sentiment, state.intensity
+
+
+def batch_prompt(transcripts):
+    return json.dumps([{"id": key, "transcript": text} for key, text in transcripts])
+
+
+def parse_batch_sentiment(response_text, keys):
+    """
+    Maps each id in keys to (sentiment, intensity) from a BATCH_SENTIMENT_SCHEMA
+    response. Malformed or missing entries, and labels outside SENTIMENT_LABELS,
+    are left out so they can be retried.
+    """
+    try:
+        items = json.loads(response_text)
+    except ValueError:
+        logger.error("Batch sentiment response is not valid JSON")
+        return {}
+
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        try:
+            key = str(item["id"])
+            intensity = int(item["intensity"])
+            sentiment = normalize_sentiment(str(item["sentiment"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if key in keys and sentiment and 0 <= intensity <= 100:
+            results[key] = (sentiment, intensity)
+    return results
+
+
+def batches(transcripts):
+    size = max(1, getattr(settings, 'SENTIMENT_BATCH_SIZE', 20))
+    for i in range(0, len(transcripts), size):
+        yield transcripts[i:i + size]
+
+
+def get_sentiments(transcripts):
+    """
+    Scores many (key, transcript text) pairs with one LLM request per batch of
+    SENTIMENT_BATCH_SIZE, falling back to get_sentiment for whatever a batch
+    response leaves out. Returns {key: (sentiment, intensity)}; keys the model
+    could not score are left out.
+    """
+    llm_backend = get_backend()
+
+    def score_batch(batch):
+        try:
+            if llm_backend is None:
+                return {}
+            response_text = llm_backend.generate(
+                batch_prompt(batch),
+                system_instruction=BATCH_SENTIMENT_SYSTEM_PROMPT,
+                generation_config=BATCH_GENERATION_CONFIG,
+            )
+            return parse_batch_sentiment(response_text, {key for key, _ in batch})
+        except Exception as e:
+            logger.error(f"Error in get_sentiments: {str(e)}")
+            return {}
+
+    # Batches and fallbacks are independent round-trips, so they share the bounded LLM pool
+    results = {}
+    for batch_results in get_executor().map(score_batch, list(batches(transcripts))):
+        results.update(batch_results)
+
+    missing = [(key, text) for key, text in transcripts if key not in results]
+    for (key, _), result in zip(missing, get_executor().map(get_sentiment, [text for _, text in missing])):
+        if result is not None:
+            results[key] = result
+    return results
+
+
+async def aget_sentiments(transcripts):
+    """ Async counterpart of get_sentiments; batches and fallbacks run concurrently """
+    llm_backend = get_backend()
+
+    async def score_batch(batch):
+        try:
+            if llm_backend is None:
+                return {}
+            response_text = await llm_backend.agenerate(
+                batch_prompt(batch),
+                system_instruction=BATCH_SENTIMENT_SYSTEM_PROMPT,
+                generation_config=BATCH_GENERATION_CONFIG,
+            )
+            return parse_batch_sentiment(response_text, {key for key, _ in batch})
+        except Exception as e:
+            logger.error(f"Error in aget_sentiments: {str(e)}")
+            return {}
+
+    results = {}
+    for batch_results in await asyncio.gather(*[score_batch(batch) for batch in batches(transcripts)]):
+        results.update(batch_results)
+
+    missing = [(key, text) for key, text in transcripts if key not in results]
+    fallbacks = await asyncio.gather(*[aget_sentiment(text) for _, text in missing])
+    for (key, _), result in zip(missing, fallbacks):
+        if result is not None:
+            results[key] = result
+    return results
+
+
+def pending_sessions(manager, session_ids, rows):
+    """
+    Fills rows from the sentiment cache; returns (session_id, fingerprint,
+    messages, state) for the sessions still to score. With
+    settings.SENTIMENT_INCREMENTAL, messages are only those after the session's
+    SentimentState, so batch and per-request scoring advance the same state.
+    """
+    incremental = getattr(settings, 'SENTIMENT_INCREMENTAL', True)
+    pending = []
+    for session_id in session_ids:
+        history = manager.get_chat_history(session_id)
+        if not history:
+            continue
+        fingerprint, sentiment_data = cached_sentiment(session_id, history)
+        if sentiment_data is not None:
+            rows[session_id] = sentiment_data
+            continue
+        state = manager.get_sentiment_state(session_id) if incremental else None
+        # Recent turns only, so one long conversation cannot crowd out a batch
+        pending.append((session_id, fingerprint, new_messages(state, history), state))
+    return pending
+
+
+def pending_transcripts(pending, results):
+    """ (session_id, transcript text) for the pending sessions results does not cover yet """
+    incremental = getattr(settings, 'SENTIMENT_INCREMENTAL', True)
+    return [
+        (session_id, incremental_prompt(state, messages) if incremental else history_to_text(messages))
+        for session_id, _, messages, state in pending if session_id not in results
+    ]
+
+
+def current_results(pending):
+    """ Results for sessions whose state already covers every message, e.g. after their cache entry expired """
+    return {
+        session_id: (state.sentiment, state.intensity)
+        for session_id, _, messages, state in pending if not messages and state is not None
+    }
+
+
+def store_session_results(manager, pending, results, usernames, rows):
+    """ Stores what was scored; returns the ids that failed, which keep their last result (if any) uncached """
+    failed = []
+    for session_id, fingerprint, messages, state in pending:
+        if session_id not in results:
+            failed.append(session_id)
+            previous = manager.get_sentiment_data(session_id)
+            if previous is not None:
+                rows[session_id] = previous
+            continue
+        sentiment, level = results[session_id]
+        if messages and getattr(settings, 'SENTIMENT_INCREMENTAL', True):
+            state = merge_sentiment(state, messages, sentiment, level)
+            manager.update_sentiment_state(session_id, state)
+            sentiment, level = state.sentiment, state.intensity
+        sentiment_data = build_sentiment_data(session_id, usernames.get(session_id, "Guest"), sentiment, level)
+        store_sentiment(manager, session_id, fingerprint, sentiment_data)
+        rows[session_id] = sentiment_data
+    return failed
+
+
+def analyze_sessions(manager, session_ids, usernames=None, failed=None):
+    """
+    Screening rows for many sessions, scoring the uncached ones in batched LLM
+    requests. Sessions the model failed to score are appended to ``failed``.
+    """
+    rows = {}
+    pending = pending_sessions(manager, session_ids, rows)
+    if pending:
+        results = current_results(pending)
+        results.update(prescore_sessions(pending))
+        results.update(get_sentiments(pending_transcripts(pending, results)))
+        failures = store_session_results(manager, pending, results, usernames or {}, rows)
+        if failed is not None:
+            failed.extend(failures)
+    return [rows[session_id] for session_id in session_ids if session_id in rows]
+
+
+async def aanalyze_sessions(manager, session_ids, usernames=None):
+    """ Async counterpart of analyze_sessions; the store reads and writes run off the event loop """
+    rows = {}
+    pending = await sync_to_async(pending_sessions)(manager, session_ids, rows)
+    if pending:
+        results = current_results(pending)
+        results.update(prescore_sessions(pending))
+        results.update(await aget_sentiments(pending_transcripts(pending, results)))
+        await sync_to_async(store_session_results)(manager, pending, results, usernames or {}, rows)
+    return [rows[session_id] for session_id in session_ids if session_id in rows]
+
+
+def get_session_usernames(session_ids):
+    """ Maps chat session ids to usernames; logged-in users' sessions are keyed by user id """
+    user_ids = [int(session_id) for session_id in session_ids if session_id.isdigit()]
+    usernames = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+    return {
+        session_id: usernames.get(int(session_id), "Guest") if session_id.isdigit() else "Guest"
+        for session_id in session_ids
+    }
+
+
+class SentimentWorker:
+    """
+    Background thread that keeps sentiment results precomputed.
+
+    It listens to ChatSessionManager.add_message. Each changed session is
+    debounced: it is scored once no message has arrived for ``debounce``
+    seconds, or at most ``max_delay`` seconds after its first pending change.
+    Due sessions are scored together through analyze_sessions. At most
+    ``max_pending`` sessions can wait; changes to further sessions are dropped
+    and counted until the backlog drains. A session the model fails to score
+    is retried at most ``max_retries`` times, with exponential backoff.
+    """
+
+    def __init__(self, manager, debounce=5.0, max_delay=30.0, max_pending=1000, batch_size=20, max_retries=3):
+        self.manager = manager
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.pending = OrderedDict()  # session_id -> (due, first change)
+        self.attempts = {}  # session_id -> failed attempts in a row
+        self.condition = threading.Condition()
+        self.thread = None
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.processed = 0
+        self.batches = 0
+        self.errors = 0
+        self.retried = 0
+        self.abandoned = 0
+        self.max_depth = 0
+        self.last_batch_seconds = 0.0
+        manager.add_listener(self.notify)
+
+    def notify(self, session_id, role=None):
+        """ Records that session_id changed; returns False when the queue is full """
+        now = time.monotonic()
+        with self.condition:
+            entry = self.pending.get(session_id)
+            if entry is not None:
+                first_change = entry[1]
+                self.coalesced += 1
+            elif len(self.pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            else:
+                first_change = now
+                self.enqueued += 1
+            self.pending[session_id] = (min(now + self.debounce, first_change + self.max_delay), first_change)
+            self.max_depth = max(self.max_depth, len(self.pending))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='sentiment-worker', daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return True
+
+    def pop_due(self, now):
+        """ Removes and returns up to batch_size sessions whose debounce has elapsed """
+        due = [session_id for session_id, (deadline, _) in self.pending.items() if deadline <= now]
+        due = due[:self.batch_size]
+        for session_id in due:
+            del self.pending[session_id]
+        return due
+
+    def next_deadline(self):
+        return min((deadline for deadline, _ in self.pending.values()), default=None)
+
+    def retry(self, session_ids):
+        """
+        Re-queues sessions the model failed to score, backing off per session;
+        a session is given up on after max_retries attempts, or straight away
+        when no backend is configured, until its next message.
+        """
+        give_up = get_backend() is None
+        now = time.monotonic()
+        with self.condition:
+            for session_id in session_ids:
+                attempts = self.attempts.get(session_id, 0) + 1
+                if give_up or attempts > self.max_retries:
+                    self.attempts.pop(session_id, None)
+                    self.abandoned += 1
+                    continue
+                self.attempts[session_id] = attempts
+                if session_id not in self.pending:  # A new message may already have re-queued it
+                    self.pending[session_id] = (now + self.debounce * 2 ** attempts, now)
+                    self.retried += 1
+            self.condition.notify()
+
+    def process(self, session_ids):
+        start = time.monotonic()
+        failed = []
+        try:
+            analyze_sessions(self.manager, session_ids, get_session_usernames(session_ids), failed=failed)
+        except Exception as e:
+            logger.error(f"Error in SentimentWorker: {str(e)}")
+            failed = list(session_ids)
+            with self.condition:
+                self.errors += 1
+        finally:
+            close_old_connections()  # The usernames query opened a connection on this thread
+        if failed:
+            self.retry(failed)  # Retried later rather than pinned to a placeholder
+        with self.condition:
+            for session_id in set(session_ids).difference(failed):
+                self.attempts.pop(session_id, None)
+            self.processed += len(session_ids)
+            self.batches += 1
+            self.last_batch_seconds = time.monotonic() - start
+
+    def run(self):
+        while True:
+            with self.condition:
+                now = time.monotonic()
+                due = self.pop_due(now)
+                if not due:
+                    deadline = self.next_deadline()
+                    self.condition.wait(None if deadline is None else max(0.0, deadline - now))
+                    continue
+            self.process(due)
+
+    def get_metrics(self):
+        """ Queue depth and throughput counters for monitoring """
+        with self.condition:
+            return {
+                "queue_depth": len(self.pending),
+                "max_depth": self.max_depth,
+                "capacity": self.max_pending,
+                "enqueued": self.enqueued,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "processed": self.processed,
+                "batches": self.batches,
+                "errors": self.errors,
+                "retried": self.retried,
+                "abandoned": self.abandoned,
+                "last_batch_ms": self.last_batch_seconds * 1000,
+            }
@@ -0,0 +1,507 @@
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+import atexit
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """
+    Durable chat history shared by every worker process.
+
+    Messages are plain dicts with ``id``, ``role``, ``content`` and ``created``
+    (a Unix timestamp). ChatSessionManager keeps its in-memory windows as a
+    per-worker read-through cache in front of the store.
+    """
+
+    name = 'base'
+
+    def append_many(self, batch):
+        """ Persists ``{session_id: [message, ...]}`` in as few round-trips as possible """
+        raise NotImplementedError
+
+    def load(self, session_id, since=None, limit=None):
+        """ Returns the newest ``limit`` messages created after ``since``, oldest first """
+        raise NotImplementedError
+
+    def page(self, session_id, before=None, limit=20):
+        """
+        Keyset page: the ``limit`` newest messages whose ``(created, id)`` sorts
+        before the ``before`` tuple, oldest first. The id breaks ties between
+        messages created in the same instant.
+        """
+        messages = self.load(session_id)
+        if before is not None:
+            messages = [msg for msg in messages if (msg['created'], msg['id']) < before]
+        return messages[-limit:]
+
+    def last_activity(self, session_id):
+        """ Unix timestamp of the session's newest message, or None """
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def purge_older_than(self, cutoff, limit=None):
+        """
+        Deletes messages created before ``cutoff``, at most ``limit`` of them
+        (oldest rows first) so callers can purge in short batches; returns the
+        number removed if known. Stores that expire messages themselves keep this.
+        """
+        return 0
+
+    def stats(self):
+        """ ``{"sessions": ..., "messages": ...}`` held by the store """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteSessionStore(SessionStore):
+    """ Durable store in a WAL-mode SQLite file, one connection per thread """
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        with self.connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS chat_messages ("
+                " session_id TEXT NOT NULL,"
+                " id INTEGER NOT NULL,"
+                " role TEXT NOT NULL,"
+                " content TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " PRIMARY KEY (session_id, id)"
+                ") WITHOUT ROWID"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS chat_messages_created ON chat_messages (created)")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS chat_messages_session_created ON chat_messages (session_id, created)"
+            )
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            # WAL lets readers in other workers proceed while a batch is being written
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def append_many(self, batch):
+        rows = [
+            (session_id, msg['id'], msg['role'], msg['content'], msg['created'])
+            for session_id, messages in batch.items()
+            for msg in messages
+        ]
+        with self.connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO chat_messages (session_id, id, role, content, created) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def load(self, session_id, since=None, limit=None):
+        rows = self.connection().execute(
+            "SELECT id, role, content, created FROM chat_messages"
+            " WHERE session_id = ? AND created >= ? ORDER BY id DESC LIMIT ?",
+            (session_id, since or 0, limit or -1),
+        ).fetchall()
+        return [
+            {'id': id, 'role': role, 'content': content, 'created': created}
+            for id, role, content, created in reversed(rows)
+        ]
+
+    def page(self, session_id, before=None, limit=20):
+        created, message_id = before if before is not None else (float('inf'), 0)
+        rows = self.connection().execute(
+            "SELECT id, role, content, created FROM chat_messages"
+            " WHERE session_id = ? AND (created < ? OR (created = ? AND id < ?))"
+            " ORDER BY created DESC, id DESC LIMIT ?",
+            (session_id, created, created, message_id, limit),
+        ).fetchall()
+        return [
+            {'id': id, 'role': role, 'content': content, 'created': created}
+            for id, role, content, created in reversed(rows)
+        ]
+
+    def last_activity(self, session_id):
+        row = self.connection().execute(
+            "SELECT MAX(created) FROM chat_messages WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def delete(self, session_id):
+        with self.connection() as connection:
+            connection.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
+
+    def purge_older_than(self, cutoff, limit=None):
+        with self.connection() as connection:
+            return connection.execute(
+                # The created index serves the oldest-first scan
+                "DELETE FROM chat_messages WHERE (session_id, id) IN "
+                "(SELECT session_id, id FROM chat_messages WHERE created < ? ORDER BY created LIMIT ?)",
+                (cutoff, -1 if limit is None else limit),
+            ).rowcount
+
+    def stats(self):
+        sessions, messages = self.connection().execute(
+            "SELECT COUNT(DISTINCT session_id), COUNT(*) FROM chat_messages"
+        ).fetchone()
+        return {"sessions": sessions, "messages": messages}
+
+    def close(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+
+class DatabaseSessionStore(SessionStore):
+    """ Store on the Django database through the ChatMessage model """
+
+    name = 'database'
+
+    @staticmethod
+    def to_message(row):
+        return {'id': row.message_id, 'role': row.role, 'content': row.content, 'created': row.created_at.timestamp()}
+
+    def messages(self, session_id):
+        from .models import ChatMessage
+
+        return ChatMessage.objects.filter(session_id=session_id)
+
+    def append_many(self, batch):
+        from .models import ChatMessage
+
+        ChatMessage.objects.bulk_create([
+            ChatMessage(
+                session_id=session_id,
+                message_id=msg['id'],
+                role=msg['role'],
+                content=msg['content'],
+                created_at=datetime.fromtimestamp(msg['created'], tz=timezone.utc),
+            )
+            for session_id, messages in batch.items()
+            for msg in messages
+        ], batch_size=500)
+
+    def load(self, session_id, since=None, limit=None):
+        queryset = self.messages(session_id)
+        if since:
+            queryset = queryset.filter(created_at__gte=datetime.fromtimestamp(since, tz=timezone.utc))
+        queryset = queryset.order_by('-created_at', '-message_id')
+        if limit:
+            queryset = queryset[:limit]
+        return [self.to_message(row) for row in reversed(list(queryset))]
+
+    def page(self, session_id, before=None, limit=20):
+        queryset = self.messages(session_id)
+        if before is not None:
+            created_at = datetime.fromtimestamp(before[0], tz=timezone.utc)
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, message_id__lt=before[1]))
+        rows = list(queryset.order_by('-created_at', '-message_id')[:limit])
+        return [self.to_message(row) for row in reversed(rows)]
+
+    def last_activity(self, session_id):
+        latest = self.messages(session_id).aggregate(latest=Max('created_at'))['latest']
+        return latest.timestamp() if latest else None
+
+    def delete(self, session_id):
+        self.messages(session_id).delete()
+
+    def purge_older_than(self, cutoff, limit=None):
+        from .models import ChatMessage
+
+        expired = ChatMessage.objects.filter(created_at__lt=datetime.fromtimestamp(cutoff, tz=timezone.utc))
+        if limit is not None:
+            # Rows are inserted in time order, so the oldest primary keys are found first
+            pks = list(expired.order_by('pk').values_list('pk', flat=True)[:limit])
+            expired = ChatMessage.objects.filter(pk__in=pks)
+        deleted, _ = expired.delete()
+        return deleted
+
+    def stats(self):
+        from .models import ChatMessage
+
+        return ChatMessage.objects.aggregate(sessions=Count('session_id', distinct=True), messages=Count('pk'))
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnection:
+    """ Minimal RESP2 client: enough for the list commands the store uses, no extra dependency """
+
+    def __init__(self, host, port, db=0, password=None, timeout=5):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+        if password:
+            self.execute('AUTH', password)
+        if db:
+            self.execute('SELECT', db)
+
+    @staticmethod
+    def encode(args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise RedisError('Connection closed by server')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode('utf-8')
+        if kind == b'-':
+            raise RedisError(payload.decode('utf-8'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            count = int(payload)
+            if count < 0:
+                return None
+            return [self.read_reply() for _ in range(count)]
+        raise RedisError(f"Unexpected reply type {kind!r}")
+
+    def pipeline(self, commands):
+        """ Sends every command in one write and reads the replies in order """
+        self.sock.sendall(b''.join(self.encode(command) for command in commands))
+        return [self.read_reply() for _ in commands]
+
+    def execute(self, *args):
+        return self.pipeline([args])[0]
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Store on any Redis-protocol server. Each session is a list of JSON messages
+    whose TTL slides with activity, so idle sessions expire server-side.
+    """
+
+    name = 'redis'
+    key_prefix = 'chat:'
+
+    def __init__(self, url, ttl, max_messages=None):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.password = parsed.password
+        self.ttl = int(ttl)
+        self.max_messages = max_messages
+        self.local = threading.local()
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = RedisConnection(self.host, self.port, self.db, self.password)
+            self.local.connection = connection
+        return connection
+
+    def call(self, commands):
+        try:
+            return self.connection().pipeline(commands)
+        except (OSError, RedisError):
+            # Drop a broken connection so the next call reconnects
+            self.close()
+            raise
+
+    def append_many(self, batch):
+        commands = []
+        for session_id, messages in batch.items():
+            key = self.key_prefix + session_id
+            commands.append(['RPUSH', key] + [json.dumps(msg) for msg in messages])
+            if self.max_messages:
+                commands.append(['LTRIM', key, -self.max_messages, -1])
+            commands.append(['EXPIRE', key, self.ttl])
+        if commands:
+            self.call(commands)
+
+    def load(self, session_id, since=None, limit=None):
+        start = -limit if limit else 0
+        items = self.call([['LRANGE', self.key_prefix + session_id, start, -1]])[0] or []
+        messages = [json.loads(item) for item in items]
+        if since:
+            messages = [msg for msg in messages if msg['created'] >= since]
+        return messages
+
+    def last_activity(self, session_id):
+        item = self.call([['LINDEX', self.key_prefix + session_id, -1]])[0]
+        return json.loads(item)['created'] if item else None
+
+    def delete(self, session_id):
+        self.call([['DEL', self.key_prefix + session_id]])
+
+    def stats(self):
+        # SCAN walks the keyspace in steps, so the server is never blocked the way KEYS would block it
+        sessions = messages = 0
+        cursor = b'0'
+        while True:
+            cursor, keys = self.call([['SCAN', cursor, 'MATCH', self.key_prefix + '*', 'COUNT', 1000]])[0]
+            if keys:
+                sessions += len(keys)
+                messages += sum(self.call([['LLEN', key] for key in keys]))
+            if cursor in (b'0', '0'):
+                return {"sessions": sessions, "messages": messages}
+
+    def close(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            try:
+                connection.close()
+            except OSError:
+                pass
+            self.local.connection = None
+
+
+class BatchWriter:
+    """
+    Write-behind buffer: appends are grouped and flushed by one background
+    thread every ``interval`` seconds, or as soon as ``max_batch`` are pending.
+
+    A batch the store rejects is put back in front of newer appends and the
+    writer backs off exponentially (up to ``max_backoff`` seconds); after
+    ``max_retries`` failures in a row the batch is dropped and counted. close()
+    flushes what is left, and runs at interpreter exit.
+    """
+
+    def __init__(self, store, max_batch=100, interval=0.05, max_retries=5, max_backoff=5.0):
+        self.store = store
+        self.max_batch = max_batch
+        self.interval = interval
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.pending = {}
+        self.pending_count = 0
+        self.discarded = set()  # Sessions deleted while a flush was writing, so a failed batch can't revive them
+        self.flushed = 0
+        self.failures = 0  # Failed flushes in a row
+        self.dropped = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+
+    def add(self, session_id, message):
+        with self.condition:
+            self.pending.setdefault(session_id, []).append(message)
+            self.pending_count += 1
+            if self.pending_count >= self.max_batch:
+                self.condition.notify()
+            if self.thread is None and not self.closed:
+                self.thread = threading.Thread(target=self.run, name='chat-session-writer', daemon=True)
+                self.thread.start()
+                atexit.register(self.close)
+
+    def discard(self, session_id):
+        with self.condition:
+            self.pending_count -= len(self.pending.pop(session_id, []))
+            self.discarded.add(session_id)
+
+    def requeue(self, batch, count):
+        """ Puts a failed batch back ahead of anything appended since; returns False once it is dropped """
+        with self.condition:
+            self.failures += 1
+            if self.failures > self.max_retries:
+                self.dropped += count
+                self.failures = 0
+                return False
+            for session_id, messages in batch.items():
+                if session_id in self.discarded:
+                    continue
+                newer = self.pending.get(session_id, [])
+                self.pending[session_id] = messages + newer
+                self.pending_count += len(messages)
+            return True
+
+    def flush(self):
+        # flush_lock keeps batches in order when the writer thread and a caller flush at once
+        with self.flush_lock:
+            with self.condition:
+                batch, self.pending = self.pending, {}
+                count, self.pending_count = self.pending_count, 0
+                self.discarded.clear()
+            if not batch:
+                return
+            try:
+                self.store.append_many(batch)
+                with self.condition:
+                    self.flushed += count
+                    self.failures = 0
+            except Exception as e:
+                if self.requeue(batch, count):
+                    logger.error(f"Error flushing {count} chat messages to {self.store.name} store, will retry: {str(e)}")
+                else:
+                    logger.error(f"Dropping {count} chat messages after {self.max_retries} failed flushes to {self.store.name} store: {str(e)}")
+
+    def backoff(self):
+        return min(self.max_backoff, self.interval * 2 ** self.failures)
+
+    def run(self):
+        while True:
+            with self.condition:
+                if self.closed:
+                    return
+                if self.failures:
+                    # Appends don't cut a backoff short; only close() does
+                    self.condition.wait_for(lambda: self.closed, self.backoff())
+                elif self.pending_count < self.max_batch:
+                    self.condition.wait(self.interval)
+            self.flush()
+
+    def close(self):
+        """ Stops the writer thread and writes whatever is still buffered """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.flush()
+
+
+def create_store():
+    """ Builds the store named by settings.CHAT_SESSION_STORE; 'memory' (the default) means no store """
+    store_name = getattr(settings, 'CHAT_SESSION_STORE', 'memory')
+    if store_name == 'memory':
+        return None
+    if store_name == 'database':
+        return DatabaseSessionStore()
+    if store_name == 'sqlite':
+        path = getattr(settings, 'CHAT_SESSION_SQLITE_PATH', None) or os.path.join(settings.BASE_DIR, 'chat_sessions.sqlite3')
+        return SQLiteSessionStore(path)
+    if store_name == 'redis':
+        from .chat_session import ChatSessionManager
+
+        return RedisSessionStore(
+            getattr(settings, 'CHAT_SESSION_REDIS_URL', 'redis://localhost:6379/0'),
+            ttl=ChatSessionManager.message_window,
+            max_messages=getattr(settings, 'CHAT_HISTORY_MAX_MESSAGES', None),
+        )
+    raise ValueError(f"Unknown CHAT_SESSION_STORE: {store_name}")
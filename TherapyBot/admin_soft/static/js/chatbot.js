@@ -8,6 +8,7 @@ document.addEventListener("DOMContentLoaded", () => {
     const fileUploadButton = document.querySelector("#file-upload")
     const sendButton = document.querySelector("#send-message")
     const emojiPickerButton = document.querySelector("#emoji-picker")
+    const MAX_RETRY_AFTER = 15 // Seconds worth waiting silently before telling the user the service is busy
 
     // Create message element with dynamic classes and return it
     const createMessageElement = (content, isUser = false, attachment = null) => {
@@ -56,6 +57,51 @@ document.addEventListener("DOMContentLoaded", () => {
         return thinkingDiv
     }
 
+    // Render Server-Sent Events from /chat/stream/ into a bot message as tokens arrive
+    const renderStream = async (response, thinkingIndicator) => {
+        const reader = response.body.getReader()
+        const decoder = new TextDecoder()
+        let buffer = ""
+        let messageText = null
+
+        const handleEvent = (frame) => {
+            let event = "message"
+            let data = ""
+            frame.split("\n").forEach((line) => {
+                if (line.startsWith("event:")) event = line.slice(6).trim()
+                else if (line.startsWith("data:")) data += line.slice(5).trim()
+            })
+            if (event !== "token" || !data) return
+
+            if (!messageText) {
+                thinkingIndicator.remove()
+                const botMessageDiv = createMessageElement("", false)
+                chatBody.appendChild(botMessageDiv)
+                messageText = botMessageDiv.querySelector(".message-text")
+            }
+            messageText.textContent += JSON.parse(data).text
+            chatBody.scrollTop = chatBody.scrollHeight
+        }
+
+        while (true) {
+            const { value, done } = await reader.read()
+            if (done) break
+            buffer += decoder.decode(value, { stream: true })
+
+            let boundary = buffer.indexOf("\n\n")
+            while (boundary !== -1) {
+                handleEvent(buffer.slice(0, boundary))
+                buffer = buffer.slice(boundary + 2)
+                boundary = buffer.indexOf("\n\n")
+            }
+        }
+
+        if (!messageText) {
+            thinkingIndicator.remove()
+            throw new Error("Empty response")
+        }
+    }
+
     // Handle message submission
     const handleSubmit = async (e) => {
         e.preventDefault()
@@ -88,40 +134,56 @@ document.addEventListener("DOMContentLoaded", () => {
         const thinkingIndicator = addThinkingIndicator()
 
         try {
-            // Add retry logic for network issues
+            // Retry network failures with jittered backoff; a 429 is retried once, after the server's Retry-After
             let retries = 3;
+            let waitedForCapacity = false;
             let response;
 
-            while (retries > 0) {
+            while (true) {
                 try {
-                    response = await fetch("/chat/", {
+                    response = await fetch(chatBody.dataset.chatUrl || "/chat/stream/", {
                         method: "POST",
                         body: formData,
                         headers: {
                             "X-CSRFToken": getCookie("csrftoken"),
+                            "Accept": "text/event-stream",
                         },
                     });
-                    break; // If successful, exit the retry loop
                 } catch (networkError) {
                     retries--;
                     if (retries === 0) throw networkError;
-                    // Wait before retrying (exponential backoff)
-                    await new Promise(r => setTimeout(r, (3 - retries) * 1000));
+                    await new Promise(r => setTimeout(r, (3 - retries) * 1000 * (0.5 + Math.random())));
+                    continue;
                 }
+
+                if (response.status !== 429) break;
+                const retryAfter = parseInt(response.headers.get("Retry-After"), 10) || 5;
+                if (waitedForCapacity || retryAfter > MAX_RETRY_AFTER) {
+                    const busyError = new Error("Assistant busy");
+                    busyError.retryAfter = retryAfter;
+                    throw busyError;
+                }
+                waitedForCapacity = true;
+                await new Promise(r => setTimeout(r, retryAfter * 1000));
             }
 
-            const data = await response.json()
+            const contentType = response.headers.get("Content-Type") || ""
+            if (!contentType.includes("text/event-stream") || !response.body) {
+                const data = await response.json()
 
-            // Remove thinking indicator
-            thinkingIndicator.remove()
+                // Remove thinking indicator
+                thinkingIndicator.remove()
 
-            if (data.error) {
-                throw new Error(data.error)
-            }
+                if (data.error) {
+                    throw new Error(data.error)
+                }
 
-            // Add bot response
-            const botMessageDiv = createMessageElement(data.response, false)
-            chatBody.appendChild(botMessageDiv)
+                // Add bot response
+                const botMessageDiv = createMessageElement(data.response, false)
+                chatBody.appendChild(botMessageDiv)
+            } else {
+                await renderStream(response, thinkingIndicator)
+            }
         } catch (error) {
             console.error("Error:", error)
             thinkingIndicator.remove()
@@ -129,7 +191,9 @@ document.addEventListener("DOMContentLoaded", () => {
             // Provide more specific error messages
             let errorMessage = "Sorry, something went wrong. Please try again.";
 
-            if (error.message === "API quota exceeded. Please try again later.") {
+            if (error.retryAfter) {
+                errorMessage = `The service is currently busy. Please try again in about ${error.retryAfter} seconds.`;
+            } else if (error.message === "API quota exceeded. Please try again later.") {
                 errorMessage = "The service is currently busy. Please try again in a few minutes.";
             } else if (error.message === "Session error. Please refresh the page.") {
                 errorMessage = "Your session has expired. Please refresh the page to continue.";
@@ -148,6 +212,39 @@ document.addEventListener("DOMContentLoaded", () => {
         chatBody.scrollTop = chatBody.scrollHeight
     }
 
+    // Lazy-load older history when the user scrolls to the top of the chat
+    let historyCursor = chatBody.dataset.nextCursor
+    let loadingHistory = false
+
+    const loadOlderMessages = async () => {
+        if (!historyCursor || loadingHistory) return
+        loadingHistory = true
+        try {
+            const response = await fetch(`/api/chat_history/?before=${encodeURIComponent(historyCursor)}`)
+            const data = await response.json()
+            if (data.error) throw new Error(data.error)
+
+            // Insert after the greeting and keep the visible messages where they were
+            const anchor = chatBody.firstElementChild
+            const previousHeight = chatBody.scrollHeight
+            const fragment = document.createDocumentFragment()
+            data.messages.forEach((msg) => fragment.appendChild(createMessageElement(msg.content, msg.role === "user")))
+            chatBody.insertBefore(fragment, anchor ? anchor.nextSibling : null)
+            chatBody.scrollTop += chatBody.scrollHeight - previousHeight
+
+            historyCursor = data.next_cursor
+        } catch (error) {
+            console.error("Error loading chat history:", error)
+        } finally {
+            loadingHistory = false
+        }
+    }
+
+    chatBody.addEventListener("scroll", () => {
+        if (chatBody.scrollTop < 50) loadOlderMessages()
+    })
+    chatBody.scrollTop = chatBody.scrollHeight
+
     // Handle file selection
     fileInput.addEventListener("change", () => {
         const file = fileInput.files[0]
@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from admin_soft.utils import (
+    MENU_PERMISSIONS_VERSION_KEY, admin_sites_by_namespace, find_admin_site, get_admin_site, get_app_list,
+    get_menu_skeleton, get_permission_mask,
+)
+from unittest import mock
+
+
+def model_names(app_list):
+    return {model['object_name'] for app in app_list for model in app['models']}
+
+
+class AdminMenuCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user('staff', password='secret', is_staff=True)
+
+    def context(self, user=None):
+        request = RequestFactory().get('/admin/')
+        request.user = User.objects.get(pk=(user or self.user).pk)  # Fresh user: no cached Django perms
+        return {'request': request}
+
+    def test_skeleton_is_built_once_per_site(self):
+        self.assertIs(get_menu_skeleton(admin.site), get_menu_skeleton(admin.site))
+        entry = next(entry for entry in get_menu_skeleton(admin.site) if entry['model'] is User)
+        self.assertEqual(entry['urls']['admin_url'], '/admin/auth/user/')
+
+    def test_superuser_sees_every_registered_model(self):
+        superuser = User.objects.create_superuser('root', password='secret')
+        names = model_names(get_app_list(self.context(superuser)))
+        self.assertEqual(names, {model._meta.object_name for model in admin.site._registry})
+
+    def test_cached_mask_is_reused_until_permissions_change(self):
+        self.assertEqual(model_names(get_app_list(self.context())), set())
+        context = self.context()
+        with self.assertNumQueries(0):
+            self.assertEqual(model_names(get_app_list(context)), set())
+
+        self.user.user_permissions.add(Permission.objects.get(codename='view_user'))
+        self.assertEqual(model_names(get_app_list(self.context())), {'User'})
+
+    def test_logins_do_not_invalidate_masks(self):
+        version = cache.get_or_set(MENU_PERMISSIONS_VERSION_KEY, 1, None)
+        self.user.save(update_fields=['last_login'])
+        self.assertEqual(cache.get(MENU_PERMISSIONS_VERSION_KEY), version)
+        self.user.save()
+        self.assertEqual(cache.get(MENU_PERMISSIONS_VERSION_KEY), version + 1)
+
+    @override_settings(ADMIN_MENU_CACHE=False)
+    def test_masks_are_recomputed_when_the_cache_is_off(self):
+        skeleton = get_menu_skeleton(admin.site)
+        get_permission_mask(admin.site, skeleton, self.context()['request'])
+        request = self.context()['request']
+        with self.assertNumQueries(2):  # The user's own and group permissions
+            get_permission_mask(admin.site, skeleton, request)
+
+
+class AdminSiteLookupTests(TestCase):
+
+    # admin.site is a lazy proxy, so compare with assertEqual rather than assertIs
+
+    def setUp(self):
+        admin_sites_by_namespace.clear()
+
+    def test_admin_site_is_resolved_once_per_request(self):
+        request = RequestFactory().get('/admin/auth/user/')
+        with mock.patch('admin_soft.utils.find_admin_site', wraps=find_admin_site) as find:
+            self.assertEqual(get_admin_site({'request': request}), admin.site)
+            self.assertEqual(get_admin_site({'request': request}), admin.site)
+        self.assertEqual(find.call_count, 1)
+        self.assertEqual(request.admin_soft_site, admin.site)
+
+    def test_site_lookup_is_memoized_per_namespace(self):
+        self.assertEqual(find_admin_site(RequestFactory().get('/admin/')), admin.site)
+        self.assertIn((settings.ROOT_URLCONF, 'admin'), admin_sites_by_namespace)
+        with mock.patch('admin_soft.utils.reverse') as reverse:
+            self.assertEqual(find_admin_site(RequestFactory().get('/admin/auth/')), admin.site)
+        reverse.assert_not_called()
+
+    def test_requests_outside_the_admin_fall_back_to_the_default_site(self):
+        self.assertEqual(find_admin_site(RequestFactory().get('/no-such-page/')), admin.site)
+        self.assertEqual(get_admin_site({}), admin.site)
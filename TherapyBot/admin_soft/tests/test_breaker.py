@@ -0,0 +1,82 @@
+from django.test import SimpleTestCase
+from admin_soft.breaker import CircuitBreaker, CircuitOpen
+from admin_soft.scheduler import PRIORITY_INTERACTIVE, LLMScheduler, SchedulerSaturated
+import time
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def open_breaker(self, **kwargs):
+        breaker = CircuitBreaker(window=4, min_calls=4, open_seconds=0.05, **kwargs)
+        for _ in range(4):
+            breaker.record(True, 0.1, breaker.allow())
+        return breaker
+
+    def test_opens_on_failure_rate_and_fails_fast(self):
+        breaker = self.open_breaker()
+        self.assertEqual(breaker.stats()['state'], 'open')
+        with self.assertRaises(CircuitOpen):
+            breaker.allow()
+
+    def test_opens_on_slow_calls(self):
+        breaker = CircuitBreaker(window=4, min_calls=4, slow_seconds=1.0, slow_rate=0.5)
+        for seconds in (0.1, 2.0, 0.1, 2.0):
+            breaker.record(False, seconds, breaker.allow())
+        self.assertEqual(breaker.stats()['state'], 'open')
+
+    def test_successful_probe_closes(self):
+        breaker = self.open_breaker()
+        time.sleep(0.06)
+        probe = breaker.allow()
+        self.assertTrue(probe)
+        with self.assertRaises(CircuitOpen):
+            breaker.allow()  # Only one probe at a time
+        breaker.record(False, 0.1, probe)
+        self.assertEqual(breaker.stats()['state'], 'closed')
+        self.assertFalse(breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        breaker = self.open_breaker()
+        time.sleep(0.06)
+        breaker.record(True, 0.1, breaker.allow())
+        self.assertEqual(breaker.stats()['state'], 'open')
+        self.assertEqual(breaker.stats()['times_opened'], 2)
+
+    def test_results_of_calls_started_before_opening_are_ignored(self):
+        breaker = self.open_breaker()
+        time.sleep(0.06)
+        probe = breaker.allow()
+        breaker.record(False, 0.1, False)
+        self.assertEqual(breaker.stats()['state'], 'half_open')
+        breaker.record(False, 0.1, probe)
+        self.assertEqual(breaker.stats()['state'], 'closed')
+
+    def test_cancelled_probe_frees_the_slot(self):
+        breaker = self.open_breaker()
+        time.sleep(0.06)
+        breaker.cancel(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    def test_saturated_probe_is_handed_back(self):
+        breaker = self.open_breaker()
+        scheduler = LLMScheduler(max_in_flight=1, max_queue=0, breaker=breaker)
+        scheduler.acquire(PRIORITY_INTERACTIVE, 1, 1)
+        time.sleep(0.06)
+        with self.assertRaises(SchedulerSaturated):
+            scheduler.call(lambda: "ok", PRIORITY_INTERACTIVE, 1, 0.01)
+        scheduler.release(PRIORITY_INTERACTIVE, 0.0)
+        self.assertEqual(scheduler.call(lambda: "ok", PRIORITY_INTERACTIVE, 1, 1), "ok")
+        self.assertEqual(breaker.stats()['state'], 'closed')
+
+    def test_only_unhealthy_errors_count_as_failures(self):
+        breaker = CircuitBreaker(window=4, min_calls=4)
+        scheduler = LLMScheduler(max_retries=0, breaker=breaker)
+
+        def blocked():
+            raise ValueError("Response blocked")
+
+        for _ in range(4):
+            with self.assertRaises(ValueError):
+                scheduler.call(blocked, PRIORITY_INTERACTIVE, 1, 1)
+        self.assertEqual(breaker.stats()['state'], 'closed')
+        self.assertEqual(breaker.stats()['failure_rate'], 0.0)
@@ -0,0 +1,101 @@
+from django.test import SimpleTestCase, override_settings
+from admin_soft.chat_session import ChatSessionManager, MessageRecord, SessionReaper, SessionWindow
+import time
+
+
+class SessionReaperTests(SimpleTestCase):
+
+    def create_reaper(self):
+        expired = []
+        return SessionReaper(expired.append, ttl=60), expired
+
+    def test_due_sessions_expire_once_in_deadline_order(self):
+        reaper, _ = self.create_reaper()
+        reaper.touch('b', delay=20)
+        reaper.touch('a', delay=10)
+        self.assertEqual(reaper.pop_expired(time.monotonic() + 30), ['a', 'b'])
+        self.assertEqual(reaper.pop_expired(time.monotonic() + 30), [])
+        self.assertEqual(reaper.pending(), 0)
+
+    def test_touch_slides_the_deadline(self):
+        reaper, _ = self.create_reaper()
+        reaper.touch('session', delay=10)
+        reaper.touch('session', delay=50)
+        self.assertEqual(reaper.pop_expired(time.monotonic() + 30), [])
+        self.assertTrue(reaper.is_scheduled('session'))
+        self.assertEqual(len(reaper.heap), 1)  # Re-queued, not duplicated
+        self.assertEqual(reaper.pop_expired(time.monotonic() + 60), ['session'])
+
+    def test_cancelled_session_never_expires(self):
+        reaper, _ = self.create_reaper()
+        reaper.touch('session', delay=10)
+        reaper.cancel('session')
+        self.assertEqual(reaper.pop_expired(time.monotonic() + 30), [])
+        self.assertFalse(reaper.is_scheduled('session'))
+
+    def test_thread_expires_due_sessions(self):
+        reaper, expired = self.create_reaper()
+        reaper.touch('session', delay=0.01)
+        deadline = time.monotonic() + 5
+        while not expired and time.monotonic() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(expired, ['session'])
+
+    @override_settings(CHAT_SESSION_STORE='memory')
+    def test_expired_anonymous_session_is_deleted(self):
+        manager = ChatSessionManager()
+        manager.add_message('session', 'user', "hello")
+        manager.update_sentiment_data('session', {'sentiment': 'Happiness', 'level': 40})
+        manager.reaper.touch('session', delay=0.01)
+        deadline = time.monotonic() + 5
+        while manager.get_session_ids() and time.monotonic() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(manager.get_session_ids(), [])
+        self.assertIsNone(manager.get_sentiment_data('session'))
+
+
+class SessionWindowTests(SimpleTestCase):
+
+    def record(self, i, content="x" * 40, created=None):
+        return MessageRecord(i, 'user', content, created=created)
+
+    def test_message_cap_evicts_the_oldest(self):
+        window = SessionWindow()
+        for i in range(5):
+            window.append(self.record(i), max_messages=3)
+        self.assertEqual([msg.id for msg in window.get_snapshot()], [2, 3, 4])
+        self.assertEqual(window.tokens, 30)
+
+    def test_token_cap_keeps_at_least_the_newest_message(self):
+        window = SessionWindow()
+        window.append(self.record(1), max_tokens=15)
+        window.append(self.record(2), max_tokens=15)
+        self.assertEqual([msg.id for msg in window.get_snapshot()], [2])
+        window.append(self.record(3, content="x" * 400), max_tokens=15)
+        self.assertEqual([msg.id for msg in window.get_snapshot()], [3])
+
+    def test_aged_out_messages_are_evicted(self):
+        window = SessionWindow()
+        now = time.monotonic()
+        window.append(self.record(1, created=now - 100))
+        window.append(self.record(2, created=now))
+        window.evict_older_than(now - 50)
+        self.assertEqual([msg.id for msg in window.get_snapshot()], [2])
+        self.assertEqual(window.tokens, 10)
+
+    def test_snapshot_is_shared_until_the_window_changes(self):
+        window = SessionWindow()
+        window.append(self.record(1))
+        snapshot = window.get_snapshot()
+        self.assertIs(window.get_snapshot(), snapshot)
+        window.append(self.record(2))
+        self.assertIsNot(window.get_snapshot(), snapshot)
+        self.assertEqual(len(snapshot), 1)
+
+    @override_settings(CHAT_SESSION_STORE='memory', CHAT_HISTORY_MAX_MESSAGES=4)
+    def test_manager_history_is_capped(self):
+        manager = ChatSessionManager()
+        for i in range(10):
+            manager.add_message('session', 'user', f"message {i}")
+        self.assertEqual([msg['content'] for msg in manager.get_chat_history('session')],
+                         [f"message {i}" for i in range(6, 10)])
@@ -0,0 +1,77 @@
+from datetime import timedelta
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from admin_soft.models import ChatMessage
+from admin_soft.session_store import DatabaseSessionStore, SQLiteSessionStore
+from io import StringIO
+import os
+import shutil
+import tempfile
+import time
+
+
+def old_messages(count, age, start=0):
+    created = time.time() - age
+    return [{'id': start + i, 'role': 'user', 'content': f"message {i}", 'created': created} for i in range(count)]
+
+
+class CleanSessionsTests(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key=f"expired{i}", session_data='', expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key='live', session_data='', expire_date=now + timedelta(days=1))
+
+    def clean(self, **options):
+        out = StringIO()
+        call_command('clean_sessions', stdout=out, sleep=0, **options)
+        return out.getvalue()
+
+    def test_expired_sessions_are_deleted_in_batches(self):
+        output = self.clean(batch_size=2, skip_chat=True)
+        self.assertIn('deleted 5 expired sessions in 3 batches', output)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+
+    def test_limit_stops_early(self):
+        self.clean(batch_size=2, limit=3, skip_chat=True)
+        self.assertEqual(Session.objects.count(), 3)
+
+    def test_dry_run_only_counts(self):
+        self.assertIn('5 expired sessions would be deleted', self.clean(dry_run=True))
+        self.assertEqual(Session.objects.count(), 6)
+
+    @override_settings(CHAT_SESSION_STORE='database', CHAT_MESSAGE_RETENTION_DAYS=0)
+    def test_chat_history_is_kept_without_a_retention(self):
+        DatabaseSessionStore().append_many({'session': old_messages(3, age=365 * 24 * 60 * 60)})
+        self.assertIn('stored chat history is kept', self.clean())
+        self.assertEqual(ChatMessage.objects.count(), 3)
+
+    @override_settings(CHAT_SESSION_STORE='database', CHAT_MESSAGE_RETENTION_DAYS=30)
+    def test_chat_messages_past_the_retention_are_purged_in_batches(self):
+        store = DatabaseSessionStore()
+        store.append_many({'session': old_messages(5, age=31 * 24 * 60 * 60)})
+        store.append_many({'session': old_messages(2, age=60, start=100)})
+        output = self.clean(batch_size=2)
+        self.assertIn('5 messages older than 30 days purged from the database store', output)
+        self.assertEqual(sorted(ChatMessage.objects.values_list('message_id', flat=True)), [100, 101])
+
+
+class SQLitePurgeTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = SQLiteSessionStore(os.path.join(self.directory, 'chat_sessions.sqlite3'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_purge_deletes_at_most_limit_oldest_messages(self):
+        self.store.append_many({'a': old_messages(3, age=300), 'b': old_messages(2, age=200), 'c': old_messages(1, age=10)})
+        self.assertEqual(self.store.purge_older_than(time.time() - 100, limit=4), 4)
+        self.assertEqual(self.store.stats()['messages'], 2)
+        self.assertEqual(self.store.purge_older_than(time.time() - 100, limit=4), 1)
+        self.assertEqual(self.store.load('c')[0]['content'], "message 0")
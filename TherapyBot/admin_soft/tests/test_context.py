@@ -0,0 +1,82 @@
+from django.test import SimpleTestCase, override_settings
+from unittest import mock
+from admin_soft.chat_session import ChatSessionManager, ConversationSummary, MessageRecord
+from admin_soft.context import ContextCompactor, build_context
+from admin_soft.llm import FakeBackend, set_backend
+
+
+def make_history(count, content="x" * 40):
+    return tuple(MessageRecord(i, 'user' if i % 2 else 'model', f"{i} {content}") for i in range(1, count + 1))
+
+
+@override_settings(CHAT_SESSION_STORE='memory')
+class ContextCompactorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.manager = ChatSessionManager()
+
+    def create_compactor(self, **kwargs):
+        compactor = ContextCompactor(self.manager, **kwargs)
+        patcher = mock.patch.object(compactor, 'schedule_summary')
+        self.schedule_summary = patcher.start()
+        self.addCleanup(patcher.stop)
+        return compactor
+
+    def test_short_history_is_sent_verbatim(self):
+        compactor = self.create_compactor(keep_turns=3)
+        history = make_history(6)
+        self.assertEqual(len(compactor.build('session', history)), 6)
+        self.schedule_summary.assert_not_called()
+        self.assertEqual(compactor.stats()['compacted'], 0)
+
+    def test_enough_older_messages_schedule_a_summary(self):
+        compactor = self.create_compactor(keep_turns=2, summary_batch=3)
+        history = make_history(7)
+        compactor.build('session', history)
+        self.schedule_summary.assert_called_once_with('session', None, list(history[:3]))
+
+    def test_summary_replaces_the_messages_it_covers(self):
+        compactor = self.create_compactor(keep_turns=2, summary_batch=3)
+        self.manager.update_summary('session', ConversationSummary(4, "Worried about exams", 4))
+        history = compactor.build('session', make_history(9))
+        self.assertEqual(history[0]['parts'], ["Summary of our conversation so far: Worried about exams"])
+        self.assertEqual([msg['parts'][0].split()[0] for msg in history[2:]], ['5', '6', '7', '8', '9'])
+        self.schedule_summary.assert_not_called()
+
+    def test_budget_drops_the_oldest_messages_first(self):
+        compactor = self.create_compactor(keep_turns=10, token_budget=35)
+        history = compactor.build('session', make_history(6))
+        self.assertEqual([msg['parts'][0].split()[0] for msg in history], ['4', '5', '6'])
+        self.assertEqual(compactor.stats()['compacted'], 1)
+
+    def test_newest_message_is_kept_over_budget(self):
+        compactor = self.create_compactor(token_budget=1)
+        self.assertEqual(len(compactor.build('session', make_history(3))), 1)
+
+    def test_summarize_stores_the_rolling_summary(self):
+        backend = FakeBackend(latency=0, token_rate=0, responder=lambda prompt, system_instruction: "Exam stress")
+        set_backend(backend)
+        self.addCleanup(set_backend, None)
+        compactor = ContextCompactor(self.manager)
+        previous = ConversationSummary(2, "Started talking", 2)
+        compactor.summarize('session', previous, list(make_history(5))[2:])
+        summary = self.manager.get_summary('session')
+        self.assertEqual((summary.last_message_id, summary.text, summary.messages), (5, "Exam stress", 5))
+        self.assertEqual(compactor.stats()['summaries_in_flight'], 0)
+
+    def test_failed_summary_is_counted(self):
+        def responder(prompt, system_instruction):
+            raise OSError("Network down")
+
+        set_backend(FakeBackend(latency=0, token_rate=0, responder=responder))
+        self.addCleanup(set_backend, None)
+        compactor = ContextCompactor(self.manager)
+        with self.assertLogs('admin_soft.context', 'ERROR'):
+            compactor.summarize('session', None, list(make_history(3)))
+        self.assertIsNone(self.manager.get_summary('session'))
+        self.assertEqual(compactor.stats()['summary_errors'], 1)
+
+    @override_settings(CHAT_CONTEXT_COMPACTION=False)
+    def test_compaction_can_be_turned_off(self):
+        compactor = self.create_compactor(token_budget=1)
+        self.assertEqual(len(build_context(compactor, 'session', make_history(5))), 5)
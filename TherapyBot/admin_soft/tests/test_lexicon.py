@@ -0,0 +1,70 @@
+from django.test import SimpleTestCase, override_settings
+from admin_soft.lexicon import LexiconScorer
+from admin_soft.sentiment import prescore
+
+ANXIOUS = "I am so anxious and worried, I keep panicking and I am nervous all the time"
+NEUTRAL = "I went to the shop today and then I walked home and cooked dinner for my family"
+
+
+class LexiconScorerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.scorer = LexiconScorer()
+
+    def test_confident_text_is_answered_locally(self):
+        result = self.scorer.score(ANXIOUS)
+        self.assertEqual(result.sentiment, 'Anxiety')
+        self.assertGreater(result.intensity, 70)
+        self.assertFalse(result.escalate)
+
+    def test_high_risk_terms_always_escalate(self):
+        result = self.scorer.score(ANXIOUS + " and sometimes I want to die")
+        self.assertTrue(result.escalate)
+
+    def test_high_risk_terms_are_not_negated(self):
+        indices, _ = self.scorer.term_indices("I dont want to hurt myself")
+        self.assertTrue(self.scorer.high_risk[indices].any())
+
+    def test_clinical_categories_escalate(self):
+        result = self.scorer.score("my manic episodes and mood swings, I think I am bipolar")
+        self.assertEqual(result.sentiment, 'Bipolar')
+        self.assertTrue(result.escalate)
+
+    def test_negated_words_are_not_counted(self):
+        self.assertEqual(self.scorer.term_indices("I am not happy")[0], [])
+        self.assertEqual(len(self.scorer.term_indices("I am happy")[0]), 1)
+
+    def test_phrases_win_over_their_words(self):
+        indices, _ = self.scorer.term_indices("I had a panic attack")
+        self.assertEqual(indices, [self.scorer.vocabulary["panic attack"]])
+
+    def test_long_text_without_emotion_is_neutral(self):
+        result = self.scorer.score(NEUTRAL)
+        self.assertEqual((result.sentiment, result.intensity, result.escalate), ('Neutral', 50, False))
+
+    def test_short_text_without_emotion_escalates(self):
+        result = self.scorer.score("ok")
+        self.assertEqual(result.sentiment, 'Unknown')
+        self.assertTrue(result.escalate)
+
+    def test_score_many_matches_single_scores(self):
+        texts = [ANXIOUS, NEUTRAL, "ok", "I am so happy and excited today"]
+        self.assertEqual(self.scorer.score_many(texts), [self.scorer.score(text) for text in texts])
+        self.assertEqual(self.scorer.stats()['scored'], 2 * len(texts))
+
+
+class PrescoreTests(SimpleTestCase):
+
+    def messages(self, *contents):
+        return [{'id': i, 'role': 'user', 'content': content} for i, content in enumerate(contents)]
+
+    def test_only_user_turns_are_scored(self):
+        history = self.messages(ANXIOUS) + [{'id': 9, 'role': 'model', 'content': "I want to die"}]
+        self.assertEqual(prescore(history)[0], 'Anxiety')
+
+    def test_escalated_text_goes_to_the_llm(self):
+        self.assertIsNone(prescore(self.messages("ok")))
+
+    @override_settings(SENTIMENT_PRESCORE=False)
+    def test_prescore_can_be_turned_off(self):
+        self.assertIsNone(prescore(self.messages(ANXIOUS)))
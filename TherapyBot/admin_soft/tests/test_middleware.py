@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from admin_soft.middleware import SESSION_SAVED_AT_KEY, SessionRefreshMiddleware, WhiteNoiseMiddleware
+import threading
+import time
+
+
+class SessionRefreshMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.middleware = SessionRefreshMiddleware(lambda request: HttpResponse())
+
+    def saved_session(self, saved_ago=0):
+        session = SessionStore()
+        session['user'] = 'member'
+        session[SESSION_SAVED_AT_KEY] = int(time.time()) - saved_ago
+        session.save()
+        return SessionStore(session.session_key)
+
+    def respond(self, session, read=True):
+        request = RequestFactory().get('/')
+        request.session = session
+        if read:
+            session.get('user')
+        self.middleware(request)
+        return session
+
+    def test_untouched_session_is_not_loaded_or_saved(self):
+        session = self.respond(self.saved_session(), read=False)
+        self.assertFalse(session.accessed)
+        self.assertFalse(session.modified)
+
+    def test_recently_saved_session_is_not_saved_again(self):
+        self.assertFalse(self.respond(self.saved_session(saved_ago=60)).modified)
+
+    def test_session_is_refreshed_inside_the_window(self):
+        saved_ago = settings.SESSION_COOKIE_AGE - self.middleware.window + 60
+        session = self.respond(self.saved_session(saved_ago=saved_ago))
+        self.assertTrue(session.modified)
+        self.assertAlmostEqual(session[SESSION_SAVED_AT_KEY], time.time(), delta=5)
+
+    def test_session_without_a_timestamp_gets_one(self):
+        session = SessionStore()
+        session['user'] = 'member'
+        self.assertIn(SESSION_SAVED_AT_KEY, self.respond(session))
+
+    def test_browser_session_is_left_alone(self):
+        session = self.saved_session(saved_ago=settings.SESSION_COOKIE_AGE)
+        session.set_expiry(0)
+        saved_at = session[SESSION_SAVED_AT_KEY]
+        self.assertEqual(self.respond(session)[SESSION_SAVED_AT_KEY], saved_at)
+
+
+class WhiteNoiseMiddlewareTests(SimpleTestCase):
+
+    async def test_autorefresh_lookup_runs_off_the_event_loop(self):
+        async def get_response(request):
+            return HttpResponse('view')
+
+        with override_settings(WHITENOISE_AUTOREFRESH=True):
+            middleware = WhiteNoiseMiddleware(get_response)
+        threads = []
+
+        def find_file(url):
+            threads.append(threading.get_ident())
+
+        middleware.find_file = find_file
+        response = await middleware(RequestFactory().get('/static/missing.css'))
+        self.assertEqual(response.content, b'view')
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
@@ -0,0 +1,54 @@
+from django.test import SimpleTestCase, override_settings
+from admin_soft.chat_session import MessageRecord
+from admin_soft.response_cache import FirstTurnCache, create_response_cache, normalize_message
+import time
+
+
+class FirstTurnCacheTests(SimpleTestCase):
+
+    def test_messages_are_normalized(self):
+        self.assertEqual(normalize_message("  Hi,   there!! "), "hi there")
+
+    def test_only_first_turns_are_cacheable(self):
+        cache = FirstTurnCache()
+        self.assertEqual(cache.key("Hi!", ()), "hi")
+        self.assertIsNone(cache.key("Hi!", (MessageRecord(1, 'user', "hello"),)))
+
+    def test_high_risk_and_long_messages_are_never_cached(self):
+        cache = FirstTurnCache(max_message_chars=20)
+        self.assertIsNone(cache.key("I want to die", ()))
+        self.assertIsNone(cache.key("I have been feeling anxious about work lately", ()))
+        self.assertIsNone(cache.key("?!", ()))
+
+    def test_replies_are_served_once_the_variant_pool_is_full(self):
+        cache = FirstTurnCache(variants=2)
+        cache.add("hi", "Hello!")
+        self.assertIsNone(cache.get("hi"))
+        cache.add("hi", "Hi there!")
+        cache.add("hi", "Ignored once the pool is full")
+        self.assertIn(cache.get("hi"), ("Hello!", "Hi there!"))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['fills']), (1, 1, 2))
+
+    def test_keys_expire(self):
+        cache = FirstTurnCache(ttl=0.01, variants=1)
+        cache.add("hi", "Hello!")
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("hi"))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_least_recently_used_key_is_evicted(self):
+        cache = FirstTurnCache(max_entries=2, variants=1)
+        cache.add("a", "A")
+        cache.add("b", "B")
+        cache.get("a")
+        cache.add("c", "C")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "A")
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    @override_settings(CHAT_RESPONSE_CACHE=False)
+    def test_cache_is_opt_in(self):
+        self.assertIsNone(create_response_cache())
+        with override_settings(CHAT_RESPONSE_CACHE=True, CHAT_RESPONSE_CACHE_VARIANTS=5):
+            self.assertEqual(create_response_cache().variants, 5)
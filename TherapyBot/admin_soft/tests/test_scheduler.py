@@ -0,0 +1,96 @@
+from django.test import SimpleTestCase
+from admin_soft.scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, LLMScheduler, SchedulerSaturated
+import threading
+import time
+
+
+class QuotaError(Exception):
+    code = 429
+
+
+class LLMSchedulerTests(SimpleTestCase):
+
+    def test_interactive_calls_go_ahead_of_background(self):
+        scheduler = LLMScheduler(max_in_flight=1)
+        scheduler.acquire(PRIORITY_INTERACTIVE, 1, 1)
+        order = []
+
+        def waiter(priority):
+            scheduler.acquire(priority, 1, 5)
+            order.append(priority)
+            scheduler.release(priority, 0.0)
+
+        background = threading.Thread(target=waiter, args=(PRIORITY_BACKGROUND,))
+        background.start()
+        while scheduler.stats()['waiting'] < 1:
+            time.sleep(0.001)
+        interactive = threading.Thread(target=waiter, args=(PRIORITY_INTERACTIVE,))
+        interactive.start()
+        while scheduler.stats()['waiting'] < 2:
+            time.sleep(0.001)
+
+        scheduler.release(PRIORITY_INTERACTIVE, 0.0)
+        background.join(5)
+        interactive.join(5)
+        self.assertEqual(order, [PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND])
+
+    def test_background_share_leaves_slots_for_interactive(self):
+        scheduler = LLMScheduler(max_in_flight=2, background_share=0.5)
+        scheduler.acquire(PRIORITY_BACKGROUND, 1, 1)
+        with self.assertRaises(SchedulerSaturated):
+            scheduler.acquire(PRIORITY_BACKGROUND, 1, 0.01)
+        scheduler.acquire(PRIORITY_INTERACTIVE, 1, 0.01)
+        self.assertEqual(scheduler.stats()['in_flight'], 2)
+
+    def test_token_budget_rejects_with_retry_after(self):
+        scheduler = LLMScheduler(tokens_per_minute=100)
+        scheduler.acquire(PRIORITY_INTERACTIVE, 80, 1)
+        scheduler.release(PRIORITY_INTERACTIVE, 0.0)
+        with self.assertRaises(SchedulerSaturated) as raised:
+            scheduler.acquire(PRIORITY_INTERACTIVE, 50, 0.01)
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        self.assertEqual(scheduler.stats()['tokens_last_minute'], 80)
+
+    def test_full_queue_rejects_immediately(self):
+        scheduler = LLMScheduler(max_in_flight=1, max_queue=0)
+        scheduler.acquire(PRIORITY_INTERACTIVE, 1, 1)
+        start = time.monotonic()
+        with self.assertRaises(SchedulerSaturated):
+            scheduler.acquire(PRIORITY_INTERACTIVE, 1, 5)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_backoff_is_jittered_and_capped(self):
+        scheduler = LLMScheduler(backoff_base=0.5, backoff_max=8.0)
+        for attempt in range(8):
+            nominal = min(8.0, 0.5 * 2 ** attempt)
+            delay = scheduler.backoff(attempt)
+            self.assertGreaterEqual(delay, nominal * 0.5)
+            self.assertLessEqual(delay, nominal * 1.5)
+
+    def test_retryable_errors_are_retried(self):
+        scheduler = LLMScheduler(max_retries=3, backoff_base=0.001)
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise QuotaError("Resource exhausted")
+            return "ok"
+
+        self.assertEqual(scheduler.call(flaky, PRIORITY_INTERACTIVE, 1, 1), "ok")
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(scheduler.stats()['retries'], 2)
+        self.assertEqual(scheduler.stats()['in_flight'], 0)
+
+    def test_other_errors_fail_straight_away(self):
+        scheduler = LLMScheduler(max_retries=3, backoff_base=0.001)
+        attempts = []
+
+        def blocked():
+            attempts.append(1)
+            raise ValueError("Response blocked")
+
+        with self.assertRaises(ValueError):
+            scheduler.call(blocked, PRIORITY_INTERACTIVE, 1, 1)
+        self.assertEqual(len(attempts), 1)
+        self.assertEqual(scheduler.stats()['failures'], 1)
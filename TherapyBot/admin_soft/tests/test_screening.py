@@ -0,0 +1,117 @@
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from unittest import mock
+from admin_soft import views
+from admin_soft.sentiment import SentimentUpdates, build_sentiment_data, sentiment_updates
+import asyncio
+import threading
+
+
+def row(session_id, sentiment='Sadness', level=30):
+    return build_sentiment_data(session_id, "Guest", sentiment, level)
+
+
+class SentimentUpdatesTests(SimpleTestCase):
+
+    def test_only_visible_changes_are_published(self):
+        updates = SentimentUpdates()
+        self.assertTrue(updates.publish('a', row('a')))
+        self.assertFalse(updates.publish('a', row('a')))
+        self.assertTrue(updates.publish('a', row('a', level=60)))
+        self.assertEqual(updates.stats()['published'], 2)
+        self.assertEqual(updates.stats()['unchanged'], 1)
+
+    def test_since_returns_each_session_once_at_its_latest_version(self):
+        updates = SentimentUpdates()
+        updates.publish('a', row('a'))
+        updates.publish('b', row('b'))
+        updates.publish('a', row('a', level=60))
+        changes, current = updates.since(1)
+        self.assertEqual(current, 3)
+        self.assertEqual([(version, session_id) for version, session_id, _ in changes], [(2, 'b'), (3, 'a')])
+
+    def test_oldest_sessions_are_dropped_past_the_cap(self):
+        updates = SentimentUpdates(max_sessions=2)
+        for session_id in 'abc':
+            updates.publish(session_id, row(session_id))
+        self.assertEqual([session_id for _, session_id, _ in updates.since(0)[0]], ['b', 'c'])
+
+    def test_wait_wakes_on_publish(self):
+        updates = SentimentUpdates()
+        timer = threading.Timer(0.01, updates.publish, args=('a', row('a')))
+        timer.start()
+        changes, current = updates.wait(0, 5)
+        timer.join()
+        self.assertEqual(current, 1)
+
+    def test_await_since_wakes_on_publish_from_another_thread(self):
+        updates = SentimentUpdates()
+
+        async def listen():
+            loop = asyncio.get_running_loop()
+            loop.call_later(0.01, threading.Thread(target=updates.publish, args=('a', row('a'))).start)
+            return await updates.await_since(0, 5)
+
+        changes, current = asyncio.run(listen())
+        self.assertEqual((len(changes), current), (1, 1))
+        self.assertEqual(updates.stats()['async_listeners'], 0)
+
+
+class ScreeningStreamTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('member')
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+
+    def setUp(self):
+        # Levels change with the version so re-publishing a session is never suppressed as unchanged
+        self.version = sentiment_updates.since(0)[1]
+        sentiment_updates.publish(str(self.user.id), row(str(self.user.id), level=self.version % 100))
+        sentiment_updates.publish('anon_other', row('anon_other', level=self.version % 100))
+
+    def stream(self, user):
+        self.client.force_login(user)
+        return self.client.get('/api/screening/stream/', HTTP_LAST_EVENT_ID=str(self.version)).content.decode()
+
+    def test_requires_login(self):
+        self.assertEqual(self.client.get('/api/screening/stream/').status_code, 403)
+
+    def test_members_only_see_their_own_session(self):
+        content = self.stream(self.user)
+        self.assertIn(f'"id": "{self.user.id}"', content)
+        self.assertNotIn('anon_other', content)
+
+    def test_staff_see_every_session(self):
+        content = self.stream(self.staff)
+        self.assertIn(f'"id": "{self.user.id}"', content)
+        self.assertIn('anon_other', content)
+
+    def test_poll_answers_at_once_with_a_long_retry(self):
+        content = self.stream(self.staff)
+        self.assertTrue(content.startswith("retry: 30000\n\n"))
+
+    def test_reconnecting_scores_nothing(self):
+        with mock.patch('admin_soft.sentiment.get_sentiments') as get_sentiments, \
+                mock.patch('admin_soft.views.analyze_history') as analyze_history:
+            self.stream(self.staff)
+            self.stream(self.user)
+        get_sentiments.assert_not_called()
+        analyze_history.assert_not_called()
+
+    def test_page_streams_only_with_the_worker(self):
+        self.client.force_login(self.user)
+        with mock.patch('admin_soft.views.analyze_chat_sentiment', return_value=None):
+            self.assertContains(self.client.get('/screening/'), "window.EventSource && false")
+            with mock.patch('admin_soft.views.sentiment_worker', object()):
+                self.assertContains(self.client.get('/screening/'), "window.EventSource && true")
+
+    async def test_async_stream_waits_for_the_next_change(self):
+        request = RequestFactory().get('/api/screening/stream/', HTTP_LAST_EVENT_ID=str(self.version + 2))
+        request.user = self.staff
+        request.session = SessionStore()
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.01, sentiment_updates.publish, 'anon_async', row('anon_async', level=self.version % 100))
+        response = await views.async_screening_stream(request)
+        self.assertIn('anon_async', response.content.decode())
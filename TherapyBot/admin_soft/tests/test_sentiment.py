@@ -0,0 +1,355 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+from unittest import mock
+from admin_soft.chat_session import ChatSessionManager, MessageRecord
+from admin_soft.llm import FakeBackend, set_backend
+from admin_soft.session_store import DatabaseSessionStore
+from admin_soft.sentiment import (
+    BATCH_SENTIMENT_SYSTEM_PROMPT, SentimentCache, SentimentState, SentimentWorker, aanalyze_sessions, analyze_sessions,
+    get_incremental_sentiment, history_fingerprint, merge_sentiment, new_messages, parse_batch_sentiment, parse_sentiment,
+    sentiment_cache,
+)
+import json
+import time
+
+
+def make_history(count, start=1):
+    return tuple(
+        MessageRecord(i, 'user' if i % 2 else 'model', f"message {i}") for i in range(start, start + count)
+    )
+
+
+def use_fake_backend(test, responder):
+    """ Installs an instant FakeBackend for the rest of the test; returns it """
+    backend = FakeBackend(latency=0, token_rate=0, responder=responder)
+    set_backend(backend)
+    test.addCleanup(set_backend, None)
+    return backend
+
+
+class SentimentCacheTests(SimpleTestCase):
+
+    def test_fingerprint_changes_with_the_window(self):
+        history = make_history(3)
+        self.assertEqual(history_fingerprint(history), history_fingerprint(make_history(3)))
+        self.assertNotEqual(history_fingerprint(history), history_fingerprint(make_history(4)))
+        self.assertNotEqual(history_fingerprint(history), history_fingerprint(make_history(3, start=2)))
+
+    def test_hit_only_while_the_conversation_is_unchanged(self):
+        cache = SentimentCache()
+        cache.put('session', 'a', {'sentiment': 'Happiness'})
+        self.assertEqual(cache.get('session', 'a'), {'sentiment': 'Happiness'})
+        self.assertIsNone(cache.get('session', 'b'))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_entries_expire_after_ttl(self):
+        cache = SentimentCache(ttl=0.01)
+        cache.put('session', 'a', {})
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('session', 'a'))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = SentimentCache(max_entries=2)
+        cache.put('a', 1, {})
+        cache.put('b', 1, {})
+        cache.get('a', 1)
+        cache.put('c', 1, {})
+        self.assertIsNone(cache.get('b', 1))
+        self.assertIsNotNone(cache.get('a', 1))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    @override_settings(CHAT_SESSION_STORE='memory')
+    def test_deleting_a_session_invalidates_its_entry(self):
+        manager = ChatSessionManager()
+        manager.add_delete_listener(sentiment_cache.invalidate)
+        sentiment_cache.put('deleted-session', 'a', {})
+        manager.delete_session('deleted-session')
+        self.assertIsNone(sentiment_cache.get('deleted-session', 'a'))
+
+
+@override_settings(SENTIMENT_PRESCORE=False, SENTIMENT_DELTA_MAX_MESSAGES=20)
+class IncrementalSentimentTests(SimpleTestCase):
+
+    def test_new_messages_are_those_after_the_state(self):
+        history = make_history(5)
+        self.assertEqual([msg.id for msg in new_messages(None, history)], [1, 2, 3, 4, 5])
+        state = SentimentState(3, 3, 'Sadness', 40)
+        self.assertEqual([msg.id for msg in new_messages(state, history)], [4, 5])
+        with self.settings(SENTIMENT_DELTA_MAX_MESSAGES=2):
+            self.assertEqual([msg.id for msg in new_messages(None, history)], [4, 5])
+
+    def test_merge_weights_the_update_by_the_messages_it_covers(self):
+        state = merge_sentiment(None, make_history(10), 'Sadness', 20, "Low mood")
+        self.assertEqual((state.last_message_id, state.messages, state.intensity), (10, 10, 20))
+
+        merged = merge_sentiment(state, make_history(10, start=11), 'Happiness', 80)
+        self.assertEqual((merged.last_message_id, merged.messages), (20, 20))
+        self.assertEqual(merged.sentiment, 'Happiness')
+        self.assertEqual(merged.intensity, 50)
+        self.assertEqual(merged.summary, "Low mood")
+        self.assertEqual(state.intensity, 20)  # States are never mutated
+
+    def test_unknown_update_keeps_the_previous_sentiment(self):
+        state = SentimentState(10, 10, 'Anxiety', 60)
+        self.assertEqual(merge_sentiment(state, make_history(1, start=11), 'Unknown', 60).sentiment, 'Anxiety')
+
+    def test_only_new_turns_are_sent_with_the_previous_assessment(self):
+        prompts = []
+
+        def responder(prompt, system_instruction):
+            prompts.append(prompt)
+            return "Sentiment: Stress\nIntensity: 60%\nSummary: Busy week"
+
+        use_fake_backend(self, responder)
+        state = get_incremental_sentiment(None, make_history(4))
+        self.assertEqual((state.sentiment, state.intensity, state.summary), ('Stress', 60, "Busy week"))
+
+        history = make_history(6)
+        self.assertIs(get_incremental_sentiment(state, history[:4]), state)
+        self.assertEqual(len(prompts), 1)
+
+        updated = get_incremental_sentiment(state, history)
+        self.assertEqual(updated.last_message_id, 6)
+        self.assertIn("Previous assessment (4 messages): Sentiment: Stress, Intensity: 60%", prompts[1])
+        self.assertIn("Summary so far: Busy week", prompts[1])
+        self.assertNotIn("message 4", prompts[1])
+        self.assertIn("message 5", prompts[1])
+
+    def test_failed_update_returns_none(self):
+        def responder(prompt, system_instruction):
+            raise OSError("Network down")
+
+        use_fake_backend(self, responder)
+        with self.assertLogs('admin_soft.sentiment', 'ERROR'):
+            self.assertIsNone(get_incremental_sentiment(None, make_history(2)))
+
+
+class BatchResponder:
+    """ Answers batch prompts with one result per transcript, and single prompts in the text format """
+
+    def __init__(self, sentiment='sadness', intensity=30, skip=()):
+        self.sentiment = sentiment
+        self.intensity = intensity
+        self.skip = skip
+        self.batches = []
+        self.singles = []
+
+    def __call__(self, prompt, system_instruction):
+        if system_instruction != BATCH_SENTIMENT_SYSTEM_PROMPT:
+            self.singles.append(prompt)
+            return f"Sentiment: {self.sentiment}\nIntensity: {self.intensity}%"
+        items = json.loads(prompt)
+        self.batches.append(items)
+        return json.dumps([
+            {"id": item["id"], "sentiment": self.sentiment, "intensity": self.intensity}
+            for item in items if item["id"] not in self.skip
+        ])
+
+
+class ParseSentimentTests(SimpleTestCase):
+
+    def test_known_labels_are_normalized(self):
+        self.assertEqual(parse_sentiment("Sentiment: [anxiety]\nIntensity: 70%"), ('Anxiety', 70))
+        self.assertEqual(parse_sentiment("Sentiment: Personality Disorder\nIntensity: 40%"), ('Personality disorder', 40))
+
+    def test_other_labels_become_unknown(self):
+        response = 'Sentiment: <img src=x onerror="alert(1)">\nIntensity: 70%'
+        self.assertEqual(parse_sentiment(response), ('Unknown', 70))
+
+
+class ParseBatchSentimentTests(SimpleTestCase):
+
+    def test_results_are_mapped_by_id(self):
+        response = json.dumps([
+            {"id": "a", "sentiment": "sadness", "intensity": 30},
+            {"id": "b", "sentiment": "anger", "intensity": 70},
+        ])
+        self.assertEqual(parse_batch_sentiment(response, {'a', 'b'}), {'a': ('Sadness', 30), 'b': ('Anger', 70)})
+
+    def test_malformed_entries_are_left_out(self):
+        response = json.dumps([
+            {"id": "a", "sentiment": "sadness", "intensity": 130},
+            {"id": "b", "sentiment": "anger"},
+            {"id": "c", "sentiment": "fear", "intensity": "high"},
+            {"id": "unknown", "sentiment": "fear", "intensity": 40},
+            {"id": "e", "sentiment": "<script>alert(1)</script>", "intensity": 40},
+            "d",
+        ])
+        self.assertEqual(parse_batch_sentiment(response, {'a', 'b', 'c', 'd', 'e'}), {})
+
+    def test_invalid_json_scores_nothing(self):
+        with self.assertLogs('admin_soft.sentiment', 'ERROR'):
+            self.assertEqual(parse_batch_sentiment("Sentiment: sadness", {'a'}), {})
+
+
+@override_settings(CHAT_SESSION_STORE='memory', SENTIMENT_PRESCORE=False, SENTIMENT_BATCH_SIZE=2)
+class AnalyzeSessionsTests(SimpleTestCase):
+
+    def create_sessions(self, count, manager=None):
+        manager = manager or ChatSessionManager()
+        session_ids = [f"batch-{i}-{time.monotonic_ns()}" for i in range(count)]
+        for session_id in session_ids:
+            manager.add_message(session_id, 'user', "I feel low today")
+            manager.add_message(session_id, 'model', "I'm sorry to hear that")
+        return manager, session_ids
+
+    def test_sessions_are_scored_in_batches(self):
+        responder = BatchResponder()
+        use_fake_backend(self, responder)
+        manager, session_ids = self.create_sessions(5)
+        rows = analyze_sessions(manager, session_ids)
+        self.assertEqual([row['id'] for row in rows], session_ids)
+        self.assertEqual({row['sentiment'] for row in rows}, {'Sadness'})
+        self.assertEqual([len(batch) for batch in responder.batches], [2, 2, 1])
+        self.assertEqual(responder.singles, [])
+
+    def test_left_out_sessions_fall_back_to_single_requests(self):
+        manager, session_ids = self.create_sessions(2)
+        responder = BatchResponder(skip={session_ids[1]})
+        use_fake_backend(self, responder)
+        rows = analyze_sessions(manager, session_ids)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(len(responder.singles), 1)
+
+    def test_failed_sessions_are_reported_and_not_cached(self):
+        def responder(prompt, system_instruction):
+            raise OSError("Network down")
+
+        use_fake_backend(self, responder)
+        manager, session_ids = self.create_sessions(1)
+        failed = []
+        with self.assertLogs('admin_soft.sentiment', 'ERROR'):
+            self.assertEqual(analyze_sessions(manager, session_ids, failed=failed), [])
+        self.assertEqual(failed, session_ids)
+        self.assertIsNone(manager.get_sentiment_data(session_ids[0]))
+
+    def test_batches_advance_the_incremental_state(self):
+        responder = BatchResponder()
+        use_fake_backend(self, responder)
+        manager, session_ids = self.create_sessions(1)
+        session_id = session_ids[0]
+        analyze_sessions(manager, session_ids)
+        state = manager.get_sentiment_state(session_id)
+        self.assertEqual((state.messages, state.sentiment, state.intensity), (2, 'Sadness', 30))
+
+        manager.add_message(session_id, 'user', "Still not great")
+        responder.intensity = 60
+        rows = analyze_sessions(manager, session_ids)
+        transcript = responder.batches[-1][0]['transcript']
+        self.assertIn("Previous assessment (2 messages): Sentiment: Sadness, Intensity: 30%", transcript)
+        self.assertIn("Still not great", transcript)
+        self.assertNotIn("I feel low today", transcript)
+        state = manager.get_sentiment_state(session_id)
+        self.assertEqual(state.messages, 3)
+        self.assertEqual(rows[0]['level'], state.intensity)
+
+    def test_new_message_right_after_an_analysis_is_published(self):
+        use_fake_backend(self, BatchResponder())
+        manager, session_ids = self.create_sessions(1)
+        analyze_sessions(manager, session_ids)
+        manager.add_message(session_ids[0], 'user', "I'm really anxious now")
+        with mock.patch('admin_soft.sentiment.sentiment_updates') as updates:
+            analyze_sessions(manager, session_ids)
+        updates.publish.assert_called_once()
+
+    def test_expired_cache_entry_is_served_from_the_state(self):
+        responder = BatchResponder()
+        use_fake_backend(self, responder)
+        manager, session_ids = self.create_sessions(1)
+        analyze_sessions(manager, session_ids)
+        sentiment_cache.invalidate(session_ids[0])
+        rows = analyze_sessions(manager, session_ids)
+        self.assertEqual(len(responder.batches), 1)
+        self.assertEqual(rows[0]['sentiment'], 'Sadness')
+
+
+@override_settings(SENTIMENT_PRESCORE=False)
+class AsyncAnalyzeSessionsTests(TestCase):
+
+    async def test_database_store_is_read_off_the_event_loop(self):
+        use_fake_backend(self, BatchResponder())
+        manager = ChatSessionManager(store=DatabaseSessionStore())
+        session_ids = [f"async-{i}" for i in range(3)]
+        for session_id in session_ids:
+            await manager.aadd_message(session_id, 'user', "I feel low today")
+        rows = await aanalyze_sessions(manager, session_ids)
+        self.assertEqual([row['id'] for row in rows], session_ids)
+
+
+@override_settings(CHAT_SESSION_STORE='memory', SENTIMENT_PRESCORE=False)
+class SentimentWorkerTests(SimpleTestCase):
+
+    def create_worker(self, **kwargs):
+        self.manager = ChatSessionManager()
+        worker = SentimentWorker(self.manager, **kwargs)
+        worker.thread = False  # Batches are driven by the test, not a background thread
+        return worker
+
+    def test_changes_are_debounced_and_coalesced(self):
+        worker = self.create_worker(debounce=10, max_delay=60)
+        start = time.monotonic()
+        self.manager.add_message('session', 'user', "hello")
+        self.manager.add_message('session', 'user', "again")
+        self.assertEqual(worker.pop_due(start + 5), [])
+        self.assertEqual(worker.pop_due(start + 11), ['session'])
+        self.assertEqual((worker.enqueued, worker.coalesced), (1, 1))
+
+    def test_max_delay_bounds_the_debounce(self):
+        worker = self.create_worker(debounce=10, max_delay=15)
+        worker.notify('session')
+        first_change = worker.pending['session'][1]
+        worker.pending['session'] = (first_change + 10, first_change - 10)  # The first change was 10 s ago
+        worker.notify('session')
+        self.assertEqual(worker.pending['session'][0], first_change + 5)
+
+    def test_full_queue_drops_new_sessions(self):
+        worker = self.create_worker(max_pending=2)
+        self.assertTrue(worker.notify('a'))
+        self.assertTrue(worker.notify('b'))
+        self.assertFalse(worker.notify('c'))
+        self.assertTrue(worker.notify('a'))  # Sessions already waiting still coalesce
+        self.assertEqual(worker.dropped, 1)
+
+    def test_batches_are_capped(self):
+        worker = self.create_worker(debounce=0, batch_size=2)
+        for session_id in 'abc':
+            worker.notify(session_id)
+        self.assertEqual(worker.pop_due(time.monotonic() + 1), ['a', 'b'])
+        self.assertEqual(worker.pop_due(time.monotonic() + 1), ['c'])
+
+    def test_processed_sessions_are_scored(self):
+        use_fake_backend(self, BatchResponder(sentiment='happiness', intensity=70))
+        worker = self.create_worker(debounce=0)
+        self.manager.add_message('session', 'user', "hello")
+        worker.process(worker.pop_due(time.monotonic() + 1))
+        self.assertEqual(self.manager.get_sentiment_data('session')['sentiment'], 'Happiness')
+        self.assertEqual(worker.attempts, {})
+
+    def test_failed_sessions_back_off_then_are_abandoned(self):
+        def responder(prompt, system_instruction):
+            raise OSError("Network down")
+
+        use_fake_backend(self, responder)
+        worker = self.create_worker(debounce=1, max_retries=2)
+        self.manager.add_message('session', 'user', "hello")
+        delays = []
+        with self.assertLogs('admin_soft.sentiment', 'ERROR'):
+            for _ in range(3):
+                worker.process(worker.pop_due(time.monotonic() + 100))
+                if 'session' in worker.pending:
+                    delays.append(worker.pending['session'][0] - time.monotonic())
+        self.assertEqual(len(delays), 2)
+        self.assertAlmostEqual(delays[0], 2, delta=0.5)
+        self.assertAlmostEqual(delays[1], 4, delta=0.5)
+        self.assertEqual((worker.retried, worker.abandoned), (2, 1))
+        self.assertEqual(worker.pending, {})
+        self.assertEqual(worker.attempts, {})
+
+    def test_sessions_are_abandoned_without_a_backend(self):
+        worker = self.create_worker(debounce=0)
+        self.manager.add_message('session', 'user', "hello")
+        with mock.patch('admin_soft.sentiment.get_backend', return_value=None):
+            worker.process(worker.pop_due(time.monotonic() + 1))
+        self.assertEqual(worker.pending, {})
+        self.assertEqual(worker.abandoned, 1)
@@ -0,0 +1,186 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+from admin_soft.chat_session import ChatSessionManager, MessageRecord, parse_cursor
+from admin_soft.session_store import BatchWriter, DatabaseSessionStore, SessionStore, SQLiteSessionStore
+import os
+import shutil
+import tempfile
+import time
+
+
+class ListSessionStore(SessionStore):
+    """ In-memory store exercising the base class page(), as the Redis store does """
+
+    def __init__(self):
+        self.sessions = {}
+
+    def append_many(self, batch):
+        for session_id, messages in batch.items():
+            self.sessions.setdefault(session_id, []).extend(messages)
+
+    def load(self, session_id, since=None, limit=None):
+        messages = self.sessions.get(session_id, [])
+        return messages[-limit:] if limit else list(messages)
+
+
+class FlakySessionStore(ListSessionStore):
+    """ Rejects the next ``failures`` writes """
+
+    name = 'flaky'
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def append_many(self, batch):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("Store unavailable")
+        super().append_many(batch)
+
+
+class SessionStoreTestMixin:
+    """ Round-trip and pagination checks shared by every store """
+
+    def create_store(self):
+        raise NotImplementedError
+
+    def messages(self, count, created):
+        # Four messages share each timestamp so page boundaries fall inside a tie
+        return [
+            {'id': 1000 + i, 'role': 'user' if i % 2 == 0 else 'model', 'content': f"message {i}",
+             'created': created + (i // 4) * 0.000001}
+            for i in range(count)
+        ]
+
+    def test_round_trip_keeps_ids(self):
+        store = self.create_store()
+        messages = self.messages(5, time.time())
+        store.append_many({'session': messages})
+        loaded = store.load('session')
+        self.assertEqual([msg['id'] for msg in loaded], [msg['id'] for msg in messages])
+        self.assertEqual([msg['content'] for msg in loaded], [msg['content'] for msg in messages])
+        self.assertEqual([msg['role'] for msg in loaded], [msg['role'] for msg in messages])
+
+    def test_pages_cover_tied_timestamps_exactly_once(self):
+        store = self.create_store()
+        messages = self.messages(10, time.time())
+        store.append_many({'session': messages})
+        manager = ChatSessionManager(store=store)
+
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = manager.get_history_page(
+                'session', before=parse_cursor(cursor) if cursor else None, limit=3
+            )
+            seen = [msg.id for msg in page] + seen
+            if cursor is None:
+                break
+        self.assertEqual(seen, [msg['id'] for msg in messages])
+
+
+class ListSessionStoreTests(SessionStoreTestMixin, SimpleTestCase):
+
+    def create_store(self):
+        return ListSessionStore()
+
+
+class SQLiteSessionStoreTests(SessionStoreTestMixin, SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def create_store(self):
+        store = SQLiteSessionStore(os.path.join(self.directory, 'chat_sessions.sqlite3'))
+        self.addCleanup(store.close)
+        return store
+
+
+class DatabaseSessionStoreTests(SessionStoreTestMixin, TestCase):
+
+    def create_store(self):
+        return DatabaseSessionStore()
+
+
+class MemoryHistoryPageTests(SimpleTestCase):
+
+    def test_cursor_round_trips_exactly(self):
+        record = MessageRecord(1234, 'user', 'hello', wall_time=1792301194.5761912)
+        self.assertEqual(parse_cursor(record.cursor), record.sort_key)
+
+    @override_settings(CHAT_SESSION_STORE='memory')
+    def test_pages_walk_the_whole_window(self):
+        manager = ChatSessionManager()
+        for i in range(7):
+            manager.add_message('session', 'user', f"message {i}")
+
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = manager.get_history_page('session', before=parse_cursor(cursor) if cursor else None, limit=2)
+            seen = [msg.content for msg in page] + seen
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f"message {i}" for i in range(7)])
+
+
+class BatchWriterTests(SimpleTestCase):
+
+    def create_writer(self, store, **kwargs):
+        writer = BatchWriter(store, **kwargs)
+        writer.thread = False  # Flushes are driven by the test, not a background thread
+        return writer
+
+    def message(self, i):
+        return {'id': i, 'role': 'user', 'content': f"message {i}", 'created': time.time()}
+
+    def test_failed_batch_is_requeued_ahead_of_newer_appends(self):
+        store = FlakySessionStore(failures=1)
+        writer = self.create_writer(store)
+        writer.add('session', self.message(1))
+        writer.flush()
+        self.assertEqual(writer.pending_count, 1)
+        writer.add('session', self.message(2))
+        writer.flush()
+        self.assertEqual([msg['id'] for msg in store.load('session')], [1, 2])
+        self.assertEqual(writer.flushed, 2)
+        self.assertEqual(writer.failures, 0)
+
+    def test_batch_is_dropped_after_max_retries(self):
+        store = FlakySessionStore(failures=3)
+        writer = self.create_writer(store, max_retries=2)
+        writer.add('session', self.message(1))
+        for _ in range(3):
+            writer.flush()
+        self.assertEqual(writer.pending_count, 0)
+        self.assertEqual(writer.dropped, 1)
+        self.assertEqual(store.load('session'), [])
+
+    def test_discarded_session_is_not_revived_by_a_retry(self):
+        store = FlakySessionStore(failures=1)
+        writer = self.create_writer(store)
+        writer.add('session', self.message(1))
+        batch, count = writer.pending, writer.pending_count
+        writer.pending, writer.pending_count = {}, 0
+        writer.discard('session')
+        writer.requeue(batch, count)
+        self.assertEqual(writer.pending_count, 0)
+
+    def test_backoff_grows_and_is_capped(self):
+        writer = self.create_writer(ListSessionStore(), interval=0.05, max_backoff=1.0)
+        writer.failures = 1
+        self.assertEqual(writer.backoff(), 0.1)
+        writer.failures = 10
+        self.assertEqual(writer.backoff(), 1.0)
+
+    def test_close_flushes_and_stops_the_thread(self):
+        store = ListSessionStore()
+        writer = BatchWriter(store, interval=60)
+        writer.add('session', self.message(1))
+        writer.close()
+        writer.thread.join(5)
+        self.assertFalse(writer.thread.is_alive())
+        self.assertEqual([msg['id'] for msg in store.load('session')], [1])
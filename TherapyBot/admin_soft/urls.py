@@ -1,17 +1,33 @@
+from django.conf import settings
 from django.urls import path
 from admin_soft import views
 from django.contrib.auth import views as auth_views
 
+# Serve the async chat and screening views when running under core/asgi.py
+if getattr(settings, 'ASYNC_VIEWS', False):
+    chat_view, screening_view, screening_data_view = views.async_chat, views.async_screening, views.async_get_screening_data
+    screening_stream_view = views.async_screening_stream
+    # Django 3.2 iterates streaming responses on the event loop, which would block it for a whole
+    # generation; the page posts to chat/ instead, and older clients get the same JSON reply here
+    chat_stream_view = views.async_chat
+else:
+    chat_view, screening_view, screening_data_view = views.chat, views.screening, views.get_screening_data
+    screening_stream_view = views.screening_stream
+    chat_stream_view = views.chat_stream
 
 urlpatterns = [
     path('', views.index, name='index'),
-    path('chat/', views.chat, name='chat'),
+    path('chat/', chat_view, name='chat'),
+    path('chat/stream/', chat_stream_view, name='chat_stream'),
+    path('api/chat_history/', views.chat_history_page, name='chat_history'),
     path('location/', views.location, name='location'),
-    path('screening/', views.screening, name='screening'),
+    path('screening/', screening_view, name='screening'),
     path('profile/', views.profile, name='profile'),
+    path('health/', views.health, name='health'),
 
     # Sentiment Analysis
-    path('api/get_screening_data/', views.get_screening_data, name='get_screening_data'),
+    path('api/get_screening_data/', screening_data_view, name='get_screening_data'),
+    path('api/screening/stream/', screening_stream_view, name='screening_stream'),
 
     # Authentication
     path('accounts/login/', views.UserLoginView.as_view(), name='login'),
@@ -1,5 +1,8 @@
 import datetime
 import json
+import threading
+from django.conf import settings
+from django.core.cache import cache
 from django.template import Context
 from django.utils import translation
 
@@ -17,6 +20,7 @@ try:
     from django.core.urlresolvers import reverse, resolve, NoReverseMatch
 except ImportError:  # Django 1.11
     from django.urls import reverse, resolve, NoReverseMatch
+from django.urls import get_script_prefix
 
 from django.contrib.admin import AdminSite
 from django.utils.text import capfirst
@@ -62,65 +66,141 @@ class JsonResponse(HttpResponse):
         super(JsonResponse, self).__init__(content=data, **kwargs)
 
 
+# Cache key of the permission version; bumped by the signals connected in apps.py
+MENU_PERMISSIONS_VERSION_KEY = 'admin_soft:menu_permissions_version'
+
+menu_skeletons = {}
+menu_skeletons_lock = threading.Lock()
+
+
+def build_menu_skeleton(admin_site):
+    """ The permission-independent part of the app list: names, icons and URLs of every registered model """
+    skeleton = []
+    for model, model_admin in admin_site._registry.items():
+        app_label = model._meta.app_label
+        app_icon = model._meta.app_config.icon if hasattr(model._meta.app_config, 'icon') else None
+        if not app_icon:
+            app_icon = default_apps_icon[app_label] if app_label in default_apps_icon else None
+        try:
+            app_name = apps.get_app_config(app_label).verbose_name
+        except NameError:
+            app_name = app_label.title()
+
+        info = (app_label, model._meta.model_name)
+        urls = {}
+        for url_name, pattern in (('admin_url', 'admin:%s_%s_changelist'), ('add_url', 'admin:%s_%s_add')):
+            try:
+                urls[url_name] = reverse(pattern % info, current_app=admin_site.name)
+            except NoReverseMatch:
+                pass
+
+        skeleton.append({
+            'model': model,
+            'model_admin': model_admin,
+            'app_label': app_label,
+            'app_name': app_name,
+            'app_icon': app_icon,
+            'app_url': reverse('admin:app_list', kwargs={'app_label': app_label}, current_app=admin_site.name),
+            'name': capfirst(model._meta.verbose_name_plural),
+            'object_name': model._meta.object_name,
+            'model_name': model._meta.model_name,
+            'urls': urls,
+        })
+    return skeleton
+
+
+def get_menu_skeleton(admin_site):
+    """ build_menu_skeleton, computed once per process for each admin site and URL prefix """
+    key = (admin_site.name, id(admin_site), len(admin_site._registry), get_script_prefix())
+    skeleton = menu_skeletons.get(key)
+    if skeleton is None:
+        with menu_skeletons_lock:
+            skeleton = menu_skeletons.get(key)
+            if skeleton is None:
+                skeleton = menu_skeletons[key] = build_menu_skeleton(admin_site)
+    return skeleton
+
+
+def bump_menu_permissions_version(**kwargs):
+    """ Signal receiver: invalidates every cached permission mask """
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return  # Logins don't change permissions
+    try:
+        cache.incr(MENU_PERMISSIONS_VERSION_KEY)
+    except ValueError:
+        cache.set(MENU_PERMISSIONS_VERSION_KEY, 2, None)
+
+
+def get_permission_mask(admin_site, skeleton, request):
+    """
+    (has_module_perms, perms) for each skeleton entry and the request's user.
+
+    Masks are cached per user and permission version for ADMIN_MENU_CACHE_TTL
+    seconds; anonymous users, and ADMIN_MENU_CACHE = False, always recompute.
+    """
+    user = getattr(request, 'user', None)
+    cache_key = None
+    if getattr(settings, 'ADMIN_MENU_CACHE', True) and user is not None and user.pk is not None:
+        version = cache.get_or_set(MENU_PERMISSIONS_VERSION_KEY, 1, None)
+        cache_key = 'admin_soft:menu_mask:%s:%s:%s:%s' % (version, admin_site.name, len(skeleton), user.pk)
+        mask = cache.get(cache_key)
+        if mask is not None:
+            return mask
+
+    mask = []
+    module_perms = {}
+    for entry in skeleton:
+        model_admin, app_label = entry['model_admin'], entry['app_label']
+        if app_label not in module_perms:
+            try:
+                module_perms[app_label] = model_admin.has_module_permission(request)
+            except AttributeError:
+                module_perms[app_label] = request.user.has_module_perms(app_label)  # Fix Django < 1.8 issue
+        has_module_perms = module_perms[app_label]
+        mask.append((has_module_perms, model_admin.get_model_perms(request) if has_module_perms else {}))
+
+    if cache_key is not None:
+        cache.set(cache_key, mask, getattr(settings, 'ADMIN_MENU_CACHE_TTL', 300))
+    return mask
+
+
 def get_app_list(context, order=True):
     admin_site = get_admin_site(context)
     request = context['request']
+    skeleton = get_menu_skeleton(admin_site)
+    mask = get_permission_mask(admin_site, skeleton, request)
 
     app_dict = {}
-    for model, model_admin in admin_site._registry.items():
-
-        app_icon = model._meta.app_config.icon if hasattr(model._meta.app_config, 'icon') else None
-        app_label = model._meta.app_label
-        try:
-            has_module_perms = model_admin.has_module_permission(request)
-        except AttributeError:
-            has_module_perms = request.user.has_module_perms(app_label)  # Fix Django < 1.8 issue
+    for entry, (has_module_perms, perms) in zip(skeleton, mask):
+        app_label = entry['app_label']
 
         if has_module_perms:
-            perms = model_admin.get_model_perms(request)
-
             # Check whether user has any perm for this module.
             # If so, add the module to the model_list.
             if True in perms.values():
-                info = (app_label, model._meta.model_name)
                 model_dict = {
-                    'name': capfirst(model._meta.verbose_name_plural),
-                    'object_name': model._meta.object_name,
+                    'name': entry['name'],
+                    'object_name': entry['object_name'],
                     'perms': perms,
-                    'model_name': model._meta.model_name
+                    'model_name': entry['model_name']
                 }
-                if perms.get('change', False) or perms.get("view", False):
-                    try:
-                        model_dict['admin_url'] = reverse('admin:%s_%s_changelist' % info, current_app=admin_site.name)
-                    except NoReverseMatch:
-                        pass
-                if perms.get('add', False):
-                    try:
-                        model_dict['add_url'] = reverse('admin:%s_%s_add' % info, current_app=admin_site.name)
-                    except NoReverseMatch:
-                        pass
+                if (perms.get('change', False) or perms.get("view", False)) and 'admin_url' in entry['urls']:
+                    model_dict['admin_url'] = entry['urls']['admin_url']
+                if perms.get('add', False) and 'add_url' in entry['urls']:
+                    model_dict['add_url'] = entry['urls']['add_url']
                 if app_label in app_dict:
                     app_dict[app_label]['models'].append(model_dict)
                 else:
-                    try:
-                        name = apps.get_app_config(app_label).verbose_name
-                    except NameError:
-                        name = app_label.title()
                     app_dict[app_label] = {
-                        'name': name,
+                        'name': entry['app_name'],
                         'app_label': app_label,
-                        'app_url': reverse(
-                            'admin:app_list',
-                            kwargs={'app_label': app_label},
-                            current_app=admin_site.name,
-                        ),
+                        'app_url': entry['app_url'],
                         'has_module_perms': has_module_perms,
                         'models': [model_dict],
                     }
 
-                if not app_icon:
-                    app_icon = default_apps_icon[app_label] if app_label in default_apps_icon else None
-                app_dict[app_label]['icon'] = app_icon
+                app_dict[app_label]['icon'] = entry['app_icon']
 
     # Sort the apps alphabetically.
     app_list = list(app_dict.values())
@@ -135,23 +215,50 @@ def get_app_list(context, order=True):
     return app_list
 
 
-def get_admin_site(context):
+# Admin site serving each (urlconf, namespace); URLconfs don't change at runtime
+admin_sites_by_namespace = {}
+
+
+def find_admin_site(request):
     try:
-        current_resolver = resolve(context.get('request').path)
-        index_resolver = resolve(reverse('%s:index' % current_resolver.namespaces[0]))
+        # The handler already resolved the request; only resolve again outside a normal request cycle
+        current_resolver = getattr(request, 'resolver_match', None) or resolve(request.path_info)
+        namespace = current_resolver.namespaces[0]
+        key = (getattr(request, 'urlconf', None) or settings.ROOT_URLCONF, namespace)
+        admin_site = admin_sites_by_namespace.get(key)
+        if admin_site is not None:
+            return admin_site
 
-        if hasattr(index_resolver.func, 'admin_site'):
-            return index_resolver.func.admin_site
+        index_resolver = resolve(reverse('%s:index' % namespace))
 
-        for func_closure in index_resolver.func.__closure__:
-            if isinstance(func_closure.cell_contents, AdminSite):
-                return func_closure.cell_contents
+        if hasattr(index_resolver.func, 'admin_site'):
+            admin_site = index_resolver.func.admin_site
+        else:
+            for func_closure in index_resolver.func.__closure__:
+                if isinstance(func_closure.cell_contents, AdminSite):
+                    admin_site = func_closure.cell_contents
+                    break
+
+        if admin_site is not None:
+            admin_sites_by_namespace[key] = admin_site
+            return admin_site
     except:
         pass
 
     return admin.site
 
 
+def get_admin_site(context):
+    request = context.get('request')
+    # Memoized on the request: one admin render calls this from several template tags
+    admin_site = getattr(request, 'admin_soft_site', None)
+    if admin_site is None:
+        admin_site = find_admin_site(request)
+        if request is not None:
+            request.admin_soft_site = admin_site
+    return admin_site
+
+
 def get_admin_site_name(context):
     return get_admin_site(context).name
 
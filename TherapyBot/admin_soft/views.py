@@ -1,95 +1,129 @@
+from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib.auth.views import LoginView, PasswordResetView, PasswordChangeView, PasswordResetConfirmView
 from .forms import LoginForm, RegistrationForm, UserPasswordResetForm, UserSetPasswordForm, UserPasswordChangeForm
 from django.contrib.auth.models import User
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.contrib.auth.views import redirect_to_login
+from django.db import connection
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from datetime import datetime, timedelta
-import os
-import google.generativeai as genai
-from google.api_core import exceptions
 from dotenv import load_dotenv
-from .chat_session import ChatSessionManager
+from asgiref.sync import sync_to_async
+from .chat_session import ChatSessionManager, parse_cursor
+from .context import ContextCompactor, build_context
+from .response_cache import create_response_cache
+from .breaker import CircuitOpen
+from .llm import get_backend, get_scheduler
+from .scheduler import SchedulerSaturated
+from .sentiment import (
+    SentimentWorker, analyze_history, aanalyze_history, analyze_sessions, aanalyze_sessions, build_sentiment_data,
+    cached_sentiment, get_session_usernames, sentiment_cache, sentiment_updates, store_sentiment,
+)
+import json
+import threading
+import time
 import logging
 import random
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+DEGRADED_RESPONSE = (
+    "I'm having trouble connecting right now, so I can't give you a proper reply. Please try again in a little while. "
+    "If you are in crisis or thinking about harming yourself, please contact your local emergency number or a crisis line."
+)
+
 # Load environment variables
 load_dotenv()
 
 # Initialize ChatSessionManager
 chat_session_manager = ChatSessionManager()
-
-# Configure Gemini API
-try:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        logger.error("GEMINI_API_KEY environment variable is not set")
-        model = None
-    else:
-        genai.configure(api_key=api_key)
-        
-        model_name = "gemini-1.5-flash" 
-        
-        generation_config = {
-            "temperature": 0.9,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 1000,
-        }
-        
-        safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            }
-        ]
-        
-        # Create the model
-        model = genai.GenerativeModel(
-            model_name=model_name,
-            generation_config=generation_config,
-            safety_settings=safety_settings,  # Pass safety settings separately
-            system_instruction=(
-                "You are a professional AI therapist providing compassionate, evidence-based, and non-judgmental support. "
-                "Use reflective listening, validation, and open-ended questions. Encourage self-reflection instead of direct advice. "
-                "If a user expresses distress, offer grounding techniques and recommend professional help."
+# A deleted session's cached sentiment must not outlive its history
+chat_session_manager.add_delete_listener(sentiment_cache.invalidate)
+# Keeps the prompt for long conversations within CHAT_CONTEXT_TOKEN_BUDGET
+context_compactor = ContextCompactor(
+    chat_session_manager,
+    keep_turns=settings.CHAT_CONTEXT_KEEP_TURNS,
+    token_budget=settings.CHAT_CONTEXT_TOKEN_BUDGET,
+    summary_batch=settings.CHAT_CONTEXT_SUMMARY_BATCH,
+)
+
+# Opt-in cache of first-turn replies (settings.CHAT_RESPONSE_CACHE)
+response_cache = create_response_cache()
+
+# Optional background sentiment: views then only read results the worker precomputed
+# (also started by the first screening stream, which only sees changes the worker computes)
+sentiment_worker = None
+sentiment_worker_lock = threading.Lock()
+
+
+def start_sentiment_worker():
+    global sentiment_worker
+    with sentiment_worker_lock:
+        if sentiment_worker is None:
+            sentiment_worker = SentimentWorker(
+                chat_session_manager,
+                debounce=settings.SENTIMENT_WORKER_DEBOUNCE,
+                max_delay=settings.SENTIMENT_WORKER_MAX_DELAY,
+                max_pending=settings.SENTIMENT_WORKER_QUEUE_SIZE,
+                batch_size=settings.SENTIMENT_BATCH_SIZE,
+                max_retries=settings.SENTIMENT_WORKER_MAX_RETRIES,
             )
-        )
-        
-        logger.info(f"Using model: {model_name}")
-        
-except Exception as e:
-    logger.error(f"Error initializing Gemini API: {str(e)}")
-    model = None
+    return sentiment_worker
+
+
+if settings.SENTIMENT_WORKER:
+    start_sentiment_worker()
 
 # Views
 
 def index(request):
-    """ Renders the chat page with session history """
+    """ Renders the chat page with the latest page of session history """
     try:
         session_id = chat_session_manager.get_or_create_session_id(request)
-        chat_history = chat_session_manager.get_chat_history(session_id)
-        return render(request, 'pages/index.html', {'segment': 'index', 'chat_history': chat_history})
+        chat_history, next_cursor = chat_session_manager.get_history_page(
+            session_id, limit=settings.CHAT_HISTORY_PAGE_SIZE
+        )
+        return render(request, 'pages/index.html', {
+            'segment': 'index', 'chat_history': chat_history, 'next_cursor': next_cursor, 'chat_url': chat_url_name(),
+        })
     except Exception as e:
         logger.error(f"Error in index view: {str(e)}")
-        return render(request, 'pages/index.html', {'segment': 'index', 'chat_history': [], 'error': 'Error loading chat history'})
+        return render(request, 'pages/index.html', {
+            'segment': 'index', 'chat_history': [], 'error': 'Error loading chat history', 'chat_url': chat_url_name(),
+        })
+
+
+def chat_url_name():
+    """ Streaming replies under WSGI; under ASGI a plain JSON reply so the event loop is never blocked """
+    return 'chat' if getattr(settings, 'ASYNC_VIEWS', False) else 'chat_stream'
+
+
+def chat_history_page(request):
+    """ Returns a page of older messages for lazy loading (keyset pagination on the ``before`` cursor) """
+    try:
+        before = request.GET.get('before')
+        before = parse_cursor(before) if before else None
+        limit = min(int(request.GET.get('limit', settings.CHAT_HISTORY_PAGE_SIZE)), 100)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid pagination parameters'}, status=400)
+
+    try:
+        session_id = chat_session_manager.get_or_create_session_id(request)
+        messages, next_cursor = chat_session_manager.get_history_page(session_id, before=before, limit=max(limit, 1))
+        return JsonResponse({
+            'messages': [
+                {'role': msg.role, 'content': msg.content, 'time': msg.timestamp.strftime("%H:%M")}
+                for msg in messages
+            ],
+            'next_cursor': next_cursor,
+        })
+    except Exception as e:
+        logger.error(f"Error in chat_history_page: {str(e)}")
+        return JsonResponse({'error': 'Error loading chat history'}, status=500)
 
 
 @csrf_exempt
@@ -109,29 +143,37 @@ def chat(request):
                 return JsonResponse({'error': 'Session error. Please refresh the page.'}, status=400)
 
             # Retrieve chat history
+            timings = []
+            start = time.perf_counter()
             try:
                 chat_history = chat_session_manager.get_chat_history(session_id)
             except Exception as e:
                 logger.error(f"Chat history error: {str(e)}")
                 chat_history = []  # Fallback to empty history
-
-            # Generate AI response using the model
-            try:
-                # Start a new chat with the model
-                chat = model.start_chat(history=[])
-                
-                # Add previous messages to the chat
-                for msg in chat_history:
-                    if msg["role"] == "user":
-                        chat.send_message(msg["content"])
-                    # Note: We don't need to add model responses as they're tracked automatically
-                
-                # Send the current message and get response
-                response = chat.send_message(message)
-                ai_response = response.text
-            except Exception as e:
-                logger.error(f"Error generating AI response: {str(e)}")
-                ai_response = "I'm sorry, I'm having trouble processing your request right now. Could you try again later?"
+            timings.append(('history', time.perf_counter() - start, None))
+
+            # Common opening messages can be answered from the first-turn cache
+            start = time.perf_counter()
+            cache_key = response_cache.key(message, chat_history) if response_cache is not None else None
+            ai_response = response_cache.get(cache_key) if cache_key else None
+            if ai_response is not None:
+                timings.append(('cache', time.perf_counter() - start, 'hit'))
+            else:
+                # Generate AI response using the model
+                try:
+                    # Seed the chat with the stored conversation so only one generation call is made
+                    model_history = build_context(context_compactor, session_id, chat_history)
+                    ai_response = get_backend().chat(model_history, message)
+                    if cache_key:
+                        response_cache.add(cache_key, ai_response)
+                except SchedulerSaturated as e:
+                    return busy_response(e)
+                except CircuitOpen as e:
+                    return degraded_response(e)
+                except Exception as e:
+                    logger.error(f"Error generating AI response: {str(e)}")
+                    ai_response = "I'm sorry, I'm having trouble processing your request right now. Could you try again later?"
+                timings.append(('llm', time.perf_counter() - start, None))
 
             # Store messages in session
             try:
@@ -140,7 +182,7 @@ def chat(request):
             except Exception as e:
                 logger.error(f"Error adding message to session: {str(e)}")
 
-            return JsonResponse({'response': ai_response})
+            return server_timing(JsonResponse({'response': ai_response}), timings)
 
         except Exception as e:
             logger.error(f"Error in chat processing: {str(e)}")
@@ -149,50 +191,162 @@ def chat(request):
     return JsonResponse({'error': 'Invalid request method'}, status=400)
 
 
-def get_sentiment(history):
+def server_timing(response, timings):
+    """ Sets a Server-Timing header from (metric, seconds, description) entries """
+    response['Server-Timing'] = ", ".join(
+        f"{name};dur={seconds * 1000:.3f}" + (f';desc="{description}"' if description else "")
+        for name, seconds, description in timings
+    )
+    return response
+
+
+def busy_response(error):
+    """ 429 telling the client when the LLM scheduler expects capacity again; the message is not stored """
+    response = JsonResponse(
+        {'error': 'The assistant is busy right now.', 'retry_after': error.retry_after}, status=429
+    )
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def degraded_response(error):
+    """ Immediate canned reply while the model's circuit breaker is open; the turn is not stored """
+    response = JsonResponse({'response': DEGRADED_RESPONSE, 'degraded': True}, status=503)
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def health(request):
+    """
+    Load balancer health check. The LLM breaker being open only marks the
+    instance degraded (every instance shares the same model), so the status
+    code is 503 only when the database is unreachable. ``?detail=1`` adds the
+    memory held by this worker's chat sessions.
+    """
+    data = {'status': 'ok', 'database': 'ok'}
     try:
-        if model is None:
-            return "Unknown", 50  # Default level if AI fails
-        
-        # System prompt enforcing sentiment format with percentage
-        system_prompt = (
-            "You are a sentiment analyzer. Analyze the following chat history and determine the emotional sentiment."
-            " Provide a sentiment category and an intensity percentage between 0-100."
-            " The sentiment should be one of the following: fear, disgust, admiration, sadness, anger, happiness, anxiety,"
-            " depression, stress, suicidal, bipolar, or personality disorder."
-            " Format your response as follows:\n"
-            "Sentiment: [sentiment]\n"
-            "Intensity: [percentage]%"
-        )
-        
-        # Create a sentiment analysis model with specific instructions
-        sentiment_model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            system_instruction=system_prompt
-        )
-        
-        # Generate sentiment analysis
-        response = sentiment_model.generate_content(history)
-        
-        # Extract sentiment and intensity
-        lines = response.text.split('\n')
-        sentiment = "Unknown"
-        intensity = 50  # Default percentage
-
-        for line in lines:
-            if line.startswith("Sentiment:"):
-                sentiment = line.split(":")[1].strip()
-            elif line.startswith("Intensity:"):
-                try:
-                    intensity = int(line.split(":")[1].replace('%', '').strip())
-                except ValueError:
-                    intensity = 50  # Default in case of parsing failure
-        
-        return sentiment, intensity
-    
+        connection.ensure_connection()
+    except Exception as e:
+        logger.error(f"Health check database error: {str(e)}")
+        data.update(status='unavailable', database='error')
+
+    scheduler = get_scheduler()
+    if scheduler is not None:
+        data['llm'] = scheduler.stats()
+        if scheduler.breaker is not None:
+            data['llm']['breaker'] = scheduler.breaker.stats()
+            if data['llm']['breaker']['state'] != 'closed' and data['status'] == 'ok':
+                data['status'] = 'degraded'
+
+    # This worker's own chat sessions; with the memory store no other process can see them
+    data['chat'] = chat_session_manager.get_metrics()
+    if request.GET.get('detail'):
+        data['chat'].update(chat_session_manager.get_memory_footprint())  # Walks every window, so only on request
+
+    response = JsonResponse(data, status=503 if data['status'] == 'unavailable' else 200)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+def sse_event(event, data, event_id=None):
+    """ Formats one Server-Sent Event frame """
+    frame = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return frame if event_id is None else f"id: {event_id}\n" + frame
+
+
+@csrf_exempt
+def chat_stream(request):
+    """ Streams the AI response to the browser as Server-Sent Events """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+
+    message = request.POST.get('message', '').strip()
+    if not message:
+        return JsonResponse({'error': 'Message cannot be empty'}, status=400)
+
+    try:
+        session_id = chat_session_manager.get_or_create_session_id(request)
     except Exception as e:
-        logger.error(f"Error in get_sentiment: {str(e)}")
-        return "Unknown", 50
+        logger.error(f"Session error: {str(e)}")
+        return JsonResponse({'error': 'Session error. Please refresh the page.'}, status=400)
+
+    timings = []
+    start = time.perf_counter()
+    try:
+        chat_history = chat_session_manager.get_chat_history(session_id)
+    except Exception as e:
+        logger.error(f"Chat history error: {str(e)}")
+        chat_history = []  # Fallback to empty history
+    timings.append(('history', time.perf_counter() - start, None))
+
+    start = time.perf_counter()
+    cache_key = response_cache.key(message, chat_history) if response_cache is not None else None
+    cached_response = response_cache.get(cache_key) if cache_key else None
+    if cached_response is not None:
+        timings.append(('cache', time.perf_counter() - start, 'hit'))
+
+    # Start the model stream before any headers go out, so a saturated scheduler can still answer 429
+    reply_chunks = None
+    stream_error = None
+    if cached_response is None:
+        try:
+            model_history = build_context(context_compactor, session_id, chat_history)
+            reply_chunks = get_backend().stream(model_history, message)
+        except SchedulerSaturated as e:
+            return busy_response(e)
+        except CircuitOpen as e:
+            return degraded_response(e)
+        except Exception as e:
+            stream_error = e
+
+    def event_stream():
+        chunks = []
+        try:
+            if cached_response is not None:
+                chunks.append(cached_response)
+                yield sse_event('token', {'text': cached_response})
+            else:
+                if stream_error is not None:
+                    raise stream_error
+                for chunk in reply_chunks:
+                    chunks.append(chunk)
+                    yield sse_event('token', {'text': chunk})
+                if cache_key:
+                    response_cache.add(cache_key, "".join(chunks))
+        except Exception as e:
+            logger.error(f"Error streaming AI response: {str(e)}")
+            if not chunks:
+                chunks.append("I'm sorry, I'm having trouble processing your request right now. Could you try again later?")
+                yield sse_event('token', {'text': chunks[0]})
+        finally:
+            if hasattr(reply_chunks, 'close'):
+                reply_chunks.close()  # Frees the scheduler slot when the client disconnects mid-response
+            # Persist once the stream ends, including when the client disconnects mid-response
+            ai_response = "".join(chunks)
+            try:
+                chat_session_manager.add_message(session_id, "user", message)
+                if ai_response:
+                    chat_session_manager.add_message(session_id, "model", ai_response)
+            except Exception as e:
+                logger.error(f"Error adding message to session: {str(e)}")
+        yield sse_event('done', {'response': ai_response})
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return server_timing(response, timings)  # Headers go out before the model runs, so no llm entry
+
+
+def precomputed_sentiment(session_id):
+    """ The worker's latest result for session_id, queueing the session if there is none yet """
+    sentiment_data = chat_session_manager.get_sentiment_data(session_id)
+    if sentiment_data is None:
+        sentiment_worker.notify(session_id)
+    return sentiment_data
+
+def sentiment_fallback(session_id, username):
+    """ The last good result, else a placeholder; neither is cached or published, so the next request retries """
+    return chat_session_manager.get_sentiment_data(session_id) or build_sentiment_data(session_id, username, "Unknown", 50)
 
 def analyze_chat_sentiment(request):
     """ Extracts chat history, runs sentiment analysis, and returns structured sentiment data. """
@@ -204,29 +358,28 @@ def analyze_chat_sentiment(request):
 
     if not history:
         return None  # Indicate no history available
+    if sentiment_worker is not None:
+        return precomputed_sentiment(session_id)
 
-    history_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in history])
-    sentiment, level = get_sentiment(history_text)
-
-    status = "Good" if level >= 70 else "Moderate" if level >= 40 else "Low"
-    status_color = "success" if status == "Good" else "warning" if status == "Moderate" else "danger"
+    # Skip the LLM while the conversation has not changed
+    fingerprint, sentiment_data = cached_sentiment(session_id, history)
+    if sentiment_data is not None:
+        return sentiment_data
 
-    return {
-        "id": session_id,
-        "sentiment": sentiment,
-        "username": username,  # Add username to sentiment data
-        "level": level,
-        "level_description": "excellent" if level >= 80 else "good" if level >= 60 else "okay" if level >= 40 else "concerning",
-        "status": status,
-        "status_color": status_color,
-        "time": datetime.now().strftime("%H:%M"),
-    }
+    result = analyze_history(chat_session_manager, session_id, history)
+    if result is None:
+        return sentiment_fallback(session_id, username)
+    sentiment_data = build_sentiment_data(session_id, username, *result)
+    store_sentiment(chat_session_manager, session_id, fingerprint, sentiment_data)
+    return sentiment_data
 
 def get_screening_data(request):
     try:
         sentiment_data = analyze_chat_sentiment(request)
         if sentiment_data is None:
-            return JsonResponse({'error': 'No chat history available'}, status=400)
+            # With the worker on, None can also mean the first result is still being computed
+            error = 'No sentiment data available yet' if sentiment_worker is not None else 'No chat history available'
+            return JsonResponse({'error': error}, status=400)
 
         return JsonResponse(sentiment_data)
     except Exception as e:
@@ -236,13 +389,13 @@ def get_screening_data(request):
 def generate_default_sentiments():
     """Generate 7 default sentiments for initial display"""
     sentiments = [
-        {"name": "Happiness", "level": 85, "status": "Good", "status_color": "success"},
-        {"name": "Anxiety", "level": 45, "status": "Moderate", "status_color": "warning"},
-        {"name": "Depression", "level": 30, "status": "Low", "status_color": "danger"},
-        {"name": "Stress", "level": 60, "status": "Moderate", "status_color": "warning"},
-        {"name": "Anger", "level": 25, "status": "Low", "status_color": "danger"},
-        {"name": "Fear", "level": 40, "status": "Moderate", "status_color": "warning"},
-        {"name": "Admiration", "level": 75, "status": "Good", "status_color": "success"},
+        {"sentiment": "Happiness", "level": 85, "status": "Good", "status_color": "success"},
+        {"sentiment": "Anxiety", "level": 45, "status": "Moderate", "status_color": "warning"},
+        {"sentiment": "Depression", "level": 30, "status": "Low", "status_color": "danger"},
+        {"sentiment": "Stress", "level": 60, "status": "Moderate", "status_color": "warning"},
+        {"sentiment": "Anger", "level": 25, "status": "Low", "status_color": "danger"},
+        {"sentiment": "Fear", "level": 40, "status": "Moderate", "status_color": "warning"},
+        {"sentiment": "Admiration", "level": 75, "status": "Good", "status_color": "success"},
     ]
     
     # Add additional fields
@@ -257,26 +410,240 @@ def generate_default_sentiments():
     
     return sentiments
 
+def analyze_live_sessions():
+    """ Sentiment rows for the live chat sessions, scored in batched LLM requests """
+    session_ids = chat_session_manager.get_session_ids()[:settings.SCREENING_MAX_SESSIONS]
+    if sentiment_worker is not None:
+        return [data for data in map(precomputed_sentiment, session_ids) if data is not None]
+    return analyze_sessions(chat_session_manager, session_ids, get_session_usernames(session_ids))
+
 @login_required
 def screening(request):
     """ Displays emotional sentiment analysis """
     try:
-        # Get real sentiment data if available
-        sentiment_data = analyze_chat_sentiment(request)
-        
-        # Generate default sentiments
-        default_sentiments = generate_default_sentiments()
+        # Get real sentiment data if available: staff see every live session, others their own
+        if request.user.is_staff:
+            sentiment_rows = analyze_live_sessions()
+        else:
+            sentiment_data = analyze_chat_sentiment(request)
+            sentiment_rows = [sentiment_data] if sentiment_data is not None else []
         
-        # If real sentiment data is available, add it to the beginning of the list
-        emotional_sentiments = default_sentiments
-        if sentiment_data is not None:
-            emotional_sentiments = [sentiment_data] + default_sentiments[:6]  # Keep total at 7
+        # Real sentiment data goes first, padded with default sentiments to a total of 7
+        emotional_sentiments = sentiment_rows + generate_default_sentiments()[len(sentiment_rows):]
         
-        return render(request, 'pages/screening.html', {'segment': 'screening', 'emotional_sentiments': emotional_sentiments})
+        return render(request, 'pages/screening.html', {
+            'segment': 'screening',
+            'emotional_sentiments': emotional_sentiments,
+            'screening_push': sentiment_worker is not None,
+        })
     except Exception as e:
         logger.error(f"Error in tables view: {str(e)}")
         return render(request, 'pages/screening.html', {'segment': 'screening', 'error': 'Error loading data'})
 
+def screening_stream_setup(request):
+    """
+    Returns (last seen version, visible session ids or None for all). Streams
+    only read what SentimentWorker (or a screening page load) published, so a
+    reconnect never scores anything.
+    """
+    session_id = chat_session_manager.get_or_create_session_id(request)
+    # A reconnecting EventSource resumes after the last event it received
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    version = int(last_event_id) if last_event_id.isdigit() else 0
+    return version, None if request.user.is_staff else {session_id}
+
+def screening_events(changes, visible, version, current):
+    """ SSE frames for the visible changes; moves the client's Last-Event-ID past invisible ones """
+    events = "".join(
+        sse_event('sentiment', row, event_id=change_version)
+        for change_version, session_id, row in changes if visible is None or session_id in visible
+    )
+    if not events and current > version:
+        events = f"id: {current}\n\n"
+    return events
+
+def screening_stream(request):
+    """
+    Server-Sent Events as a poll: returns the visible sessions' changes since
+    Last-Event-ID straight away.
+
+    Holding the stream open would pin a WSGI worker per open tab, so the
+    response ends at once and EventSource reconnects after
+    SCREENING_STREAM_RETRY_MS, picking up where it left off.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=403)
+    version, visible = screening_stream_setup(request)
+
+    changes, current = sentiment_updates.since(version)
+    events = screening_events(changes, visible, version, current) or ": keep-alive\n\n"
+
+    response = HttpResponse(f"retry: {settings.SCREENING_STREAM_RETRY_MS}\n\n" + events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+# Async views, routed instead of the sync ones when settings.ASYNC_VIEWS is on
+
+def get_username(request):
+    # Get username if user is authenticated, otherwise use "Guest"
+    return request.user.username if request.user.is_authenticated else "Guest"
+
+
+async def async_analyze_chat_sentiment(request):
+    """ Async counterpart of analyze_chat_sentiment """
+    session_id = await chat_session_manager.aget_or_create_session_id(request)
+    history = await chat_session_manager.aget_chat_history(session_id)
+    username = await sync_to_async(get_username)(request)
+
+    if not history:
+        return None  # Indicate no history available
+    if sentiment_worker is not None:
+        return precomputed_sentiment(session_id)
+
+    fingerprint, sentiment_data = cached_sentiment(session_id, history)
+    if sentiment_data is not None:
+        return sentiment_data
+
+    result = await aanalyze_history(chat_session_manager, session_id, history)
+    if result is None:
+        return sentiment_fallback(session_id, username)
+    sentiment_data = build_sentiment_data(session_id, username, *result)
+    store_sentiment(chat_session_manager, session_id, fingerprint, sentiment_data)
+    return sentiment_data
+
+
+async def async_chat(request):
+    """ Async counterpart of chat: the worker is free while the model generates """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+
+    try:
+        message = request.POST.get('message', '').strip()
+        if not message:
+            return JsonResponse({'error': 'Message cannot be empty'}, status=400)
+
+        try:
+            session_id = await chat_session_manager.aget_or_create_session_id(request)
+        except Exception as e:
+            logger.error(f"Session error: {str(e)}")
+            return JsonResponse({'error': 'Session error. Please refresh the page.'}, status=400)
+
+        timings = []
+        start = time.perf_counter()
+        try:
+            chat_history = await chat_session_manager.aget_chat_history(session_id)
+        except Exception as e:
+            logger.error(f"Chat history error: {str(e)}")
+            chat_history = []  # Fallback to empty history
+        timings.append(('history', time.perf_counter() - start, None))
+
+        start = time.perf_counter()
+        cache_key = response_cache.key(message, chat_history) if response_cache is not None else None
+        ai_response = response_cache.get(cache_key) if cache_key else None
+        if ai_response is not None:
+            timings.append(('cache', time.perf_counter() - start, 'hit'))
+        else:
+            try:
+                model_history = build_context(context_compactor, session_id, chat_history)
+                ai_response = await get_backend().achat(model_history, message)
+                if cache_key:
+                    response_cache.add(cache_key, ai_response)
+            except SchedulerSaturated as e:
+                return busy_response(e)
+            except CircuitOpen as e:
+                return degraded_response(e)
+            except Exception as e:
+                logger.error(f"Error generating AI response: {str(e)}")
+                ai_response = "I'm sorry, I'm having trouble processing your request right now. Could you try again later?"
+            timings.append(('llm', time.perf_counter() - start, None))
+
+        try:
+            await chat_session_manager.aadd_message(session_id, "user", message)
+            await chat_session_manager.aadd_message(session_id, "model", ai_response)
+        except Exception as e:
+            logger.error(f"Error adding message to session: {str(e)}")
+
+        return server_timing(JsonResponse({'response': ai_response}), timings)
+
+    except Exception as e:
+        logger.error(f"Error in chat processing: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+# csrf_exempt is not coroutine-aware before Django 5.0, so mark the view directly
+async_chat.csrf_exempt = True
+
+
+async def async_get_screening_data(request):
+    try:
+        sentiment_data = await async_analyze_chat_sentiment(request)
+        if sentiment_data is None:
+            # With the worker on, None can also mean the first result is still being computed
+            error = 'No sentiment data available yet' if sentiment_worker is not None else 'No chat history available'
+            return JsonResponse({'error': error}, status=400)
+
+        return JsonResponse(sentiment_data)
+    except Exception as e:
+        logger.error(f"Error in async_get_screening_data: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+async def async_screening(request):
+    """ Async counterpart of screening; login_required is applied by hand since it is sync-only """
+    is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+    if not is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    try:
+        is_staff = await sync_to_async(lambda: request.user.is_staff)()
+        if is_staff and sentiment_worker is not None:
+            sentiment_rows = await sync_to_async(analyze_live_sessions)()  # Only reads precomputed results, but looks up usernames
+        elif is_staff:
+            session_ids = chat_session_manager.get_session_ids()[:settings.SCREENING_MAX_SESSIONS]
+            usernames = await sync_to_async(get_session_usernames)(session_ids)
+            sentiment_rows = await aanalyze_sessions(chat_session_manager, session_ids, usernames)
+        else:
+            sentiment_data = await async_analyze_chat_sentiment(request)
+            sentiment_rows = [sentiment_data] if sentiment_data is not None else []
+
+        emotional_sentiments = sentiment_rows + generate_default_sentiments()[len(sentiment_rows):]
+
+        context = {
+            'segment': 'screening',
+            'emotional_sentiments': emotional_sentiments,
+            'screening_push': sentiment_worker is not None,
+        }
+    except Exception as e:
+        logger.error(f"Error in async_screening view: {str(e)}")
+        context = {'segment': 'screening', 'error': 'Error loading data'}
+
+    # Context processors read request.user, so rendering has to happen off the event loop
+    return await sync_to_async(render)(request, 'pages/screening.html', context)
+
+
+async def async_screening_stream(request):
+    """
+    Async counterpart of screening_stream as a long poll over the same protocol.
+
+    Django 3.2 iterates streaming responses synchronously on the event loop, so
+    instead of holding the stream open this waits (without a thread) for the
+    next change and returns it; EventSource reconnects straight away with
+    Last-Event-ID and picks up where it left off.
+    """
+    is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+    if not is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=403)
+    version, visible = await sync_to_async(screening_stream_setup)(request)
+
+    changes, current = sentiment_updates.since(version)
+    if current == version:
+        changes, current = await sentiment_updates.await_since(version, settings.SCREENING_STREAM_HEARTBEAT)
+    events = screening_events(changes, visible, version, current) or ": keep-alive\n\n"
+
+    response = HttpResponse("retry: 0\n\n" + events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
 def location(request):
     return render(request, 'pages/location.html', { 'segment': 'location' })
 
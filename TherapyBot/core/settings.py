@@ -20,10 +20,31 @@ load_dotenv()  # take environment variables from .env.
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Cache configuration, e.g. CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache
+# and CACHE_LOCATION=127.0.0.1:11211 for a cache shared by every worker process
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+SHARED_CACHE = CACHE_BACKEND not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
 # Session configuration
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'  # Use database-backed sessions
+# cached_db serves sessions from the cache, so it is only the default when every process shares that cache:
+# with a per-process cache, a logout or flush() in one worker would stay invisible to the others.
+# 'signed_cookies' keeps sessions client-side.
+SESSION_ENGINE = os.getenv(
+    'SESSION_ENGINE',
+    'django.contrib.sessions.backends.cached_db' if SHARED_CACHE else 'django.contrib.sessions.backends.db',
+)
 SESSION_COOKIE_AGE = 1209600  # 2 weeks in seconds
-SESSION_SAVE_EVERY_REQUEST = True  # Save the session data on every request
+SESSION_SAVE_EVERY_REQUEST = False  # Save only when the session changed (see SessionRefreshMiddleware)
+SESSION_REFRESH_WINDOW = int(os.getenv('SESSION_REFRESH_WINDOW', str(SESSION_COOKIE_AGE // 2)))  # Renew when less is left
 
 # Configure logging
 LOGGING = {
@@ -99,8 +120,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "admin_soft.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
+    "admin_soft.middleware.SessionRefreshMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -211,3 +233,98 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 LOGIN_REDIRECT_URL = '/'
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# LLM backend: 'gemini' (default) or 'fake' for offline load testing
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini')
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+LLM_FAKE_LATENCY = float(os.getenv('LLM_FAKE_LATENCY', '0.2'))  # Seconds before the first token
+LLM_FAKE_TOKEN_RATE = float(os.getenv('LLM_FAKE_TOKEN_RATE', '50'))  # Tokens per second
+LLM_EXECUTOR_WORKERS = int(os.getenv('LLM_EXECUTOR_WORKERS', '32'))  # Bound on blocking calls awaited by async views
+
+# Route /chat/ and the screening views to their async versions (serve with core/asgi.py)
+ASYNC_VIEWS = str2bool(os.environ.get('ASYNC_VIEWS')) or False
+
+# Per-session chat history caps on top of the 30-minute window (0 disables a cap)
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv('CHAT_HISTORY_MAX_MESSAGES', '200'))
+CHAT_HISTORY_MAX_TOKENS = int(os.getenv('CHAT_HISTORY_MAX_TOKENS', '32000'))
+CHAT_SESSION_SHARDS = int(os.getenv('CHAT_SESSION_SHARDS', '16'))  # Lock stripes in ChatSessionManager
+
+# Shared chat history store: 'memory' (default, per process), 'database' (ChatMessage model), 'sqlite' or 'redis'
+CHAT_SESSION_STORE = os.getenv('CHAT_SESSION_STORE', 'memory')
+CHAT_SESSION_SQLITE_PATH = os.getenv('CHAT_SESSION_SQLITE_PATH', os.path.join(BASE_DIR, 'chat_sessions.sqlite3'))
+CHAT_SESSION_REDIS_URL = os.getenv('CHAT_SESSION_REDIS_URL', 'redis://localhost:6379/0')
+CHAT_SESSION_WRITE_BATCH = int(os.getenv('CHAT_SESSION_WRITE_BATCH', '100'))  # Messages per batched write
+CHAT_SESSION_WRITE_INTERVAL = float(os.getenv('CHAT_SESSION_WRITE_INTERVAL', '0.05'))  # Max seconds a write is buffered
+CHAT_SESSION_CACHE_SIZE = int(os.getenv('CHAT_SESSION_CACHE_SIZE', '10000'))  # Sessions cached per worker
+CHAT_SESSION_CACHE_TTL = float(os.getenv('CHAT_SESSION_CACHE_TTL', '1.0'))  # Seconds before re-reading the store
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', '20'))  # Messages per page on the chat page
+CHAT_MESSAGE_RETENTION_DAYS = int(os.getenv('CHAT_MESSAGE_RETENTION_DAYS', '0'))  # Stored history clean_sessions keeps; 0 keeps all
+
+# Sentiment results reused while a conversation is unchanged
+SENTIMENT_CACHE_SIZE = int(os.getenv('SENTIMENT_CACHE_SIZE', '1000'))  # Sessions kept, least recently used evicted first
+SENTIMENT_CACHE_TTL = float(os.getenv('SENTIMENT_CACHE_TTL', '600'))  # Seconds a result stays usable
+
+# Incremental sentiment: send only the turns since the last analysis plus a rolling summary
+SENTIMENT_INCREMENTAL = str2bool(os.environ.get('SENTIMENT_INCREMENTAL', 'true'))
+SENTIMENT_DELTA_MAX_MESSAGES = int(os.getenv('SENTIMENT_DELTA_MAX_MESSAGES', '20'))  # Cap on new turns per analysis
+SENTIMENT_STATE_MEMORY = int(os.getenv('SENTIMENT_STATE_MEMORY', '10'))  # Messages of weight the running score keeps
+SENTIMENT_SUMMARY_MAX_CHARS = int(os.getenv('SENTIMENT_SUMMARY_MAX_CHARS', '500'))
+
+# Staff screening scores every live session, several transcripts per LLM request
+SENTIMENT_BATCH_SIZE = int(os.getenv('SENTIMENT_BATCH_SIZE', '20'))
+SCREENING_MAX_SESSIONS = int(os.getenv('SCREENING_MAX_SESSIONS', '100'))
+
+# Background sentiment worker fed by chat messages; screening views then never wait on the LLM
+SENTIMENT_WORKER = str2bool(os.environ.get('SENTIMENT_WORKER')) or False
+SENTIMENT_WORKER_DEBOUNCE = float(os.getenv('SENTIMENT_WORKER_DEBOUNCE', '5'))  # Quiet seconds before scoring
+SENTIMENT_WORKER_MAX_DELAY = float(os.getenv('SENTIMENT_WORKER_MAX_DELAY', '30'))  # Longest a change waits
+SENTIMENT_WORKER_QUEUE_SIZE = int(os.getenv('SENTIMENT_WORKER_QUEUE_SIZE', '1000'))  # Sessions waiting at most
+SENTIMENT_WORKER_MAX_RETRIES = int(os.getenv('SENTIMENT_WORKER_MAX_RETRIES', '3'))  # Backed-off retries per failed session
+
+# Local lexicon pre-scorer: clear-cut chats skip the LLM; high-risk terms always escalate
+SENTIMENT_PRESCORE = str2bool(os.environ.get('SENTIMENT_PRESCORE', 'true'))
+SENTIMENT_PRESCORE_CONFIDENCE = float(os.getenv('SENTIMENT_PRESCORE_CONFIDENCE', '0.7'))
+
+# Screening page updates pushed over Server-Sent Events (with SENTIMENT_WORKER) instead of polling
+SCREENING_STREAM_HEARTBEAT = float(os.getenv('SCREENING_STREAM_HEARTBEAT', '15'))  # Seconds between keep-alives
+SCREENING_STREAM_RETRY_MS = int(os.getenv('SCREENING_STREAM_RETRY_MS', '30000'))  # Browser reconnect delay of WSGI polls
+
+# Chat prompt compaction: recent turns verbatim, older ones folded into a rolling summary
+CHAT_CONTEXT_COMPACTION = str2bool(os.environ.get('CHAT_CONTEXT_COMPACTION', 'true'))
+CHAT_CONTEXT_KEEP_TURNS = int(os.getenv('CHAT_CONTEXT_KEEP_TURNS', '6'))  # Turns always sent verbatim
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv('CHAT_CONTEXT_TOKEN_BUDGET', '4000'))  # Estimated tokens of history per prompt
+CHAT_CONTEXT_SUMMARY_BATCH = int(os.getenv('CHAT_CONTEXT_SUMMARY_BATCH', '6'))  # Uncovered messages before re-summarizing
+
+# Opt-in cache of replies to common first messages ("hi", "I feel anxious")
+CHAT_RESPONSE_CACHE = str2bool(os.environ.get('CHAT_RESPONSE_CACHE')) or False
+CHAT_RESPONSE_CACHE_SIZE = int(os.getenv('CHAT_RESPONSE_CACHE_SIZE', '500'))  # Distinct opening messages kept
+CHAT_RESPONSE_CACHE_TTL = float(os.getenv('CHAT_RESPONSE_CACHE_TTL', '3600'))  # Seconds before replies are regenerated
+CHAT_RESPONSE_CACHE_VARIANTS = int(os.getenv('CHAT_RESPONSE_CACHE_VARIANTS', '3'))  # Replies served at random per message
+
+# LLM scheduler: caps concurrent model calls and tokens per minute, chat ahead of background work;
+# when a chat turn cannot start within LLM_QUEUE_TIMEOUT the view answers 429 with Retry-After
+LLM_SCHEDULER = str2bool(os.environ.get('LLM_SCHEDULER', 'true'))
+LLM_MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', '16'))
+LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', '0'))  # 0 disables the token budget
+LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', '100'))  # Waiting calls beyond this are rejected at once
+LLM_BACKGROUND_SHARE = float(os.getenv('LLM_BACKGROUND_SHARE', '0.75'))  # Slots sentiment and summaries may use
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', '10'))
+LLM_BACKGROUND_QUEUE_TIMEOUT = float(os.getenv('LLM_BACKGROUND_QUEUE_TIMEOUT', '60'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))  # Quota and transient errors only
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '0.5'))
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '8'))
+
+# Circuit breaker around model calls: opens on a high failure or slow-call rate, then chat answers
+# a degraded reply at once; its state is reported by /health/
+LLM_BREAKER = str2bool(os.environ.get('LLM_BREAKER', 'true'))
+LLM_BREAKER_WINDOW = int(os.getenv('LLM_BREAKER_WINDOW', '20'))  # Recent calls judged
+LLM_BREAKER_MIN_CALLS = int(os.getenv('LLM_BREAKER_MIN_CALLS', '10'))
+LLM_BREAKER_FAILURE_RATE = float(os.getenv('LLM_BREAKER_FAILURE_RATE', '0.5'))
+LLM_BREAKER_SLOW_SECONDS = float(os.getenv('LLM_BREAKER_SLOW_SECONDS', '15'))  # Slower calls (or first tokens) count as slow
+LLM_BREAKER_SLOW_RATE = float(os.getenv('LLM_BREAKER_SLOW_RATE', '0.5'))
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv('LLM_BREAKER_OPEN_SECONDS', '30'))  # Before a half-open probe
+LLM_REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', '30'))  # Per Gemini request
+
+# Admin sidebar: per-user permission masks cached until a user, group or permission changes
+ADMIN_MENU_CACHE = str2bool(os.environ.get('ADMIN_MENU_CACHE', 'true'))
+ADMIN_MENU_CACHE_TTL = int(os.getenv('ADMIN_MENU_CACHE_TTL', '300'))  # Bounds staleness with a per-process cache
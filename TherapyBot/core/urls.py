@@ -17,7 +17,8 @@ from django.contrib import admin
 from django.urls import include, path
 
 urlpatterns = [
+    # admin_soft goes first so its chat index (with history) isn't shadowed by home's bare one
+    path("", include('admin_soft.urls')),
     path('', include('home.urls')),
     path("admin/", admin.site.urls),
-    path("", include('admin_soft.urls'))
 ]